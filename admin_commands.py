@@ -0,0 +1,96 @@
+import asyncio
+import threading
+from discord.ext import commands
+from logger import logger
+from metrics import metrics
+from profiler import SamplingProfiler, format_summary
+
+
+def _format_value(value):
+    if isinstance(value, dict):
+        # Istogramma: latenze in millisecondi
+        if not value['count']:
+            return "count=0"
+        return (f"count={value['count']} avg={value['avg'] * 1000:.3f}ms "
+                f"p50<={value['p50'] * 1000:.3f}ms p99<={value['p99'] * 1000:.3f}ms")
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    return str(value)
+
+
+class AdminCommands(commands.Cog):
+    """Comandi di diagnostica riservati agli amministratori."""
+
+    def __init__(self, bot, db_manager):
+        self.bot = bot
+        self.db_manager = db_manager
+        # Sessione di profiling in corso (una sola alla volta)
+        self.profiler = None
+
+    async def is_admin(self, ctx):
+        user = await self.db_manager.get_user_by_discord_id(ctx.author.id)
+        return user and user.admin
+
+    @commands.command(name="metrics", description="Mostra le metriche del bot")
+    async def metrics(self, ctx, prefix: str = ""):
+        if not await self.is_admin(ctx):
+            await ctx.send("Non hai i permessi per eseguire questo comando.")
+            return
+
+        logger.info("Metrics requested by %s (prefix %r)", ctx.author.name, prefix)
+        lines = []
+        for name, values in sorted(metrics.snapshot().items()):
+            if not name.startswith(prefix):
+                continue
+            for labels, value in sorted(values.items()):
+                lines.append(f"{name}{labels} {_format_value(value)}\n")
+
+        if not lines:
+            await ctx.send("Nessuna metrica disponibile.")
+            return
+
+        # Messaggi a blocchi per restare sotto il limite di Discord
+        text = ""
+        for line in lines:
+            if len(text) + len(line) > 1900:
+                await ctx.send(f"```{text}```")
+                text = ""
+            text += line[:1900]
+        await ctx.send(f"```{text}```")
+
+    @commands.command(name="profile", description="Profiling a campionamento dell'event loop: start [secondi] | stop")
+    async def profile(self, ctx, action: str = "status", seconds: float = None):
+        if not await self.is_admin(ctx):
+            await ctx.send("Non hai i permessi per eseguire questo comando.")
+            return
+
+        if action == "start":
+            if self.profiler is not None:
+                await ctx.send("Un profiling è già in corso: usa `!profile stop`.")
+                return
+            # Il comando gira sul thread dell'event loop: è quello da campionare
+            self.profiler = SamplingProfiler(threading.get_ident(), max_seconds=seconds)
+            self.profiler.start()
+            logger.info("Profiling started by %s", ctx.author.name)
+            asyncio.get_running_loop().create_task(self._report_profile(ctx, self.profiler))
+            await ctx.send(f"Profiling avviato per al massimo {self.profiler.max_seconds:.0f}s.")
+        elif action == "stop":
+            if self.profiler is None:
+                await ctx.send("Nessun profiling in corso.")
+                return
+            # Il riepilogo viene inviato da _report_profile quando il campionamento termina
+            self.profiler.stop()
+        elif self.profiler is not None:
+            await ctx.send(f"Profiling in corso: {self.profiler.samples} campioni.")
+        else:
+            await ctx.send("Nessun profiling in corso. Uso: `!profile start [secondi]` e `!profile stop`.")
+
+    async def _report_profile(self, ctx, profiler):
+        try:
+            # finish attende la fine della finestra e scrive il file: fuori dall'event loop
+            summary = await asyncio.get_running_loop().run_in_executor(None, profiler.finish)
+        finally:
+            self.profiler = None
+        text = format_summary(summary)
+        for start in range(0, len(text), 1900):
+            await ctx.send(f"```{text[start:start + 1900]}```")
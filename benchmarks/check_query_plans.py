@@ -0,0 +1,41 @@
+"""Controllo di regressione sui query plan dei percorsi caldi di DatabaseManager.
+
+Crea lo schema in un database temporaneo, esegue EXPLAIN QUERY PLAN su ogni query
+di database_manager.INDEXED_QUERIES e termina con codice 1 se una di esse fa una
+full scan di tabella. Uso:
+
+    python -m benchmarks.check_query_plans
+"""
+import sqlite3
+import sys
+from database_manager import INDEXED_QUERIES
+from migrations import migrate
+
+
+def full_scans(conn):
+    failures = {}
+    for name, sql in INDEXED_QUERIES.items():
+        params = (1,) * sql.count('?')
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+        scans = [step for step in plan if step.startswith('SCAN')]
+        if scans:
+            failures[name] = plan
+    return failures
+
+
+def main():
+    conn = sqlite3.connect(':memory:')
+    migrate(conn)
+    failures = full_scans(conn)
+    for name, plan in failures.items():
+        print(f"FULL SCAN in {name}:")
+        for step in plan:
+            print(f"    {step}")
+    if failures:
+        return 1
+    print(f"{len(INDEXED_QUERIES)} queries use indexes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
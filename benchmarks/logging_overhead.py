@@ -0,0 +1,112 @@
+"""Costo per evento del logging nella StateMachine, a livello INFO e DEBUG.
+
+Fa girare la stessa simulazione di benchmarks.state_machine_sim con il logger
+disattivato (riferimento) e poi a INFO e a DEBUG, scrivendo su un file temporaneo sia
+direttamente (sync, come il vecchio FileHandler) sia attraverso LazyQueueHandler e
+QueueListener (async, la configurazione di logger.py). Riporta i microsecondi per evento
+in più rispetto al riferimento, i record scritti e, per l'async, il tempo impiegato dal
+listener a svuotare la coda a fine run. Uso:
+
+    python -m benchmarks.logging_overhead --users 500 --days 1
+"""
+import argparse
+import asyncio
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import tempfile
+import time
+from datetime import date
+
+from config import Config
+from logger import LazyQueueHandler, formatter, logger, stop_logging
+from benchmarks.state_machine_sim import simulate
+
+LEVELS = ("INFO", "DEBUG")
+MODES = ("sync", "async")
+
+
+class CountingFilter(logging.Filter):
+    def __init__(self):
+        super().__init__()
+        self.records = 0
+
+    def filter(self, record):
+        self.records += 1
+        return True
+
+
+def configure(mode, path):
+    """Sostituisce gli handler del logger con un solo file, diretto o tramite coda."""
+    logger.handlers.clear()
+    handler = logging.FileHandler(path, encoding="utf-8")
+    handler.setFormatter(formatter)
+    counter = CountingFilter()
+    handler.addFilter(counter)
+    listener = None
+    if mode == "async":
+        log_queue = queue.SimpleQueue()
+        logger.addHandler(LazyQueueHandler(log_queue))
+        listener = logging.handlers.QueueListener(log_queue, handler)
+        listener.start()
+    else:
+        logger.addHandler(handler)
+    return handler, counter, listener
+
+
+def measure(args, level, mode, path):
+    handler, counter, listener = configure(mode, path)
+    logger.setLevel(level)
+    stats = asyncio.run(simulate(args))
+    drained = time.perf_counter()
+    if listener is not None:
+        listener.stop()
+    drain_seconds = time.perf_counter() - drained
+    logger.removeHandler(handler)
+    handler.close()
+    return stats, counter.records, drain_seconds
+
+
+def run(args):
+    # Il logger di logger.py non deve scrivere su console durante le misure
+    stop_logging()
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.log")
+        baseline, _, _ = measure(args, logging.CRITICAL + 1, "sync", path)
+        base_us = baseline.run_seconds * 1e6 / baseline.events
+        results["baseline_us_per_event"] = round(base_us, 2)
+        for level in LEVELS:
+            for mode in MODES:
+                stats, records, drain_seconds = measure(args, level, mode, path)
+                us_per_event = stats.run_seconds * 1e6 / stats.events
+                results[f"{level.lower()}_{mode}"] = {
+                    "us_per_event": round(us_per_event, 2),
+                    "overhead_us_per_event": round(us_per_event - base_us, 2),
+                    "records": records,
+                    "records_per_event": round(records / stats.events, 3),
+                    "drain_seconds": round(drain_seconds, 3),
+                }
+    return {
+        "users": args.users,
+        "days": args.days,
+        "events": baseline.events,
+        **results,
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--days", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    # Stessi parametri di default di benchmarks.state_machine_sim
+    args.start, args.step, args.resync, args.batch = date(2024, 1, 8), 1, Config.RECONCILE_INTERVAL, False
+    print(json.dumps(run(args), indent=2))
+
+
+if __name__ == "__main__":
+    main_cli()
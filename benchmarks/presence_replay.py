@@ -0,0 +1,262 @@
+"""Replay di eventi di presenza attraverso gli handler reali, senza Discord.
+
+Una guild finta con N membri riceve eventi sintetici (ondata di login mattutina, tempesta
+di idle in pausa pranzo) o registrati in un file JSONL, inviati a main.on_presence_update
+con WorkTracker e DatabaseManager reali su un file SQLite temporaneo. Riporta eventi al
+secondo, latenza p50/p99 dall'evento alla fine della sincronizzazione, query per evento,
+picco di RSS e, dal watchdog dell'event loop, ritardo massimo e blocchi per sorgente.
+Con --max-blocks il comando esce con errore se i blocchi superano il limite, così una
+regressione che blocca il loop fa fallire il replay. Uso:
+
+    python -m benchmarks.presence_replay --scenario login_surge --users 500
+    python -m benchmarks.presence_replay --scenario lunch_storm --speed 60 --record eventi.jsonl
+    python -m benchmarks.presence_replay --replay eventi.jsonl --rate 200
+    python -m benchmarks.presence_replay --block-threshold 50 --max-blocks 0
+
+Valori di riferimento (500 utenti, SQLite su file temporaneo, Python 3.11):
+
+    scenario                     eventi  sync  ev/s   p50 ms  p99 ms  query/ev  lag max ms
+    login_surge --debounce 0        500   500  3153     14.6    37.2      5.00       0.1
+    login_surge                     500   500   229   2151.2  2168.3      5.00      44.1
+    lunch_storm --debounce 0       3500  2793  7985      1.0    24.9      1.72       3.2
+    lunch_storm --speed 60         3500   790   477   2083.1  4019.0      3.53      26.2
+
+Con il debounce predefinito (2s) la latenza include la quiete e gli eventi/s sono
+limitati dall'attesa finale; nessun blocco oltre i 100ms in tutti i casi.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+import main
+from config import Config
+from database_manager import DatabaseManager
+from loop_monitor import LoopWatchdog
+from metrics import metrics
+from work_tracker import WorkTracker
+
+DISCORD_ID_BASE = 100_000
+
+
+class FakeMember:
+    def __init__(self, member_id, status="offline"):
+        self.id = member_id
+        self.status = status
+
+
+class FakeGuild:
+    def __init__(self, guild_id, members):
+        self.id = guild_id
+        self.name = "replay"
+        self.members = {member.id: member for member in members}
+
+    def get_member(self, member_id):
+        return self.members.get(member_id)
+
+
+class FakeBot:
+    def __init__(self, guild):
+        self.guild = guild
+        self.loop = asyncio.get_running_loop()
+
+    def get_guild(self, guild_id):
+        return self.guild
+
+
+class ReplayTracker(WorkTracker):
+    """WorkTracker che misura la latenza tra l'invio dell'evento e la fine della sincronizzazione."""
+
+    def __init__(self, bot, db_manager):
+        super().__init__(bot, db_manager)
+        self.dispatched = {}
+        self.latencies = []
+
+    async def handle_presence_update(self, user):
+        try:
+            await super().handle_presence_update(user)
+        finally:
+            started = self.dispatched.pop(str(user.discord_id), None)
+            if started is not None:
+                self.latencies.append(time.perf_counter() - started)
+
+
+# Scenari sintetici: liste di (offset in secondi, indice utente, stato)
+
+def login_surge(users, window, rng):
+    """Tutti gli utenti passano da offline a online entro window secondi."""
+    return sorted((rng.uniform(0, window), index, "online") for index in range(users))
+
+
+def lunch_storm(users, window, rng, flaps=3):
+    """Gli utenti, già online, oscillano tra idle e online durante la pausa pranzo."""
+    events = [(0.0, index, "online") for index in range(users)]
+    for index in range(users):
+        offset = rng.uniform(0, window / 2)
+        for _ in range(flaps):
+            events.append((offset, index, "idle"))
+            offset += rng.uniform(0.5, 5)
+            events.append((offset, index, "online"))
+            offset += rng.uniform(0.5, 5)
+    return sorted(events)
+
+
+SCENARIOS = {
+    "login_surge": login_surge,
+    "lunch_storm": lunch_storm,
+}
+
+
+def load_events(path):
+    with open(path, "r", encoding="utf-8") as file:
+        return [(event["t"], event["user"], event["status"]) for event in map(json.loads, file) if event]
+
+
+def save_events(path, events):
+    with open(path, "w", encoding="utf-8") as file:
+        for offset, index, status in events:
+            file.write(json.dumps({"t": round(offset, 3), "user": index, "status": status}) + "\n")
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+async def setup(db_path, users):
+    db_manager = DatabaseManager(db_path)
+    for index in range(users):
+        await db_manager.add_user(
+            f"user{index}", str(DISCORD_ID_BASE + index), f"User {index}", "Replay",
+            f"user{index}@example.com", False, "dev", f"dept{index % 10}", False
+        )
+    guild = FakeGuild(0, [FakeMember(DISCORD_ID_BASE + index) for index in range(users)])
+    bot = FakeBot(guild)
+    tracker = ReplayTracker(bot, db_manager)
+    await tracker.load_users()
+    tracker.guild = guild
+
+    # Gli handler di main usano i suoi globali: li sostituiamo con le componenti del replay
+    main.bot = bot
+    main.db_manager = db_manager
+    main.work_tracker = tracker
+    return guild, tracker, db_manager
+
+
+async def replay(events, guild, tracker, rate, speed):
+    """Invia gli eventi in ordine.
+
+    Con speed > 0 rispetta gli offset degli eventi accelerati di speed volte; altrimenti,
+    con rate > 0, ne invia al massimo rate al secondo, e senza nessuno dei due il più
+    veloce possibile.
+    """
+    interval = 1 / rate if rate > 0 else 0
+    started = time.perf_counter()
+    for sent, (offset, index, status) in enumerate(events):
+        if speed > 0:
+            delay = started + offset / speed - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        member = guild.members[DISCORD_ID_BASE + index]
+        before = FakeMember(member.id, member.status)
+        member.status = status
+        tracker.dispatched.setdefault(str(member.id), time.perf_counter())
+        await main.on_presence_update(before, member)
+        if speed > 0:
+            continue
+        if interval:
+            delay = started + (sent + 1) * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        else:
+            # Lascia girare i task di sincronizzazione tra un evento e l'altro
+            await asyncio.sleep(0)
+
+    # Attende la quiete delle raffiche ancora in attesa e le sincronizzazioni in corso
+    await main.presence_debouncer.drain()
+    return time.perf_counter() - started
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    if args.replay:
+        events = load_events(args.replay)
+        users = max(index for _, index, _ in events) + 1
+    else:
+        users = args.users
+        events = SCENARIOS[args.scenario](users, args.window, rng)
+    if args.record:
+        save_events(args.record, events)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        guild, tracker, db_manager = await setup(os.path.join(tmp, "replay.db"), users)
+        main.presence_debouncer.quiet = args.debounce
+        queries_before = db_manager.query_count
+        watchdog = LoopWatchdog(threshold=args.block_threshold / 1000)
+        await watchdog.start()
+        try:
+            elapsed = await replay(events, guild, tracker, args.rate, args.speed)
+        finally:
+            watchdog.stop()
+        queries = db_manager.query_count - queries_before
+        tracker.idle_timers.stop()
+        main.presence_debouncer.stop()
+        db_manager.close()
+
+    handled = tracker.sync_stats["presence_events"]
+    latencies = tracker.latencies
+    lag_p99 = metrics.histogram('event_loop_lag_seconds').quantile(0.99)
+    return {
+        "scenario": args.replay or args.scenario,
+        "users": users,
+        "events_sent": len(events),
+        "events_handled": handled,
+        "events_coalesced": main.presence_debouncer.stats["coalesced"],
+        "seconds": round(elapsed, 3),
+        "events_per_sec": round(len(events) / elapsed, 1) if elapsed else None,
+        "latency_p50_ms": round(percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+        "latency_p99_ms": round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+        "queries_per_event": round(queries / handled, 2) if handled else None,
+        # ru_maxrss è in KiB su Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        # Stima per bucket: il limite superiore del bucket che contiene il p99
+        "loop_lag_p99_ms": round(lag_p99 * 1000, 3) if lag_p99 is not None else None,
+        "loop_lag_max_ms": round(watchdog.max_lag * 1000, 3),
+        "loop_blocks": sum(watchdog.block_counts.values()),
+        "loop_blocks_by_source": dict(watchdog.block_counts),
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="login_surge")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--window", type=float, default=600, help="Durata simulata dello scenario, in secondi")
+    parser.add_argument("--rate", type=float, default=0, help="Eventi al secondo (0 = il più veloce possibile)")
+    parser.add_argument("--speed", type=float, default=0,
+                        help="Rispetta gli offset degli eventi, accelerati di questo fattore (0 = ignora gli offset)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--replay", help="File JSONL di eventi da riprodurre")
+    parser.add_argument("--record", help="Salva gli eventi generati in un file JSONL")
+    parser.add_argument("--debounce", type=float, default=Config.PRESENCE_DEBOUNCE_SECONDS,
+                        help="Quiete del debounce in secondi: la latenza la include")
+    parser.add_argument("--block-threshold", type=float, default=100,
+                        help="Ritardo dell'event loop (ms) oltre il quale conta come blocco")
+    parser.add_argument("--max-blocks", type=int, default=None,
+                        help="Esce con errore se i blocchi dell'event loop superano questo numero")
+    args = parser.parse_args()
+    result = asyncio.run(run(args))
+    print(json.dumps(result, indent=2))
+    if args.max_blocks is not None and result["loop_blocks"] > args.max_blocks:
+        sys.exit(f"Event loop blocked {result['loop_blocks']} times (limit {args.max_blocks})")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,112 @@
+"""Throughput SQLite con letture e scritture concorrenti, rollback journal contro WAL.
+
+Un thread scrive eventi simili a log_break_start (un commit per scrittura) mentre
+altri thread eseguono letture simili a !status. Uso:
+
+    python -m benchmarks.sqlite_concurrency --seconds 5 --readers 4
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from db_connection import connect
+
+SETTINGS = [
+    ("baseline", "DELETE", "FULL"),
+    ("wal", "WAL", "NORMAL"),
+]
+
+
+def prepare(path, users, rows):
+    conn = connect(path, journal_mode="DELETE")
+    conn.execute("CREATE TABLE break_logs (id INTEGER PRIMARY KEY, user_id INTEGER, start_time TEXT NOT NULL, end_time TEXT, type TEXT)")
+    start = datetime(2024, 1, 1, 9, 0)
+    conn.executemany(
+        "INSERT INTO break_logs (user_id, start_time, end_time, type) VALUES (?, ?, ?, 'SHORT_BREAK')",
+        (
+            (i % users, (start + timedelta(minutes=i)).isoformat(), (start + timedelta(minutes=i + 10)).isoformat())
+            for i in range(rows)
+        ),
+    )
+    conn.commit()
+    conn.close()
+
+
+def run(path, journal_mode, synchronous, seconds, readers, users):
+    stop = threading.Event()
+    counts = {"writes": 0, "reads": 0, "busy": 0}
+    lock = threading.Lock()
+
+    def writer():
+        conn = connect(path, journal_mode=journal_mode, synchronous=synchronous)
+        while not stop.is_set():
+            try:
+                conn.execute(
+                    "INSERT INTO break_logs (user_id, start_time, type) VALUES (?, ?, 'SHORT_BREAK')",
+                    (random.randrange(users), datetime.now().isoformat()),
+                )
+                conn.commit()
+                with lock:
+                    counts["writes"] += 1
+            except Exception:
+                with lock:
+                    counts["busy"] += 1
+        conn.close()
+
+    def reader():
+        conn = connect(path, read_only=True, synchronous=synchronous)
+        while not stop.is_set():
+            try:
+                conn.execute(
+                    "SELECT COUNT(*), SUM(julianday(end_time) - julianday(start_time)) FROM break_logs WHERE user_id = ?",
+                    (random.randrange(users),),
+                ).fetchone()
+                with lock:
+                    counts["reads"] += 1
+            except Exception:
+                with lock:
+                    counts["busy"] += 1
+        conn.close()
+
+    # Imposta il journal mode prima che partano i lettori in sola lettura
+    connect(path, journal_mode=journal_mode, synchronous=synchronous).close()
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    return {
+        "writes_per_sec": counts["writes"] / seconds,
+        "reads_per_sec": counts["reads"] / seconds,
+        "busy_errors": counts["busy"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--rows", type=int, default=200_000)
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, journal_mode, synchronous in SETTINGS:
+            path = os.path.join(tmp, f"{name}.db")
+            prepare(path, args.users, args.rows)
+            results[name] = run(path, journal_mode, synchronous, args.seconds, args.readers, args.users)
+            results[name].update(journal_mode=journal_mode, synchronous=synchronous)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
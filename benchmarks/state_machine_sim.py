@@ -0,0 +1,87 @@
+"""Micro-benchmark della StateMachine su giornate lavorative simulate.
+
+Migliaia di utenti attraversano giornate intere con un orologio virtuale (vedi
+state_machine.simulator): riporta eventi e transizioni al secondo, valutazioni di
+condizioni per transizione e, con --allocations, un secondo run identico misurato con
+tracemalloc per le allocazioni per evento. Con --batch la riconciliazione periodica passa
+da ConditionBatch (state_machine.batch) e rinvia lo stato solo agli utenti con condizioni
+cambiate. Il JSON in uscita, a parità di seed, ha gli stessi conteggi a ogni esecuzione
+e si può confrontare tra release. Uso:
+
+    python -m benchmarks.state_machine_sim --users 2000 --days 5
+    python -m benchmarks.state_machine_sim --users 500 --allocations --output risultati.json
+    python -m benchmarks.state_machine_sim --users 10000 --days 1 --batch
+"""
+import argparse
+import asyncio
+import json
+import logging
+import platform
+from datetime import date, timedelta
+
+from config import Config
+from database import Database
+from logger import logger
+from state_machine import StateMachine
+from state_machine.simulator import DaySimulator, make_users
+
+
+async def simulate(args, trace_allocations=False):
+    # Le condizioni non interrogano il database nelle transizioni configurate:
+    # un database in memoria evita di aprire il file di produzione
+    state_machine = StateMachine(db=Database(':memory:'))
+    simulator = DaySimulator(
+        state_machine, make_users(args.users), seed=args.seed, start_date=args.start,
+        step=timedelta(minutes=args.step), resync=args.resync, batch=args.batch,
+        trace_allocations=trace_allocations,
+    )
+    try:
+        return await simulator.run(args.days)
+    finally:
+        await state_machine.close()
+
+
+def run(args):
+    logger.setLevel(args.log_level)
+    stats = asyncio.run(simulate(args)).to_dict()
+    if args.allocations:
+        traced = asyncio.run(simulate(args, trace_allocations=True)).to_dict()
+        stats.update({key: traced[key] for key in traced if key.startswith(('alloc_', 'retained_'))})
+    return {
+        "users": args.users,
+        "start": args.start.isoformat(),
+        "seed": args.seed,
+        "step_minutes": args.step,
+        "resync_minutes": args.resync,
+        "batch": args.batch,
+        "log_level": args.log_level,
+        "python": platform.python_version(),
+        **stats,
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=5)
+    parser.add_argument("--start", type=date.fromisoformat, default=date(2024, 1, 8),
+                        help="Primo giorno simulato (YYYY-MM-DD)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--step", type=float, default=1, help="Passo dell'orologio virtuale, in minuti")
+    parser.add_argument("--resync", type=int, default=Config.RECONCILE_INTERVAL,
+                        help="Minuti tra due reinvii dello stato corrente (0 = solo i cambi di stato)")
+    parser.add_argument("--batch", action="store_true", help="Riconciliazione periodica con ConditionBatch")
+    parser.add_argument("--allocations", action="store_true", help="Misura anche le allocazioni con tracemalloc")
+    parser.add_argument("--log-level", default="WARNING", choices=sorted(logging._nameToLevel))
+    parser.add_argument("--output", help="Scrive il JSON anche in questo file")
+    args = parser.parse_args()
+
+    result = json.dumps(run(args), indent=2)
+    print(result)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(result + "\n")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,117 @@
+"""Memoria per voce e costo del tick della timer wheel con migliaia di buffer IDLE in attesa.
+
+Programma N chiavi con scadenze distribuite sul buffer IDLE (Config.IDLE_BUFFER_TIME),
+con tick e slot di Config, e misura con tracemalloc i byte allocati per voce: con più
+taglie il valore deve restare costante. Come riferimento misura lo stesso numero di
+coroutine in sleep, una per utente, cioè lo schema sostituito dalla ruota. Il costo del
+tick è il tempo di advance() (più i callback delle voci scadute) su un giro completo della
+ruota, partendo con tutte le voci in attesa. Uso:
+
+    python -m benchmarks.timer_wheel_load --keys 1000 10000 50000
+"""
+import argparse
+import asyncio
+import gc
+import json
+import random
+import tracemalloc
+from time import perf_counter
+
+from config import Config
+from timer_wheel import TimerWheel
+
+
+def _noop(user):
+    pass
+
+
+def _allocated(build):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before, kept
+
+
+async def measure(keys, seed):
+    rng = random.Random(seed)
+    horizon = Config.IDLE_BUFFER_TIME * 60
+    delays = [rng.uniform(Config.IDLE_TIMER_TICK, horizon) for _ in range(keys)]
+    # Le chiavi (discord_id) e l'utente esistono comunque: non entrano nel costo della voce
+    ids = [str(10 ** 17 + index) for index in range(keys)]
+    user = object()
+    wheel = None
+
+    def schedule_all():
+        nonlocal wheel
+        wheel = TimerWheel(tick=Config.IDLE_TIMER_TICK, slots=Config.IDLE_TIMER_SLOTS)
+        for key, delay in zip(ids, delays):
+            wheel.schedule(key, delay, _noop, user)
+        return wheel
+
+    # Tempo di schedule senza tracemalloc, poi memoria su una ruota nuova
+    started = perf_counter()
+    schedule_all().stop()
+    schedule_us = (perf_counter() - started) / keys * 1e6
+    wheel_bytes, _ = _allocated(schedule_all)
+
+    # Un giro completo della ruota: le voci con scadenza entro il giro scadono e il tick
+    # comprende i loro callback, le altre scalano solo rounds
+    tick_times, fired = [], 0
+    for _ in range(len(wheel.slots)):
+        tick_started = perf_counter()
+        expired = wheel.advance()
+        for timer in expired:
+            timer.callback(*timer.args)
+        tick_times.append(perf_counter() - tick_started)
+        fired += len(expired)
+    tick_times.sort()
+    pending = len(wheel)
+    wheel.stop()
+
+    async def sleeper(delay):
+        await asyncio.sleep(delay)
+
+    def start_sleepers():
+        loop = asyncio.get_running_loop()
+        return [loop.create_task(sleeper(delay)) for delay in delays]
+
+    sleeping_bytes, tasks = _allocated(start_sleepers)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    return {
+        "keys": keys,
+        "wheel_bytes_per_entry": round(wheel_bytes / keys, 1),
+        "sleeping_task_bytes_per_entry": round(sleeping_bytes / keys, 1),
+        "schedule_us_per_entry": round(schedule_us, 2),
+        "tick_p50_us": round(tick_times[len(tick_times) // 2] * 1e6, 1),
+        "tick_max_us": round(tick_times[-1] * 1e6, 1),
+        "ticks": len(tick_times),
+        "fired_in_one_revolution": fired,
+        "pending_after_revolution": pending,
+    }
+
+
+async def run(sizes, seed):
+    return [await measure(keys, seed) for keys in sizes]
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--keys", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    print(json.dumps({
+        "tick_seconds": Config.IDLE_TIMER_TICK,
+        "slots": Config.IDLE_TIMER_SLOTS,
+        "results": asyncio.run(run(args.keys, args.seed)),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -28,18 +28,54 @@ class Config:
     
     # Buffer per lo stato IDLE
     IDLE_BUFFER_TIME = 5  # Tempo aggiuntivo da attendere quando l'utente passa a IDLE (in minuti)
+    IDLE_TIMER_TICK = 1  # Risoluzione della timer wheel per i buffer IDLE (in secondi)
+    IDLE_TIMER_SLOTS = 512  # Numero di slot della timer wheel
+
+    # Debounce degli eventi di presenza: quiete prima della sincronizzazione e attesa massima
+    # dal primo evento di una raffica (in secondi), utenti in attesa al massimo, risoluzione
+    PRESENCE_DEBOUNCE_SECONDS = float(os.getenv('PRESENCE_DEBOUNCE_SECONDS', '2'))
+    PRESENCE_DEBOUNCE_MAX_WAIT = float(os.getenv('PRESENCE_DEBOUNCE_MAX_WAIT', '30'))
+    PRESENCE_DEBOUNCE_MAX_PENDING = int(os.getenv('PRESENCE_DEBOUNCE_MAX_PENDING', '10000'))
+    PRESENCE_DEBOUNCE_TICK = 0.25
     
     # Altre configurazioni
     DISCORD_IDLE_TIME = 10  # Tempo dopo il quale Discord cambia lo stato in idle (in minuti)
 
+    # Intervallo della riconciliazione completa degli stati (in minuti)
+    RECONCILE_INTERVAL = int(os.getenv('RECONCILE_INTERVAL', '15'))
+
+    # Journal delle transizioni e snapshot dello stato runtime (in modalità partizionata un file per
+    # worker); intervallo tra gli snapshot in minuti
+    JOURNAL_DIR = os.getenv('JOURNAL_DIR', 'journal')
+    SNAPSHOT_INTERVAL = int(os.getenv('SNAPSHOT_INTERVAL', '5'))
+
     # Nuove configurazioni per straordinari e giorni festivi
     REGULAR_WORK_HOURS = 8  # Ore di lavoro regolari in un giorno
     MAX_WORK_HOURS = 12  # Massimo numero di ore di lavoro consentite in un giorno
     OVERTIME_THRESHOLD = 40  # Ore settimanali dopo le quali inizia lo straordinario
     HOLIDAY_WORK_MULTIPLIER = 1.5  # Moltiplicatore per il lavoro nei giorni festivi
 
-    # Livello di log
-    LOG_LEVEL = os.getenv('LOG_LEVEL', 'DEBUG').upper()
+    # Database: group commit del writer e pool di connessioni in lettura
+    DB_COMMIT_BATCH_SIZE = int(os.getenv('DB_COMMIT_BATCH_SIZE', '64'))  # Operazioni massime per commit
+    DB_COMMIT_INTERVAL_MS = int(os.getenv('DB_COMMIT_INTERVAL_MS', '5'))  # Attesa massima prima del commit
+    DB_READ_POOL_SIZE = int(os.getenv('DB_READ_POOL_SIZE', '4'))
+    REPORT_PAGE_SIZE = int(os.getenv('REPORT_PAGE_SIZE', '200'))  # Righe per pagina nei report
+
+    # Pragma SQLite applicati da db_connection.connect
+    SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))  # In byte
+    SQLITE_CACHE_SIZE = int(os.getenv('SQLITE_CACHE_SIZE', '-65536'))  # Negativo: KiB, positivo: pagine
+    SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000'))  # In millisecondi
+
+    # Log: livello, scrittura asincrona in un thread dedicato e rotazione del file
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+    LOG_FILE = os.getenv('LOG_FILE', 'logs/work_tracker.log')
+    LOG_ASYNC = os.getenv('LOG_ASYNC', 'True').lower() == 'true'
+    LOG_ROTATION = os.getenv('LOG_ROTATION', 'size').lower()  # size, time o none
+    LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))  # Con rotazione size
+    LOG_ROTATE_WHEN = os.getenv('LOG_ROTATE_WHEN', 'midnight')  # Con rotazione time (vedi TimedRotatingFileHandler)
+    LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '7'))
 
     #DEBUG
     INTERACTIVE_MODE = False
@@ -48,13 +84,34 @@ class Config:
     SIMULATE_WORK_HOURS = os.getenv('SIMULATE_WORK_HOURS', 'False').lower() == 'true'
     SILENT_MODE = True
 
+    # Endpoint HTTP delle metriche (formato Prometheus); porta 0 per disattivarlo.
+    # In modalità partizionata il gateway usa METRICS_PORT e il worker i METRICS_PORT + 1 + i
+    METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+    METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+
+    # Profiler a campionamento (!profile): intervallo tra i campioni, durata massima, output
+    PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '5'))
+    PROFILE_MAX_SECONDS = float(os.getenv('PROFILE_MAX_SECONDS', '60'))
+    PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+    PROFILE_TOP_N = int(os.getenv('PROFILE_TOP_N', '15'))
+
+    # Watchdog dell'event loop: intervallo del heartbeat e soglia oltre la quale un ritardo
+    # è un blocco (viene catturato lo stack); soglia 0 per disattivarlo
+    LOOP_LAG_INTERVAL_MS = float(os.getenv('LOOP_LAG_INTERVAL_MS', '100'))
+    LOOP_BLOCK_THRESHOLD_MS = float(os.getenv('LOOP_BLOCK_THRESHOLD_MS', '250'))
+
+    # Macchina a stati: file di configurazione e intervallo di controllo delle modifiche (in secondi)
+    STATUS_MAPPING_FILE = 'status_mapping.yaml'
+    TRANSITIONS_FILE = 'state_machine/transitions.yaml'
+    STATE_MACHINE_RELOAD_INTERVAL = 5
+
     @staticmethod
     def get_logging_level():
-        return getattr(logging, Config.LOG_LEVEL, logging.DEBUG)
+        return getattr(logging, Config.LOG_LEVEL, logging.INFO)
 
     @staticmethod
     def load_status_mapping():
-        with open('status_mapping.yaml', 'r') as file:
+        with open(Config.STATUS_MAPPING_FILE, 'r') as file:
             mappings = yaml.safe_load(file)
         return mappings.get(Config.CLIENT, {})
 
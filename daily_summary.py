@@ -0,0 +1,175 @@
+"""Riepilogo giornaliero per utente (tabella daily_summary).
+
+Ogni riga (user_id, date) contiene primo ingresso e ultima uscita, ore totali, ore
+effettive, pause, eccedenza della pausa pranzo, bilancio del giorno e bilancio
+cumulativo, con le stesse regole di WorkTracker.handle_end_work. DatabaseManager
+aggiorna solo il giorno toccato da log_work_end, log_break_end e update_work_balance;
+rebuild ricalcola tutto dai log grezzi. Da riga di comando verifica e ricostruzione
+passano da DatabaseManager (verify_daily_summary e rebuild_daily_summary), quindi dal
+suo writer:
+
+    python daily_summary.py [--db work_tracker.db] [--verify-only]
+"""
+import argparse
+import asyncio
+from datetime import date, datetime, timedelta
+from config import Config
+
+NUMERIC_COLUMNS = ('total_hours', 'break_hours', 'lunch_excess_hours', 'effective_hours',
+                   'day_balance', 'cumulative_balance')
+COLUMNS = ('user_id', 'date', 'first_start', 'last_end') + NUMERIC_COLUMNS
+
+CREATE_TABLE = '''
+CREATE TABLE IF NOT EXISTS daily_summary (
+    user_id INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    first_start TEXT,
+    last_end TEXT,
+    total_hours REAL NOT NULL DEFAULT 0,
+    break_hours REAL NOT NULL DEFAULT 0,
+    lunch_excess_hours REAL NOT NULL DEFAULT 0,
+    effective_hours REAL NOT NULL DEFAULT 0,
+    day_balance REAL,
+    cumulative_balance REAL,
+    updated_at TEXT,
+    PRIMARY KEY (user_id, date),
+    FOREIGN KEY (user_id) REFERENCES users(id)
+) WITHOUT ROWID
+'''
+
+# Riepilogo calcolato dai log chiusi; {filter} restringe work_logs e break_logs (stessi
+# parametri per entrambe) a un utente o a un giorno, sfruttando gli indici su start_time.
+_SUMMARY_SELECT = '''
+WITH work AS (
+    SELECT user_id, date(start_time) AS day,
+           MIN(start_time) AS first_start,
+           MAX(end_time) AS last_end,
+           SUM((julianday(end_time) - julianday(start_time)) * 24) AS total_hours
+    FROM work_logs
+    WHERE end_time IS NOT NULL {filter}
+    GROUP BY user_id, day
+),
+balances AS (
+    SELECT user_id, day, work_balance, cumulative_balance FROM (
+        SELECT user_id, date(start_time) AS day, work_balance, cumulative_balance,
+               ROW_NUMBER() OVER (PARTITION BY user_id, date(start_time) ORDER BY start_time DESC, id DESC) AS position
+        FROM work_logs
+        WHERE work_balance IS NOT NULL {filter}
+    )
+    WHERE position = 1
+),
+breaks AS (
+    SELECT user_id, date(start_time) AS day,
+           SUM(CASE WHEN type = 'ON_BREAK_LUNCH' THEN 0 ELSE hours END) AS break_hours,
+           SUM(CASE WHEN type = 'ON_BREAK_LUNCH' THEN MAX(hours - :lunch_hours, 0) ELSE 0 END) AS lunch_excess_hours
+    FROM (
+        SELECT user_id, start_time, type, (julianday(end_time) - julianday(start_time)) * 24 AS hours
+        FROM break_logs
+        WHERE end_time IS NOT NULL {filter}
+    )
+    GROUP BY user_id, day
+),
+days AS (
+    SELECT user_id, day FROM work
+    UNION SELECT user_id, day FROM breaks
+    UNION SELECT user_id, day FROM balances
+)
+SELECT d.user_id, d.day,
+       w.first_start,
+       w.last_end,
+       COALESCE(w.total_hours, 0),
+       COALESCE(b.break_hours, 0),
+       COALESCE(b.lunch_excess_hours, 0),
+       COALESCE(w.total_hours, 0) - COALESCE(b.break_hours, 0) - COALESCE(b.lunch_excess_hours, 0),
+       bl.work_balance,
+       bl.cumulative_balance,
+       :now
+FROM days d
+LEFT JOIN work w ON w.user_id = d.user_id AND w.day = d.day
+LEFT JOIN breaks b ON b.user_id = d.user_id AND b.day = d.day
+LEFT JOIN balances bl ON bl.user_id = d.user_id AND bl.day = d.day
+'''
+
+_INSERT = f'''
+INSERT INTO {{table}} ({', '.join(COLUMNS)}, updated_at)
+'''
+
+
+def _params(**extra):
+    return {'lunch_hours': Config.MAX_LUNCH_DURATION / 60, 'now': datetime.now().isoformat(), **extra}
+
+
+def refresh_day(conn, user_id, day):
+    """Ricalcola la riga (user_id, day) dai log di quel giorno. Gira dentro la transazione del chiamante."""
+    if isinstance(day, datetime):
+        day = day.date()
+    elif isinstance(day, str):
+        day = date.fromisoformat(day[:10])
+    day_filter = 'AND user_id = :user_id AND start_time >= :start AND start_time < :end'
+    conn.execute('DELETE FROM daily_summary WHERE user_id = ? AND date = ?', (user_id, day.isoformat()))
+    conn.execute(
+        _INSERT.format(table='daily_summary') + _SUMMARY_SELECT.format(filter=day_filter),
+        _params(user_id=user_id, start=day.isoformat(), end=(day + timedelta(days=1)).isoformat())
+    )
+
+
+def rebuild(conn, table='daily_summary'):
+    """Svuota table e la ricostruisce interamente da work_logs e break_logs; restituisce le righe scritte."""
+    conn.execute(f'DELETE FROM {table}')
+    cursor = conn.execute(_INSERT.format(table=table) + _SUMMARY_SELECT.format(filter=''), _params())
+    return cursor.rowcount
+
+
+def verify(conn, tolerance=1e-6):
+    """Confronta daily_summary con un ricalcolo completo e restituisce le chiavi (user_id, date) diverse."""
+    conn.execute('CREATE TEMP TABLE daily_summary_check AS SELECT * FROM daily_summary WHERE 0')
+    rebuild(conn, 'temp.daily_summary_check')
+    differs = ' OR '.join(
+        [f"s.{column} IS NOT c.{column}" for column in ('first_start', 'last_end')] + [
+            f"(s.{column} IS NULL) != (c.{column} IS NULL) OR ABS(COALESCE(s.{column} - c.{column}, 0)) > :tolerance"
+            for column in NUMERIC_COLUMNS
+        ]
+    )
+    rows = conn.execute(f'''
+        SELECT COALESCE(s.user_id, c.user_id), COALESCE(s.date, c.date)
+        FROM daily_summary s
+        LEFT JOIN temp.daily_summary_check c ON c.user_id = s.user_id AND c.date = s.date
+        WHERE c.user_id IS NULL OR {differs}
+        UNION
+        SELECT c.user_id, c.date
+        FROM temp.daily_summary_check c
+        LEFT JOIN daily_summary s ON s.user_id = c.user_id AND s.date = c.date
+        WHERE s.user_id IS NULL
+        ORDER BY 1, 2
+    ''', {'tolerance': tolerance}).fetchall()
+    conn.execute('DROP TABLE temp.daily_summary_check')
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verifica e ricostruzione di daily_summary")
+    parser.add_argument('--db', default='work_tracker.db')
+    parser.add_argument('--verify-only', action='store_true')
+    args = parser.parse_args()
+
+    asyncio.run(_run(args.db, args.verify_only))
+
+
+async def _run(db_name, verify_only):
+    # Import locale: database_manager importa questo modulo
+    from database_manager import DatabaseManager
+    db_manager = DatabaseManager(db_name)
+    try:
+        mismatches = await db_manager.verify_daily_summary()
+        print(f"Righe di daily_summary diverse dai log: {len(mismatches)}")
+        for user_id, day in mismatches[:20]:
+            print(f"    user_id={user_id} date={day}")
+        if not verify_only:
+            rows = await db_manager.rebuild_daily_summary()
+            print(f"daily_summary ricostruita: {rows} righe")
+    finally:
+        db_manager.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,73 @@
 import sqlite3
 import asyncio
-from typing import Union, List, Dict, Any, Optional, Tuple
+import csv
+import json
+import time
+from collections import namedtuple
+from typing import Union, List, Dict, Any, Optional, Tuple, Iterable
 from models import User
+from db_connection import connect
+from migrations import migrate
+from leave_index import LEAVE_INDEX_QUERY, IndexedLeave, LeaveIndex
 from datetime import datetime
 
+USER_COLUMNS = ('id', 'jira_id', 'discord_id', 'full_name', 'name', 'surname', 'email',
+                'remote', 'role', 'dept', 'admin', 'state')
+LOWERCASE_COLUMNS = ('full_name', 'name', 'surname', 'email', 'role', 'dept')
+
+TransferStats = namedtuple('TransferStats', ['rows', 'seconds', 'rows_per_second'])
+
+
+def _transfer_stats(rows: int, started: float) -> TransferStats:
+    seconds = time.perf_counter() - started
+    return TransferStats(rows, seconds, rows / seconds if seconds > 0 else float('inf'))
+
+
+def _file_format(path: str, file_format: Optional[str]) -> str:
+    file_format = (file_format or path.rsplit('.', 1)[-1]).lower()
+    if file_format not in ('csv', 'jsonl'):
+        raise ValueError(f"Unsupported user file format: {file_format}")
+    return file_format
+
+
+def _parse_bool(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'y')
+    return bool(value)
+
+
+def _record_to_params(record: Dict[str, Any]) -> tuple:
+    # Riga di import (CSV o JSONL) -> parametri per INSERT OR REPLACE, con le stesse
+    # normalizzazioni di save_users
+    values = {column: record.get(column) for column in USER_COLUMNS}
+    for column in values:
+        if values[column] == '':
+            values[column] = None
+    for column in LOWERCASE_COLUMNS:
+        if values[column] is not None:
+            values[column] = str(values[column]).lower()
+    values['id'] = int(values['id']) if values['id'] is not None else None
+    values['remote'] = _parse_bool(values['remote'])
+    values['admin'] = _parse_bool(values['admin'])
+    values['state'] = values['state'] or 'OFFLINE'
+    return tuple(values[column] for column in USER_COLUMNS)
+
+
+def _state_value(state) -> str:
+    return state.value if hasattr(state, 'value') else state
+
 class Database:
     def __init__(self, db_name: str = 'worktracker.db'):
         self.db_name = db_name
         self.conn = None
         self.lock = asyncio.Lock()
+        # Permessi autorizzati in memoria, caricati alla prima interrogazione
+        self.leave_index = LeaveIndex()
 
     async def _get_connection(self):
         if self.conn is None:
-            self.conn = sqlite3.connect(self.db_name)
+            self.conn = connect(self.db_name)
+            migrate(self.conn)
         return self.conn
 
     async def _execute(self, query: str, params: tuple = ()):
@@ -22,6 +77,35 @@ class Database:
             cursor.execute(query, params)
             conn.commit()
             return cursor
+
+    async def _executemany(self, query: str, rows: Iterable[tuple]) -> int:
+        # Tutte le righe in un'unica transazione: un solo commit, rollback completo in caso di errore.
+        # rows può essere un generatore, che viene consumato senza materializzarlo.
+        async with self.lock:
+            conn = await self._get_connection()
+            try:
+                cursor = conn.executemany(query, rows)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            return cursor.rowcount
+
+    async def _get_leave_index(self) -> LeaveIndex:
+        if not self.leave_index.loaded:
+            cursor = await self._execute(LEAVE_INDEX_QUERY)
+            self.leave_index.load(cursor.fetchall())
+        return self.leave_index
+
+    async def _reindex_leave(self, leave_id: int):
+        if not self.leave_index.loaded:
+            return
+        cursor = await self._execute(LEAVE_INDEX_QUERY + " AND lr.id = ?", (leave_id,))
+        row = cursor.fetchone()
+        if row is None:
+            self.leave_index.remove(leave_id)
+        else:
+            self.leave_index.add(IndexedLeave.from_row(row))
     
     def _convert_to_lowercase(self, user: User) -> User:
         user.full_name = user.full_name.lower()
@@ -36,26 +120,27 @@ class Database:
         if not isinstance(users, list):
             users = [users]
 
-        query = """
-        INSERT OR REPLACE INTO users 
-        (id, jira_id, discord_id, full_name, name, surname, email, remote, role, dept, admin, state) 
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """
-        
         try:
-            for user in users:
-                user = self._convert_to_lowercase(user)
-                await self._execute(query, (
-                    user.id, user.jira_id, user.discord_id, user.full_name, user.name, 
-                    user.surname, user.email, user.remote, user.role, user.dept, 
-                    user.admin, user.state
-                ))
+            await self._executemany(self._upsert_users_query(), (
+                (user.id, user.jira_id, user.discord_id, user.full_name, user.name,
+                 user.surname, user.email, user.remote, user.role, user.dept,
+                 user.admin, _state_value(user.state))
+                for user in map(self._convert_to_lowercase, users)
+            ))
             return True
         except sqlite3.Error:
             return False
 
+    def _upsert_users_query(self) -> str:
+        return f"""
+        INSERT OR REPLACE INTO users 
+        ({', '.join(USER_COLUMNS)}) 
+        VALUES ({', '.join('?' for _ in USER_COLUMNS)})
+        """
+
     async def retrieve_users(self, filters: Optional[Dict[str, Any]] = None) -> List[User]:
-        query = "SELECT * FROM users"
+        # Colonne esplicite: l'ordine di SELECT * dipende dallo schema con cui è nato il database
+        query = "SELECT id, jira_id, discord_id, full_name, name, surname, email, remote, role, dept, admin, state FROM users"
         params = ()
         
         if filters:
@@ -93,13 +178,12 @@ class Database:
         """
         
         try:
-            for user in users:
-                user = self._convert_to_lowercase(user)
-                await self._execute(query, (
-                    user.jira_id, user.discord_id, user.full_name, user.name, 
-                    user.surname, user.email, user.remote, user.role, user.dept, 
-                    user.admin, user.state, user.id
-                ))
+            await self._executemany(query, (
+                (user.jira_id, user.discord_id, user.full_name, user.name,
+                 user.surname, user.email, user.remote, user.role, user.dept,
+                 user.admin, _state_value(user.state), user.id)
+                for user in map(self._convert_to_lowercase, users)
+            ))
             return True
         except sqlite3.Error:
             return False
@@ -111,62 +195,96 @@ class Database:
         query = "DELETE FROM users WHERE id = ?"
         
         try:
-            for user in users:
-                await self._execute(query, (user.id,))
+            await self._executemany(query, ((user.id,) for user in users))
             return True
         except sqlite3.Error:
             return False
 
-    async def check_user_leave(self, user: User, current_time: datetime) -> Optional[Dict[str, Any]]:
-        query = """
-        SELECT lt.name, lr.start_time, lr.end_time
-        FROM leave_records lr
-        JOIN leave_types lt ON lr.leave_type_id = lt.id
-        WHERE lr.user_id = ? 
-        AND ? BETWEEN lr.start_date AND lr.end_date
-        AND lr.authorize = 1
+    async def import_users(self, path: str, file_format: Optional[str] = None) -> TransferStats:
+        """Importa utenti da un file CSV (con intestazione) o JSONL in un'unica transazione.
+
+        Il file viene letto riga per riga, quindi la memoria usata non dipende dalla sua
+        dimensione. Le righe con un id esistente sostituiscono l'utente. Se una riga non
+        è valida l'intero import viene annullato.
         """
-        cursor = await self._execute(query, (user.id, current_time.strftime('%Y-%m-%d')))
-        leaves = cursor.fetchall()
-
-        for leave_type, start_time, end_time in leaves:
-            if leave_type in ['sick', 'holidays']:
-                return {'type': leave_type}
-            elif leave_type == 'work permit':
-                if start_time and end_time:
-                    start_datetime = datetime.combine(current_time.date(), datetime.strptime(start_time, '%H:%M').time())
-                    end_datetime = datetime.combine(current_time.date(), datetime.strptime(end_time, '%H:%M').time())
-                    if start_datetime <= current_time <= end_datetime:
-                        return {'type': leave_type, 'start_time': start_time, 'end_time': end_time}
+        file_format = _file_format(path, file_format)
+        started = time.perf_counter()
+        imported = 0
+
+        def records(file):
+            nonlocal imported
+            reader = csv.DictReader(file) if file_format == 'csv' else (json.loads(line) for line in file if line.strip())
+            for record in reader:
+                imported += 1
+                yield _record_to_params(record)
+
+        with open(path, 'r', newline='', encoding='utf-8') as file:
+            await self._executemany(self._upsert_users_query(), records(file))
+        return _transfer_stats(imported, started)
+
+    async def export_users(self, path: str, file_format: Optional[str] = None) -> TransferStats:
+        """Esporta la tabella users in CSV o JSONL scrivendo una riga alla volta."""
+        file_format = _file_format(path, file_format)
+        started = time.perf_counter()
+        exported = 0
+        query = f"SELECT {', '.join(USER_COLUMNS)} FROM users ORDER BY id"
+
+        async with self.lock:
+            conn = await self._get_connection()
+            with open(path, 'w', newline='', encoding='utf-8') as file:
+                if file_format == 'csv':
+                    writer = csv.writer(file)
+                    writer.writerow(USER_COLUMNS)
+                    for row in conn.execute(query):
+                        writer.writerow(row)
+                        exported += 1
+                else:
+                    for row in conn.execute(query):
+                        file.write(json.dumps(dict(zip(USER_COLUMNS, row))) + '\n')
+                        exported += 1
+        return _transfer_stats(exported, started)
+
+    async def check_user_leave(self, user: User, current_time: datetime) -> Optional[Dict[str, Any]]:
+        leave_index = await self._get_leave_index()
+
+        for leave in leave_index.on_day(user.id, current_time.date()):
+            if leave.leave_type in ['sick', 'holidays']:
+                return {'type': leave.leave_type}
+            elif leave.leave_type == 'work permit':
+                if leave.window:
+                    if leave.covers(current_time):
+                        return {'type': leave.leave_type, 'start_time': leave.start_time, 'end_time': leave.end_time}
                 else:
-                    return {'type': leave_type}
+                    return {'type': leave.leave_type}
 
         return None
-    
+
     async def get_upcoming_leaves(self, user: User, start_date: datetime, end_date: datetime) -> List[dict]:
-        query = """
-        SELECT lt.name, lr.start_date, lr.end_date, lr.start_time, lr.end_time, lr.total_hours
-        FROM leave_records lr
-        JOIN leave_types lt ON lr.leave_type_id = lt.id
-        WHERE lr.user_id = ? AND lr.start_date >= ? AND lr.end_date <= ?
-        AND lr.authorize = 1
-        ORDER BY lr.start_date
-        """
-        cursor = await self._execute(query, (user.id, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')))
-        leaves = cursor.fetchall()
+        leave_index = await self._get_leave_index()
+        first_day, last_day = start_date.date(), end_date.date()
+        # Solo i permessi interamente compresi nel periodo, come nella query originale
+        leaves = sorted(
+            (leave for leave in leave_index.for_user_between(user.id, first_day, last_day)
+             if leave.first_day >= first_day and leave.last_day <= last_day),
+            key=lambda leave: (leave.first_day, leave.leave_id)
+        )
 
         return [
             {
-                'type': leave[0],
-                'start_date': leave[1],
-                'end_date': leave[2],
-                'start_time': leave[3],
-                'end_time': leave[4],
-                'total_hours': leave[5]
+                'type': leave.leave_type,
+                'start_date': leave.start_date,
+                'end_date': leave.end_date,
+                'start_time': leave.start_time,
+                'end_time': leave.end_time,
+                'total_hours': leave.total_hours
             }
             for leave in leaves
         ]
 
+    async def get_users_on_leave(self, start_date: datetime, end_date: datetime) -> set:
+        leave_index = await self._get_leave_index()
+        return leave_index.users_on_leave(start_date.date(), end_date.date())
+
     async def add_leave_record(self, user: User, leave_type_id: int, start_date: str, end_date: str, 
                                notes: Optional[str] = None, start_time: Optional[str] = None, 
                                end_time: Optional[str] = None, total_hours: Optional[float] = None, 
@@ -177,8 +295,9 @@ class Database:
         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
         """
         try:
-            await self._execute(query, (user.id, leave_type_id, start_date, end_date, notes, 
-                                        start_time, end_time, total_hours, authorize))
+            cursor = await self._execute(query, (user.id, leave_type_id, start_date, end_date, notes, 
+                                                 start_time, end_time, total_hours, authorize))
+            await self._reindex_leave(cursor.lastrowid)
             return True
         except Exception as e:
             print(f"Error adding leave record: {e}")
@@ -186,15 +305,16 @@ class Database:
 
     async def update_leave_record(self, leave_id: int, **kwargs) -> bool:
         allowed_fields = ['start_date', 'end_date', 'notes', 'start_time', 'end_time', 'total_hours', 'authorize']
-        update_fields = [f"{k} = ?" for k in kwargs.keys() if k in allowed_fields]
-        if not update_fields:
+        fields = {k: v for k, v in kwargs.items() if k in allowed_fields}
+        if not fields:
             return False
 
-        query = f"UPDATE leave_records SET {', '.join(update_fields)} WHERE id = ?"
-        values = list(kwargs.values()) + [leave_id]
+        query = f"UPDATE leave_records SET {', '.join(f'{k} = ?' for k in fields)} WHERE id = ?"
+        values = list(fields.values()) + [leave_id]
 
         try:
             await self._execute(query, tuple(values))
+            await self._reindex_leave(leave_id)
             return True
         except Exception as e:
             print(f"Error updating leave record: {e}")
@@ -204,6 +324,7 @@ class Database:
         query = "DELETE FROM leave_records WHERE id = ?"
         try:
             await self._execute(query, (leave_id,))
+            self.leave_index.remove(leave_id)
             return True
         except Exception as e:
             print(f"Error deleting leave record: {e}")
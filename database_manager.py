@@ -1,132 +1,303 @@
-import sqlite3
 from datetime import datetime, timedelta
 from user import User
 from user import UserState
+from config import Config
+from db_executor import DatabaseExecutor, WriteResult
+from migrations import migrate
+from user_directory import UserDirectory
+from leave_calendar import LeaveCalendar
+from reports import build_report_query, report_params
+import daily_summary
 from logger import log_user_action, log_exception, logger
+from metrics import timed
+
+
+def _row_to_user(row):
+    return User(
+        id=row['id'],
+        name=row['name'],
+        discord_id=row['discord_id'],
+        full_name=row['full_name'],
+        surname=row['surname'],
+        email=row['email'],
+        remote=bool(row['remote']),
+        role=row['role'],
+        dept=row['dept'],
+        admin=bool(row['admin'])
+    )
+
+
+def _day_bounds(start_date, end_date=None):
+    """Limiti [inizio, fine) di un intervallo di giorni, da confrontare direttamente con start_time.
+
+    start_time è salvato in ISO 8601, quindi il confronto tra stringhe equivale a quello
+    tra timestamp e, a differenza di DATE(start_time), permette di usare gli indici.
+    """
+    if isinstance(start_date, datetime):
+        start_date = start_date.date()
+    if end_date is None:
+        end_date = start_date
+    elif isinstance(end_date, datetime):
+        end_date = end_date.date()
+    return start_date.isoformat(), (end_date + timedelta(days=1)).isoformat()
+
+
+# Query dei percorsi caldi. Devono restare servite dagli indici creati dalle migrazioni:
+# benchmarks/check_query_plans.py verifica con EXPLAIN QUERY PLAN che nessuna faccia una full scan.
+INDEXED_QUERIES = {
+    'open_work_log_in_range': '''
+        SELECT id, start_time FROM work_logs
+        WHERE user_id = ? AND start_time >= ? AND start_time < ?
+        AND end_time IS NULL
+        ORDER BY start_time ASC LIMIT 1
+    ''',
+    'open_work_log': 'SELECT start_time, id FROM work_logs WHERE user_id = ? AND end_time IS NULL',
+    'last_work_log': '''
+        SELECT * FROM work_logs
+        WHERE user_id = ?
+        ORDER BY start_time DESC LIMIT 1
+    ''',
+    'work_logs_in_range': '''
+        SELECT * FROM work_logs
+        WHERE user_id = ? AND start_time >= ? AND start_time < ?
+        ORDER BY start_time DESC
+    ''',
+    'active_break': '''
+        SELECT * FROM break_logs
+        WHERE user_id = ? AND end_time IS NULL
+        ORDER BY start_time DESC LIMIT 1
+    ''',
+    'break_logs_in_range': '''
+        SELECT * FROM break_logs
+        WHERE user_id = ? AND start_time >= ? AND start_time < ?
+        ORDER BY start_time DESC
+    ''',
+    'break_hours_since': '''
+        SELECT SUM(CASE WHEN end_time IS NOT NULL THEN (julianday(end_time) - julianday(start_time)) * 24 ELSE 0 END)
+        FROM break_logs WHERE user_id = ? AND start_time >= ?
+    ''',
+    'lunch_breaks_in_range': '''
+        SELECT COUNT(*) FROM break_logs
+        WHERE user_id = ? AND start_time >= ? AND start_time < ?
+        AND type = 'ON_BREAK_LUNCH'
+    ''',
+    'breaks_summary_in_range': '''
+        SELECT start_time, end_time,
+        (julianday(end_time) - julianday(start_time)) * 24 * 60 AS duration_minutes,
+        type
+        FROM break_logs
+        WHERE user_id = ? AND start_time >= ? AND start_time < ?
+        AND type != 'ON_BREAK_LUNCH'
+        ORDER BY start_time ASC
+    ''',
+    'device_usage_in_range': '''
+        SELECT d.* FROM work_logs w
+        JOIN device_usage_logs d ON d.work_log_id = w.id
+        WHERE w.user_id = ? AND d.user_id = ? AND w.start_time >= ? AND w.start_time < ?
+        ORDER BY w.start_time DESC
+    ''',
+    'break_totals_in_range': '''
+        SELECT
+            COALESCE(SUM(CASE WHEN type = 'ON_BREAK_LUNCH' THEN 0 ELSE hours END), 0) AS break_hours,
+            COALESCE(SUM(CASE WHEN type = 'ON_BREAK_LUNCH' THEN MAX(hours - ?, 0) ELSE 0 END), 0) AS lunch_excess_hours,
+            COALESCE(SUM(hours), 0) AS all_break_hours
+        FROM (
+            SELECT type, (julianday(COALESCE(end_time, ?)) - julianday(start_time)) * 24 AS hours
+            FROM break_logs
+            WHERE user_id = ? AND start_time >= ? AND start_time < ?
+        )
+    ''',
+    'open_breaks': '''
+        SELECT id, start_time FROM break_logs
+        WHERE user_id = ? AND end_time IS NULL
+    ''',
+    'daily_summary_in_range': '''
+        SELECT * FROM daily_summary
+        WHERE user_id = ? AND date >= ? AND date < ?
+        ORDER BY date
+    ''',
+    'last_cumulative_balance': '''
+        SELECT cumulative_balance FROM daily_summary
+        WHERE user_id = ? AND cumulative_balance IS NOT NULL
+        ORDER BY date DESC LIMIT 1
+    ''',
+    'leaves_active_on': '''
+        SELECT lr.id, lr.user_id, lt.name AS leave_type, lr.start_date, lr.end_date
+        FROM leave_records lr
+        JOIN leave_types lt ON lr.leave_type_id = lt.id
+        WHERE lr.end_date >= ? AND lr.start_date <= ?
+    ''',
+}
 
 
-class DatabaseManager:
-    def __init__(self, db_name='work_tracker.db'):
-        self.conn = sqlite3.connect(db_name)
-        self.conn.row_factory = sqlite3.Row
-        self.create_tables()
+# Operazioni eseguite nel thread writer: ricevono la connessione e girano dentro
+# la transazione del batch corrente, quindi lettura e scrittura restano atomiche.
 
-    def create_tables(self):
-        self.conn.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY,
-            name TEXT NOT NULL,
-            discord_id TEXT UNIQUE NOT NULL,
-            full_name TEXT,
-            surname TEXT,
-            email TEXT,
-            remote BOOLEAN,
-            role TEXT,
-            dept TEXT,
-            admin BOOLEAN
-        )
-        ''')
-
-        self.conn.execute('''
-        CREATE TABLE IF NOT EXISTS work_logs (
-            id INTEGER PRIMARY KEY,
-            user_id INTEGER,
-            start_time TEXT NOT NULL,
-            end_time TEXT,
-            total_hours REAL,
-            effective_hours REAL,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        )
-        ''')
-
-        self.conn.execute('''
-        CREATE TABLE IF NOT EXISTS break_logs (
-            id INTEGER PRIMARY KEY,
-            user_id INTEGER,
-            start_time TEXT NOT NULL,
-            end_time TEXT,
-            type TEXT,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        )
-        ''')
-
-        self.conn.execute('''
-        CREATE TABLE IF NOT EXISTS device_usage_logs (
-            id INTEGER PRIMARY KEY,
-            user_id INTEGER,
-            work_log_id INTEGER,
-            mobile_time REAL,
-            pc_time REAL,
-            FOREIGN KEY (user_id) REFERENCES users(id),
-            FOREIGN KEY (work_log_id) REFERENCES work_logs(id)
-        )
-        ''')
+def _log_work_start(conn, user_id, start_time):
+    # Check if there is an existing work log entry for today
+    existing_log = conn.execute(
+        INDEXED_QUERIES['open_work_log_in_range'],
+        (user_id, *_day_bounds(datetime.fromisoformat(start_time)))
+    ).fetchone()
 
-        self.conn.execute('''
-        CREATE TABLE IF NOT EXISTS leave_types (
-            id INTEGER PRIMARY KEY,
-            name TEXT NOT NULL UNIQUE
-        )
-        ''')
-
-        self.conn.execute('''
-        CREATE TABLE IF NOT EXISTS leave_records (
-            id INTEGER PRIMARY KEY,
-            user_id INTEGER,
-            leave_type_id INTEGER,
-            start_date TEXT NOT NULL,
-            end_date TEXT NOT NULL,
-            notes TEXT,
-            FOREIGN KEY (user_id) REFERENCES users(id),
-            FOREIGN KEY (leave_type_id) REFERENCES leave_types(id)
-        )
-        ''')
-
-        self.conn.commit()
-
-    def commit_changes(self):
-        self.conn.commit()
-
-    def get_all_users(self):
-        cursor = self.conn.execute('SELECT * FROM users')
-        return [User(
-            id=row['id'],
-            name=row['name'],
-            discord_id=row['discord_id'],
-            full_name=row['full_name'],
-            surname=row['surname'],
-            email=row['email'],
-            remote=bool(row['remote']),
-            role=row['role'],
-            dept=row['dept'],
-            admin=bool(row['admin'])
-        ) for row in cursor.fetchall()]
-
-    def get_user_by_discord_id(self, discord_id):
-        log_user_action('System', f"Looking up user with Discord ID: {discord_id}")
-        cursor = self.conn.execute('SELECT * FROM users WHERE discord_id = ?', (discord_id,))
-        row = cursor.fetchone()
-        if row:
-            log_user_action('System', f"Found user {row['name']} for Discord ID: {discord_id}")
-            return User(
-                id=row['id'],
-                name=row['name'],
-                discord_id=row['discord_id'],
-                full_name=row['full_name'],
-                surname=row['surname'],
-                email=row['email'],
-                remote=bool(row['remote']),
-                role=row['role'],
-                dept=row['dept'],
-                admin=bool(row['admin'])
-            )
-        log_user_action('System', f"No user found for Discord ID: {discord_id}")
+    if existing_log:
+        # If there's an existing entry, don't update it
+        logger.info("Work log already exists for user %s on %s. Not updating.", user_id, start_time[:10])
+        return existing_log['id']
+
+    # Otherwise, insert a new entry
+    cursor = conn.execute('''
+        INSERT INTO work_logs (user_id, start_time)
+        VALUES (?, ?)
+    ''', (user_id, start_time))
+    return cursor.lastrowid
+
+
+def _log_work_end(conn, user_id, end_time, total_mobile_time, total_pc_time):
+    work_log = conn.execute(INDEXED_QUERIES['open_work_log'], (user_id,)).fetchone()
+
+    if not work_log:
+        logger.warning("No active work log found for user_id: %s", user_id)
         return None
 
+    start_time, work_log_id = work_log
+    total_hours = (datetime.fromisoformat(end_time) - datetime.fromisoformat(start_time)).total_seconds() / 3600
+
+    break_hours = conn.execute(INDEXED_QUERIES['break_hours_since'], (user_id, start_time)).fetchone()[0] or 0
+
+    effective_hours = total_hours - break_hours
 
-    def get_user_state(self, user_id):
-        cursor = self.conn.execute('SELECT end_time FROM work_logs WHERE user_id = ? ORDER BY start_time DESC LIMIT 1', (user_id,))
-        last_work = cursor.fetchone()
+    conn.execute('UPDATE work_logs SET end_time = ?, total_hours = ?, effective_hours = ? WHERE id = ?',
+                 (end_time, total_hours, effective_hours, work_log_id))
+    conn.execute('UPDATE device_usage_logs SET mobile_time = ?, pc_time = ? WHERE work_log_id = ?',
+                 (total_mobile_time, total_pc_time, work_log_id))
+    daily_summary.refresh_day(conn, user_id, start_time)
+    return work_log_id
+
+
+def _log_break_end(conn, user_id, end_time, break_id=None):
+    if break_id:
+        breaks = conn.execute('SELECT id, start_time FROM break_logs WHERE id = ? AND user_id = ?',
+                              (break_id, user_id)).fetchall()
+        cursor = conn.execute('UPDATE break_logs SET end_time = ? WHERE id = ? AND user_id = ?',
+                              (end_time, break_id, user_id))
+    else:
+        breaks = conn.execute(INDEXED_QUERIES['open_breaks'], (user_id,)).fetchall()
+        cursor = conn.execute('UPDATE break_logs SET end_time = ? WHERE user_id = ? AND end_time IS NULL',
+                              (end_time, user_id))
+    # Aggiorna il riepilogo solo per i giorni delle pause chiuse
+    for day in {row['start_time'][:10] for row in breaks}:
+        daily_summary.refresh_day(conn, user_id, day)
+    return WriteResult(cursor.lastrowid, cursor.rowcount)
+
+
+def _update_work_balance(conn, user_id, work_log_id, work_balance, cumulative_balance):
+    cursor = conn.execute('''
+        UPDATE work_logs SET work_balance = ?, cumulative_balance = ?
+        WHERE id = ? AND user_id = ?
+    ''', (work_balance, cumulative_balance, work_log_id, user_id))
+    work_log = conn.execute('SELECT start_time FROM work_logs WHERE id = ?', (work_log_id,)).fetchone()
+    if work_log:
+        daily_summary.refresh_day(conn, user_id, work_log['start_time'])
+    return WriteResult(cursor.lastrowid, cursor.rowcount)
+
+
+def _add_leave_record(conn, user_id, leave_type, start_date, end_date, notes):
+    leave_type_id = conn.execute('SELECT id FROM leave_types WHERE name = ?', (leave_type,)).fetchone()[0]
+    cursor = conn.execute('''
+    INSERT INTO leave_records (user_id, leave_type_id, start_date, end_date, notes)
+    VALUES (?, ?, ?, ?, ?)
+    ''', (user_id, leave_type_id, start_date, end_date, notes))
+    return cursor.lastrowid
+
+
+def _update_leave_record(conn, leave_id, leave_type, start_date, end_date, notes):
+    leave_type_id = conn.execute('SELECT id FROM leave_types WHERE name = ?', (leave_type,)).fetchone()[0]
+    cursor = conn.execute('''
+    UPDATE leave_records
+    SET leave_type_id = ?, start_date = ?, end_date = ?, notes = ?
+    WHERE id = ?
+    ''', (leave_type_id, start_date, end_date, notes, leave_id))
+    return cursor.rowcount > 0
+
+
+def timed_query(function):
+    """Durata del metodo in db_query_seconds, con etichetta query=<nome del metodo>."""
+    return timed('db_query_seconds', 'Durata delle query di DatabaseManager', label='query')(function)
+
+
+class DatabaseManager:
+    def __init__(self, db_name='work_tracker.db', executor=None):
+        # Scritture su un thread dedicato con group commit, letture su un pool di connessioni.
+        # In modalità partizionata l'executor inoltra le scritture al processo writer (vedi sharding.py)
+        self.db = executor or DatabaseExecutor(
+            db_name,
+            batch_size=Config.DB_COMMIT_BATCH_SIZE,
+            batch_interval=Config.DB_COMMIT_INTERVAL_MS / 1000,
+            read_pool_size=Config.DB_READ_POOL_SIZE,
+        )
+        # Anagrafica in memoria: le ricerche di utenti non interrogano il database
+        self.users = UserDirectory()
+        # Permessi attivi oggi: una query al giorno invece di una per utente
+        self.leave_calendar = LeaveCalendar()
+        # Callback listener(kind) chiamate dopo una modifica ad anagrafica ('users') o
+        # permessi ('leaves'): in modalità partizionata le inoltrano ai worker
+        self.change_listeners = []
+        self.create_tables()
+
+    @property
+    def query_count(self):
+        # Numero di statement eseguiti, usato per misurare il costo per evento
+        return self.db.query_count
+
+    def create_tables(self):
+        # Applica solo le migrazioni mancanti: con lo schema aggiornato non esegue DDL
+        self.db.run_sync(migrate)
+
+    @timed_query
+    async def load_users(self):
+        rows = await self.db.fetchall('SELECT * FROM users')
+        self.users.load(_row_to_user(row) for row in rows)
+        return self.users
+
+    @timed_query
+    async def refresh_users(self):
+        """Rilegge l'anagrafica conservando gli oggetti User esistenti e il loro stato runtime."""
+        rows = await self.db.fetchall('SELECT * FROM users')
+        self.users.merge(_row_to_user(row) for row in rows)
+        return self.users
+
+    async def invalidate(self, kind):
+        """Modifica fatta da un altro processo: riallinea la cache interessata."""
+        if kind == 'users':
+            await self.refresh_users()
+        elif kind == 'leaves':
+            self.leave_calendar.invalidate()
+
+    def _changed(self, kind):
+        for listener in self.change_listeners:
+            try:
+                listener(kind)
+            except Exception as e:
+                log_exception('System', f"Error notifying {kind} change: {str(e)}")
+
+    @timed_query
+    async def get_all_users(self):
+        if not self.users.loaded:
+            await self.load_users()
+        return list(self.users.values())
+
+    @timed_query
+    async def get_user_by_discord_id(self, discord_id):
+        user = self.users.get_by_discord_id(discord_id)
+        if user is None:
+            log_user_action('System', f"No user found for Discord ID: {discord_id}")
+        return user
+
+
+    @timed_query
+    async def get_user_state(self, user_id):
+        last_work = await self.db.fetchone('SELECT end_time FROM work_logs WHERE user_id = ? ORDER BY start_time DESC LIMIT 1', (user_id,))
         if last_work and last_work['end_time']:
             try:
                 end_time = last_work['end_time'].isoformat() if isinstance(last_work['end_time'], datetime) else last_work['end_time']
@@ -136,413 +307,335 @@ class DatabaseManager:
                 return 'OFFLINE'
         return 'OFFLINE'
 
-    def log_work_start(self, user_id, start_time=None):
+    @timed_query
+    async def log_work_start(self, user_id, start_time=None):
         if start_time is None:
             start_time = datetime.now()
-        
-        # Check if there is an existing work log entry for today
-        today = start_time.date()
-        existing_log = self.get_work_start_for_today(user_id)
-        
-        if existing_log:
-            # If there's an existing entry, don't update it
-            logger.info(f"Work log already exists for user {user_id} on {today}. Not updating.")
-            return existing_log['id']
-        else:
-            # Otherwise, insert a new entry
-            cursor = self.conn.cursor()
-            cursor.execute('''
-                INSERT INTO work_logs (user_id, start_time)
-                VALUES (?, ?)
-            ''', (user_id, start_time.isoformat()))
-            self.commit_changes()
-            return cursor.lastrowid
-    
-    def get_active_break(self, user_id):
-        cursor = self.conn.execute('''
-            SELECT * FROM break_logs
-            WHERE user_id = ? AND end_time IS NULL
-            ORDER BY start_time DESC LIMIT 1
-        ''', (user_id,))
-        return cursor.fetchone()
+        return await self.db.transaction(_log_work_start, user_id, start_time.isoformat())
 
-    def log_work_end(self, user_id, total_mobile_time, total_pc_time):
+    @timed_query
+    async def get_active_break(self, user_id):
+        return await self.db.fetchone(INDEXED_QUERIES['active_break'], (user_id,))
+
+    @timed_query
+    async def log_work_end(self, user_id, total_mobile_time, total_pc_time):
         current_time = datetime.now()
-        cursor = self.conn.cursor()
-        
-        cursor.execute('SELECT start_time, id FROM work_logs WHERE user_id = ? AND end_time IS NULL', (user_id,))
-        work_log = cursor.fetchone()
-        
-        if not work_log:
-            logger.warning(f"No active work log found for user_id: {user_id}")
-            return
-        
-        start_time, work_log_id = work_log
-        start_time = datetime.fromisoformat(start_time)
-        
-        total_hours = (current_time - start_time).total_seconds() / 3600
-        
-        cursor.execute('SELECT SUM(CASE WHEN end_time IS NOT NULL THEN (julianday(end_time) - julianday(start_time)) * 24 ELSE 0 END) FROM break_logs WHERE user_id = ? AND start_time >= ?', (user_id, start_time.isoformat()))
-        break_hours = cursor.fetchone()[0] or 0
-        
-        effective_hours = total_hours - break_hours
-        
-        cursor.execute('UPDATE work_logs SET end_time = ?, total_hours = ?, effective_hours = ? WHERE id = ?', 
-                    (current_time.isoformat(), total_hours, effective_hours, work_log_id))
-        self.commit_changes()
-
-        cursor.execute('UPDATE device_usage_logs SET mobile_time = ?, pc_time = ? WHERE work_log_id = ?', 
-                    (total_mobile_time, total_pc_time, work_log_id))
-        self.commit_changes()
-
-    def get_user_current_state(self, user_id):
-        cursor = self.conn.execute('SELECT current_state FROM users WHERE id = ?', (user_id,))
-        row = cursor.fetchone()
+        return await self.db.transaction(
+            _log_work_end, user_id, current_time.isoformat(), total_mobile_time, total_pc_time
+        )
+
+    @timed_query
+    async def get_user_current_state(self, user_id):
+        row = await self.db.fetchone('SELECT current_state FROM users WHERE id = ?', (user_id,))
         return row['current_state'] if row else 'OFFLINE'
 
-    def log_break_start(self, user_id, break_type='SHORT_BREAK', start_time=None, break_id=None):
+    @timed_query
+    async def log_break_start(self, user_id, break_type='SHORT_BREAK', start_time=None, break_id=None):
         if start_time is None:
             start_time = datetime.now()
 
         if break_id:
             # Se viene fornito un break_id, aggiorna la pausa esistente
-            logger.debug(f"Updating break start for user_id: {user_id}, break_id: {break_id}, start_time: {start_time}")
-            self.conn.execute('''
+            logger.debug("Updating break start for user_id: %s, break_id: %s, start_time: %s", user_id, break_id, start_time)
+            return await self.db.execute('''
                 UPDATE break_logs
                 SET start_time = ?, type = ?
                 WHERE id = ? AND user_id = ?
             ''', (start_time.isoformat(), break_type, break_id, user_id))
-        else:
-            # Altrimenti, crea un nuovo record di pausa
-            logger.debug(f"Logging new break start for user_id: {user_id}, break_type: {break_type}, start_time: {start_time}")
-            self.conn.execute('''
-                INSERT INTO break_logs (user_id, start_time, type)
-                VALUES (?, ?, ?)
-            ''', (user_id, start_time.isoformat(), break_type))
-        
-        self.commit_changes()
-
-    def log_break_end(self, user_id, end_time=None, break_id=None):
+
+        # Altrimenti, crea un nuovo record di pausa
+        logger.debug("Logging new break start for user_id: %s, break_type: %s, start_time: %s", user_id, break_type, start_time)
+        return await self.db.execute('''
+            INSERT INTO break_logs (user_id, start_time, type)
+            VALUES (?, ?, ?)
+        ''', (user_id, start_time.isoformat(), break_type))
+
+    @timed_query
+    async def log_break_end(self, user_id, end_time=None, break_id=None):
         if end_time is None:
             end_time = datetime.now()
 
         if break_id:
             # Se viene fornito un break_id, aggiorna la fine della pausa esistente
-            logger.debug(f"Updating break end for user_id: {user_id}, break_id: {break_id}, end_time: {end_time}")
-            self.conn.execute('''
-                UPDATE break_logs
-                SET end_time = ?
-                WHERE id = ? AND user_id = ?
-            ''', (end_time.isoformat(), break_id, user_id))
+            logger.debug("Updating break end for user_id: %s, break_id: %s, end_time: %s", user_id, break_id, end_time)
         else:
             # Altrimenti, aggiorna l'ultima pausa attiva
-            logger.debug(f"Logging break end for user_id: {user_id}, end_time: {end_time}")
-            self.conn.execute('''
-                UPDATE break_logs
-                SET end_time = ?
-                WHERE user_id = ? AND end_time IS NULL
-            ''', (end_time.isoformat(), user_id))
+            logger.debug("Logging break end for user_id: %s, end_time: %s", user_id, end_time)
+        return await self.db.transaction(_log_break_end, user_id, end_time.isoformat(), break_id)
 
-        self.commit_changes()
-
-    def log_break_extension(self, user_id, duration):
+    @timed_query
+    async def log_break_extension(self, user_id, duration):
         extended_type = f'EXTENDED_{duration}'
-        logger.debug(f"Logging break extension for user_id: {user_id}, extended_type: {extended_type}")
-        self.conn.execute('UPDATE break_logs SET type = ? WHERE user_id = ? AND end_time IS NULL', (extended_type, user_id))
-        self.commit_changes()
+        logger.debug("Logging break extension for user_id: %s, extended_type: %s", user_id, extended_type)
+        return await self.db.execute('UPDATE break_logs SET type = ? WHERE user_id = ? AND end_time IS NULL', (extended_type, user_id))
 
-    def update_device_usage(self, usage_log_id, mobile_time, pc_time):
-        self.conn.execute(
-            'UPDATE device_usage_logs SET mobile_time = ?, pc_time = ? WHERE id = ?', 
+    @timed_query
+    async def update_device_usage(self, usage_log_id, mobile_time, pc_time):
+        return await self.db.execute(
+            'UPDATE device_usage_logs SET mobile_time = ?, pc_time = ? WHERE id = ?',
             (mobile_time, pc_time, usage_log_id)
         )
-        self.commit_changes()
 
-    def get_work_start_date(self, user_id):
-        cursor = self.conn.execute('''
+    @timed_query
+    async def get_work_start_date(self, user_id):
+        result = await self.db.fetchone('''
             SELECT DATE(start_time) FROM work_logs
             WHERE user_id = ? AND end_time IS NULL
             ORDER BY start_time DESC
             LIMIT 1
         ''', (user_id,))
-        result = cursor.fetchone()
         return result[0] if result else None
 
-    def get_admin_users(self):
-        cursor = self.conn.execute('SELECT * FROM users WHERE admin = 1')
-        return [User(
-            id=row['id'],
-            name=row['name'],
-            discord_id=row['discord_id'],
-            full_name=row['full_name'],
-            surname=row['surname'],
-            email=row['email'],
-            remote=bool(row['remote']),
-            role=row['role'],
-            dept=row['dept'],
-            admin=True
-        ) for row in cursor.fetchall()]
-
-    def get_total_hours(self, user_id):
-        work_log = self.conn.execute('''
-            SELECT start_time, end_time FROM work_logs
-            WHERE user_id = ? 
-            ORDER BY start_time DESC
-            LIMIT 1
-        ''', (user_id,)).fetchone()
-        
-        if not work_log:
-            return None, None, None
-        
-        start_time = datetime.fromisoformat(work_log[0])
-        end_time = datetime.fromisoformat(work_log[1]) if work_log[1] else datetime.now()
+    @timed_query
+    async def get_admin_users(self):
+        return self.users.admin_users()
 
-        total_time = end_time - start_time
+    @timed_query
+    async def get_total_hours(self, user_id):
+        work_log = await self.db.fetchone(INDEXED_QUERIES['last_work_log'], (user_id,))
 
-        break_logs = self.conn.execute('''
-            SELECT start_time, end_time FROM break_logs
-            WHERE user_id = ? AND DATE(start_time) = DATE(?)
-        ''', (user_id, start_time.date())).fetchall()
+        if not work_log:
+            return None, None, None
 
-        total_break_time = timedelta()
+        now = datetime.now()
+        start_time = datetime.fromisoformat(work_log['start_time'])
+        end_time = datetime.fromisoformat(work_log['end_time']) if work_log['end_time'] else now
 
-        for break_start, break_end in break_logs:
-            if break_end:
-                break_duration = datetime.fromisoformat(break_end) - datetime.fromisoformat(break_start)
-            else:
-                break_duration = datetime.now() - datetime.fromisoformat(break_start)
-            total_break_time += break_duration
+        total_time = end_time - start_time
 
-        effective_time = total_time - total_break_time
+        break_totals = await self.get_break_totals(user_id, start_time, now=now)
+        effective_time = total_time - timedelta(hours=break_totals['all_break_hours'])
 
         total_hours_str = f"{total_time.total_seconds() / 3600:.2f} hours"
-        if not work_log[1]:
+        if not work_log['end_time']:
             total_hours_str += " (on going)"
         effective_hours_str = f"{effective_time.total_seconds() / 3600:.2f} hours"
 
         return start_time, total_hours_str, effective_hours_str
 
-    def has_lunch_break_today(self, user_id):
+    @timed_query
+    async def get_break_totals(self, user_id, start_date, end_date=None, now=None):
+        """Ore di pausa nei giorni indicati, sommate in SQL.
+
+        Restituisce break_hours (pause diverse dal pranzo), lunch_excess_hours (pranzo oltre
+        Config.MAX_LUNCH_DURATION) e all_break_hours; le pause ancora aperte contano fino a now.
+        """
+        now = now or datetime.now()
+        return await self.db.fetchone(
+            INDEXED_QUERIES['break_totals_in_range'],
+            (Config.MAX_LUNCH_DURATION / 60, now.isoformat(), user_id, *_day_bounds(start_date, end_date))
+        )
+
+    async def stream_report(self, start_date, end_date, group_by=('user',), user_ids=None, dept=None,
+                            page_size=None, now=None, live_since=None):
+        """Report aggregato in SQL per i giorni da start_date a end_date inclusi, a pagine.
+
+        Vedi reports.build_report_query per raggruppamenti e colonne; con live_since
+        (una data) dei giorni precedenti restano solo i log ancora aperti. Le pagine
+        arrivano da un unico cursore, quindi anche un report mensile aziendale resta in
+        memoria costante.
+        """
+        if live_since is not None:
+            live_since = _day_bounds(live_since)[0]
+        sql, params = build_report_query(group_by, user_ids=user_ids, dept=dept, live_since=live_since)
+        params.update(report_params(*_day_bounds(start_date, end_date), Config.MAX_LUNCH_DURATION / 60, now))
+        async for page in self.db.stream(sql, params, page_size or Config.REPORT_PAGE_SIZE):
+            yield page
+
+    @timed_query
+    async def has_lunch_break_today(self, user_id):
         today = datetime.now().date()
-        cursor = self.conn.execute('''
-            SELECT COUNT(*) FROM break_logs
-            WHERE user_id = ? 
-            AND type = 'ON_BREAK_LUNCH'
-            AND DATE(start_time) = ?
-        ''', (user_id, today))
-        result = cursor.fetchone()[0]
-        return result > 0
-
-    def get_breaks_summary(self, user_id):
-        cursor = self.conn.execute('''
-            SELECT start_time, end_time, 
-            (julianday(end_time) - julianday(start_time)) * 24 * 60 AS duration_minutes,
-            type
-            FROM break_logs 
-            WHERE user_id = ? 
-            AND type != 'ON_BREAK_LUNCH'
-            AND DATE(start_time) = DATE('now')
-            ORDER BY start_time ASC
-        ''', (user_id,))
-        
+        row = await self.db.fetchone(INDEXED_QUERIES['lunch_breaks_in_range'], (user_id, *_day_bounds(today)))
+        return row[0] > 0
+
+    @timed_query
+    async def get_breaks_summary(self, user_id):
+        today = datetime.now().date()
+        rows = await self.db.fetchall(INDEXED_QUERIES['breaks_summary_in_range'], (user_id, *_day_bounds(today)))
+
         breaks = []
-        for row in cursor.fetchall():
+        for row in rows:
             start_time = row['start_time']
             end_time = row['end_time'] or "Ongoing"
             duration = row['duration_minutes'] if row['end_time'] else "Ongoing"
             break_type = row['type']
             breaks.append((start_time, end_time, f"{duration:.2f}", break_type))
-        
+
         return breaks
 
-    def add_leave_record(self, user_id, leave_type, start_date, end_date, notes=""):
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT id FROM leave_types WHERE name = ?', (leave_type,))
-        leave_type_id = cursor.fetchone()[0]
-        
-        cursor.execute('''
-        INSERT INTO leave_records (user_id, leave_type_id, start_date, end_date, notes)
-        VALUES (?, ?, ?, ?, ?)
-        ''', (user_id, leave_type_id, start_date, end_date, notes))
-        
-        self.commit_changes()
-        return cursor.lastrowid
-
-    def get_leave_record(self, leave_id):
-        cursor = self.conn.cursor()
-        cursor.execute('''
+    @timed_query
+    async def get_leave_calendar(self, date):
+        calendar = self.leave_calendar
+        while not calendar.is_current(date):
+            generation = calendar.generation
+            rows = await self.db.fetchall(INDEXED_QUERIES['leaves_active_on'], (date.isoformat(), date.isoformat()))
+            if calendar.load(date, rows, generation):
+                logger.debug("Leave calendar loaded for %s: %s users on leave", date, len(calendar))
+        return calendar
+
+    @timed_query
+    async def add_leave_record(self, user_id, leave_type, start_date, end_date, notes=""):
+        try:
+            return await self.db.transaction(_add_leave_record, user_id, leave_type, start_date, end_date, notes)
+        finally:
+            self.leave_calendar.invalidate()
+            self._changed('leaves')
+
+    @timed_query
+    async def get_leave_record(self, leave_id):
+        return await self.db.fetchone('''
         SELECT lr.id, u.name as user_name, lt.name as leave_type, lr.start_date, lr.end_date, lr.notes
         FROM leave_records lr
         JOIN users u ON lr.user_id = u.id
         JOIN leave_types lt ON lr.leave_type_id = lt.id
         WHERE lr.id = ?
         ''', (leave_id,))
-        
-        return cursor.fetchone()
 
-    def get_user_leave_records(self, user_id):
-        cursor = self.conn.cursor()
-        cursor.execute('''
+    @timed_query
+    async def get_user_leave_records(self, user_id):
+        return await self.db.fetchall('''
         SELECT lr.id, lt.name as leave_type, lr.start_date, lr.end_date, lr.notes
         FROM leave_records lr
         JOIN leave_types lt ON lr.leave_type_id = lt.id
         WHERE lr.user_id = ?
         ORDER BY lr.start_date DESC
         ''', (user_id,))
-        
-        return cursor.fetchall()
-
-    def update_leave_record(self, leave_id, leave_type, start_date, end_date, notes):
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT id FROM leave_types WHERE name = ?', (leave_type,))
-        leave_type_id = cursor.fetchone()[0]
-        
-        cursor.execute('''
-        UPDATE leave_records
-        SET leave_type_id = ?, start_date = ?, end_date = ?, notes = ?
-        WHERE id = ?
-        ''', (leave_type_id, start_date, end_date, notes, leave_id))
-        
-        self.commit_changes()
-        return cursor.rowcount > 0
-
-    def delete_leave_record(self, leave_id):
-        cursor = self.conn.cursor()
-        cursor.execute('DELETE FROM leave_records WHERE id = ?', (leave_id,))
-        self.commit_changes()
-        return cursor.rowcount > 0
-
-    def is_user_on_leave(self, user_id, date):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-        SELECT COUNT(*) 
-        FROM leave_records 
-        WHERE user_id = ? AND start_date <= ? AND end_date >= ?
-        ''', (user_id, date.isoformat(), date.isoformat()))
-        
-        count = cursor.fetchone()[0]
-        return count > 0
-
-    def get_work_start_for_today(self, user_id):
-        today = datetime.now().date().isoformat()
+
+    @timed_query
+    async def update_leave_record(self, leave_id, leave_type, start_date, end_date, notes):
+        try:
+            return await self.db.transaction(_update_leave_record, leave_id, leave_type, start_date, end_date, notes)
+        finally:
+            self.leave_calendar.invalidate()
+            self._changed('leaves')
+
+    @timed_query
+    async def delete_leave_record(self, leave_id):
+        try:
+            result = await self.db.execute('DELETE FROM leave_records WHERE id = ?', (leave_id,))
+        finally:
+            self.leave_calendar.invalidate()
+            self._changed('leaves')
+        return result.rowcount > 0
+
+    @timed_query
+    async def is_user_on_leave(self, user_id, date):
+        calendar = await self.get_leave_calendar(date)
+        return calendar.is_on_leave(user_id)
+
+    @timed_query
+    async def get_work_start_for_today(self, user_id):
+        today = datetime.now().date()
         log_user_action('System', f"Looking for active work log for user {user_id} on date {today}")
 
-        cursor = self.conn.execute('''
-            SELECT id, start_time FROM work_logs
-            WHERE user_id = ? AND DATE(start_time) = DATE(?)
-            AND end_time IS NULL
-            ORDER BY start_time ASC LIMIT 1
-        ''', (user_id, today + "T00:00:00"))
+        result = await self.db.fetchone(INDEXED_QUERIES['open_work_log_in_range'], (user_id, *_day_bounds(today)))
 
-        result = cursor.fetchone()
         log_user_action('System', f"Found work log: {result}" if result else "No active work log found")
         return result if result else None
-    
-    def update_user_state(self, user_id, new_state):
+
+    @timed_query
+    async def update_user_state(self, user_id, new_state):
         valid_states = [state.name for state in UserState]
         if new_state not in valid_states:
             raise ValueError(f"Invalid state: {new_state}")
-        
-        self.conn.execute('UPDATE users SET current_state = ? WHERE id = ?', (new_state, user_id))
-        self.commit_changes()
-
-    def update_work_balance(self, user_id, work_log_id, work_balance, cumulative_balance):
-        self.conn.execute('''
-            UPDATE work_logs SET work_balance = ?, cumulative_balance = ?
-            WHERE id = ? AND user_id = ?
-        ''', (work_balance, cumulative_balance, work_log_id, user_id))
-        self.commit_changes()
-
-    def get_last_cumulative_balance(self, user_id):
-        cursor = self.conn.execute('''
-            SELECT cumulative_balance FROM work_logs
-            WHERE user_id = ?
-            ORDER BY start_time DESC LIMIT 1
-        ''', (user_id,))
-        result = cursor.fetchone()
+
+        return await self.db.execute('UPDATE users SET current_state = ? WHERE id = ?', (new_state, user_id))
+
+    @timed_query
+    async def update_work_balance(self, user_id, work_log_id, work_balance, cumulative_balance):
+        return await self.db.transaction(_update_work_balance, user_id, work_log_id, work_balance, cumulative_balance)
+
+    @timed_query
+    async def get_last_cumulative_balance(self, user_id):
+        result = await self.db.fetchone(INDEXED_QUERIES['last_cumulative_balance'], (user_id,))
         return result['cumulative_balance'] if result else None
 
-    
-    def add_user(self, name, discord_id, full_name, surname, email, remote, role, dept, admin):
-        cursor = self.conn.cursor()
-        cursor.execute('''
+    @timed_query
+    async def get_daily_summaries(self, user_id, start_date, end_date):
+        """Righe di daily_summary per i giorni da start_date a end_date inclusi (solo log chiusi)."""
+        return await self.db.fetchall(
+            INDEXED_QUERIES['daily_summary_in_range'], (user_id, *_day_bounds(start_date, end_date))
+        )
+
+    @timed_query
+    async def rebuild_daily_summary(self):
+        return await self.db.transaction(daily_summary.rebuild)
+
+    @timed_query
+    async def verify_daily_summary(self):
+        return await self.db.transaction(daily_summary.verify)
+
+
+    @timed_query
+    async def add_user(self, name, discord_id, full_name, surname, email, remote, role, dept, admin):
+        result = await self.db.execute('''
         INSERT INTO users (name, discord_id, full_name, surname, email, remote, role, dept, admin)
         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (name, discord_id, full_name, surname, email, remote, role, dept, admin))
-        self.commit_changes()
-        return cursor.lastrowid
-
-    def update_user(self, user_id, name, full_name, surname, email, remote, role, dept, admin):
-        cursor = self.conn.cursor()
-        cursor.execute('''
+        self.users.add(User(
+            id=result.lastrowid, name=name, discord_id=discord_id, full_name=full_name, surname=surname,
+            email=email, remote=bool(remote), role=role, dept=dept, admin=bool(admin)
+        ))
+        self._changed('users')
+        return result.lastrowid
+
+    @timed_query
+    async def update_user(self, user_id, name, full_name, surname, email, remote, role, dept, admin):
+        result = await self.db.execute('''
         UPDATE users
         SET name = ?, full_name = ?, surname = ?, email = ?, remote = ?, role = ?, dept = ?, admin = ?
         WHERE id = ?
         ''', (name, full_name, surname, email, remote, role, dept, admin, user_id))
-        self.commit_changes()
-        return cursor.rowcount > 0
-
-    def delete_user(self, user_id):
-        cursor = self.conn.cursor()
-        cursor.execute('DELETE FROM users WHERE id = ?', (user_id,))
-        self.commit_changes()
-        return cursor.rowcount > 0
-
-    def get_user_by_id(self, user_id):
-        cursor = self.conn.execute('SELECT * FROM users WHERE id = ?', (user_id,))
-        row = cursor.fetchone()
-        if row:
-            return User(
-                id=row['id'],
-                name=row['name'],
-                discord_id=row['discord_id'],
-                full_name=row['full_name'],
-                surname=row['surname'],
-                email=row['email'],
-                remote=bool(row['remote']),
-                role=row['role'],
-                dept=row['dept'],
-                admin=bool(row['admin'])
+        if result.rowcount > 0:
+            self.users.update(
+                user_id, name=name, full_name=full_name, surname=surname, email=email,
+                remote=bool(remote), role=role, dept=dept, admin=bool(admin)
             )
-        return None
-
-    def add_leave_type(self, name):
-        cursor = self.conn.cursor()
-        cursor.execute('INSERT INTO leave_types (name) VALUES (?)', (name,))
-        self.commit_changes()
-        return cursor.lastrowid
-
-    def get_leave_types(self):
-        cursor = self.conn.execute('SELECT * FROM leave_types')
-        return [{'id': row['id'], 'name': row['name']} for row in cursor.fetchall()]
+            self._changed('users')
+        return result.rowcount > 0
+
+    @timed_query
+    async def delete_user(self, user_id):
+        result = await self.db.execute('DELETE FROM users WHERE id = ?', (user_id,))
+        self.users.remove(user_id)
+        self._changed('users')
+        return result.rowcount > 0
+
+    @timed_query
+    async def get_user_by_id(self, user_id):
+        return self.users.get_by_id(user_id)
+
+    @timed_query
+    async def get_users_by_department(self, dept):
+        return self.users.in_department(dept)
+
+    @timed_query
+    async def add_leave_type(self, name):
+        result = await self.db.execute('INSERT INTO leave_types (name) VALUES (?)', (name,))
+        return result.lastrowid
+
+    @timed_query
+    async def get_leave_types(self):
+        rows = await self.db.fetchall('SELECT * FROM leave_types')
+        return [{'id': row['id'], 'name': row['name']} for row in rows]
+
+    @timed_query
+    async def get_user_work_logs(self, user_id, start_date, end_date):
+        return await self.db.fetchall(
+            INDEXED_QUERIES['work_logs_in_range'], (user_id, *_day_bounds(start_date, end_date))
+        )
 
-    def get_user_work_logs(self, user_id, start_date, end_date):
-        cursor = self.conn.execute('''
-        SELECT * FROM work_logs
-        WHERE user_id = ? AND DATE(start_time) BETWEEN ? AND ?
-        ORDER BY start_time DESC
-        ''', (user_id, start_date, end_date))
-        return cursor.fetchall()
+    @timed_query
+    async def get_user_break_logs(self, user_id, start_date, end_date):
+        return await self.db.fetchall(
+            INDEXED_QUERIES['break_logs_in_range'], (user_id, *_day_bounds(start_date, end_date))
+        )
 
-    def get_user_break_logs(self, user_id, start_date, end_date):
-        cursor = self.conn.execute('''
-        SELECT * FROM break_logs
-        WHERE user_id = ? AND DATE(start_time) BETWEEN ? AND ?
-        ORDER BY start_time DESC
-        ''', (user_id, start_date, end_date))
-        return cursor.fetchall()
-
-    def get_user_device_usage(self, user_id, start_date, end_date):
-        cursor = self.conn.execute('''
-        SELECT d.* FROM device_usage_logs d
-        JOIN work_logs w ON d.work_log_id = w.id
-        WHERE d.user_id = ? AND DATE(w.start_time) BETWEEN ? AND ?
-        ORDER BY w.start_time DESC
-        ''', (user_id, start_date, end_date))
-        return cursor.fetchall()
+    @timed_query
+    async def get_user_device_usage(self, user_id, start_date, end_date):
+        return await self.db.fetchall(
+            INDEXED_QUERIES['device_usage_in_range'], (user_id, user_id, *_day_bounds(start_date, end_date))
+        )
 
     def close(self):
-        self.conn.close()
-
-       
-
+        self.db.close()
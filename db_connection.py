@@ -0,0 +1,24 @@
+import sqlite3
+from config import Config
+
+
+def connect(db_name, read_only=False, journal_mode=None, synchronous=None, **kwargs):
+    """Apre una connessione SQLite con i pragma condivisi da tutti i layer del database.
+
+    WAL permette ai lettori (report, !status) di non bloccare il writer (eventi di
+    presenza); i valori di default arrivano da Config e possono essere sovrascritti,
+    ad esempio dal benchmark.
+    """
+    if read_only:
+        conn = sqlite3.connect(f"file:{db_name}?mode=ro", uri=True, timeout=Config.SQLITE_BUSY_TIMEOUT / 1000, **kwargs)
+    else:
+        conn = sqlite3.connect(db_name, timeout=Config.SQLITE_BUSY_TIMEOUT / 1000, **kwargs)
+
+    conn.execute(f"PRAGMA busy_timeout = {int(Config.SQLITE_BUSY_TIMEOUT)}")
+    if not read_only:
+        # journal_mode è persistente nel file: basta impostarlo dalla connessione che scrive
+        conn.execute(f"PRAGMA journal_mode = {journal_mode or Config.SQLITE_JOURNAL_MODE}")
+    conn.execute(f"PRAGMA synchronous = {synchronous or Config.SQLITE_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA mmap_size = {int(Config.SQLITE_MMAP_SIZE)}")
+    conn.execute(f"PRAGMA cache_size = {int(Config.SQLITE_CACHE_SIZE)}")
+    return conn
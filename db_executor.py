@@ -0,0 +1,249 @@
+import asyncio
+import queue
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from db_connection import connect
+from logger import logger
+
+WriteResult = namedtuple("WriteResult", ["lastrowid", "rowcount"])
+
+_TRANSACTION_CONTROL = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE")
+
+
+def _execute_write(conn, sql, params):
+    cursor = conn.execute(sql, params)
+    return WriteResult(cursor.lastrowid, cursor.rowcount)
+
+
+def _executemany_write(conn, sql, seq_of_params):
+    cursor = conn.executemany(sql, seq_of_params)
+    return WriteResult(cursor.lastrowid, cursor.rowcount)
+
+
+class DatabaseExecutor:
+    """Esegue SQLite fuori dall'event loop.
+
+    Tutte le scritture passano da un unico thread writer che le raggruppa in una sola
+    transazione (group commit) ogni batch_interval secondi o ogni batch_size operazioni.
+    Le letture usano un piccolo pool di connessioni in sola lettura.
+    """
+
+    # Con un writer condiviso tra processi (IPCExecutor) commits è il totale del writer
+    shared_writer = False
+
+    def __init__(self, db_name, batch_size=64, batch_interval=0.005, read_pool_size=4):
+        self.db_name = db_name
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.query_count = 0
+        # query_count è incrementato dal writer e dai thread del pool di lettura
+        self._count_lock = threading.Lock()
+        self.commits = 0
+        self._queue = queue.SimpleQueue()
+        self._local = threading.local()
+        self._reader_connections = []
+        self._readers = ThreadPoolExecutor(max_workers=read_pool_size, thread_name_prefix="db-reader")
+        self._closing = threading.Event()
+        self._start_writer()
+
+    def _start_writer(self):
+        self._writer = threading.Thread(target=self._writer_loop, name="db-writer", daemon=True)
+        self._ready = threading.Event()
+        self._writer.start()
+        self._ready.wait()
+
+    def _stop_writer(self):
+        self._queue.put(None)
+        self._writer.join()
+
+    # Connessioni
+
+    def _connect(self, read_only=False):
+        if read_only:
+            conn = connect(self.db_name, read_only=True, check_same_thread=False)
+        else:
+            conn = connect(self.db_name, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.set_trace_callback(self._count_query)
+        return conn
+
+    def _count_query(self, statement):
+        if not statement.startswith(_TRANSACTION_CONTROL):
+            with self._count_lock:
+                self.query_count += 1
+
+    def _reader_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect(read_only=True)
+            self._reader_connections.append(conn)
+        return conn
+
+    # Scritture
+
+    def submit(self, fn, *args):
+        """Accoda fn(conn, *args) al writer e restituisce un concurrent.futures.Future."""
+        future = Future()
+        self._queue.put((fn, args, future))
+        return future
+
+    def run_sync(self, fn, *args):
+        """Versione bloccante di submit, da usare solo all'avvio."""
+        return self.submit(fn, *args).result()
+
+    async def transaction(self, fn, *args):
+        """Esegue fn(conn, *args) nel thread writer, dentro la transazione del batch corrente."""
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    async def execute(self, sql, params=()):
+        return await self.transaction(_execute_write, sql, params)
+
+    async def executemany(self, sql, seq_of_params):
+        return await self.transaction(_executemany_write, sql, list(seq_of_params))
+
+    def _writer_loop(self):
+        conn = self._connect()
+        self._ready.set()
+        running = True
+        while running:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.batch_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+                batch.append(item)
+            try:
+                self._commit_batch(conn, batch)
+            except Exception as e:
+                # Un batch difettoso non deve fermare il writer: le scritture successive resterebbero appese
+                logger.error(f"Unexpected error in db writer: {e}")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+        conn.close()
+
+    def _commit_batch(self, conn, batch):
+        # Le operazioni il cui chiamante ha già rinunciato (future cancellato) non vengono eseguite;
+        # le altre passano a running e non possono più essere cancellate
+        batch = [op for op in batch if op[2].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for fn, args, future in batch:
+                # Ogni operazione ha il proprio savepoint: un errore annulla solo quella
+                conn.execute("SAVEPOINT op")
+                try:
+                    results.append((future, fn(conn, *args), None))
+                    conn.execute("RELEASE op")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO op")
+                    conn.execute("RELEASE op")
+                    results.append((future, None, e))
+            conn.execute("COMMIT")
+            self.commits += 1
+        except Exception as e:
+            logger.error(f"Error committing batch of {len(batch)} writes: {e}")
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            results = [(future, None, e) for _, _, future in batch]
+
+        for future, result, error in results:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    # Letture
+
+    async def read(self, fn, *args):
+        """Esegue fn(conn, *args) su una connessione in sola lettura del pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, self._run_read, fn, args)
+
+    def _run_read(self, fn, args):
+        return fn(self._reader_connection(), *args)
+
+    async def fetchall(self, sql, params=()):
+        return await self.read(lambda conn: conn.execute(sql, params).fetchall())
+
+    async def fetchone(self, sql, params=()):
+        return await self.read(lambda conn: conn.execute(sql, params).fetchone())
+
+    async def stream(self, sql, params=(), page_size=500):
+        """Restituisce le righe di sql a pagine di page_size, con una sola esecuzione della query.
+
+        Il cursore resta aperto su un thread del pool di lettura, che si ferma finché il
+        consumatore non ha preso la pagina precedente: in memoria ci sono al massimo due
+        pagine, qualunque sia la dimensione del risultato.
+        """
+        loop = asyncio.get_running_loop()
+        pages = asyncio.Queue(maxsize=1)
+        stopped = threading.Event()
+
+        def put(item):
+            # Attende spazio nella coda, ma si arrende se il consumatore ha smesso di leggere
+            # o se l'executor sta chiudendo (generatore abbandonato senza aclose)
+            future = asyncio.run_coroutine_threadsafe(pages.put(item), loop)
+            while True:
+                try:
+                    future.result(timeout=0.1)
+                    return True
+                except FutureTimeoutError:
+                    if stopped.is_set() or self._closing.is_set():
+                        future.cancel()
+                        return False
+
+        def produce(conn):
+            try:
+                cursor = conn.execute(sql, params)
+                try:
+                    while not stopped.is_set():
+                        page = cursor.fetchmany(page_size)
+                        if not put(page) or not page:
+                            break
+                finally:
+                    cursor.close()
+            except Exception as e:
+                put(e)
+
+        producer = loop.run_in_executor(self._readers, self._run_read, produce, ())
+        try:
+            while True:
+                page = await pages.get()
+                if isinstance(page, Exception):
+                    raise page
+                if not page:
+                    break
+                yield page
+        finally:
+            # Consumatore interrotto: sblocca il produttore e attende che chiuda il cursore
+            stopped.set()
+            while not pages.empty():
+                pages.get_nowait()
+            await producer
+
+    def close(self):
+        self._closing.set()
+        self._stop_writer()
+        self._readers.shutdown(wait=True)
+        for conn in self._reader_connections:
+            conn.close()
+        self._reader_connections.clear()
@@ -0,0 +1,108 @@
+class _Node:
+    __slots__ = ("center", "by_start", "by_end", "left", "right")
+
+    def __init__(self, center, intervals, left, right):
+        self.center = center
+        # Stessi intervalli ordinati per inizio crescente e per fine decrescente
+        self.by_start = sorted(intervals, key=lambda interval: interval[0])
+        self.by_end = sorted(intervals, key=lambda interval: interval[1], reverse=True)
+        self.left = left
+        self.right = right
+
+
+class IntervalTree:
+    """Albero di intervalli centrato, statico, su intervalli chiusi (start, end, value).
+
+    Le interrogazioni costano O(log n + k). Gli inserimenti e le rimozioni segnano
+    l'albero come da ricostruire, e la ricostruzione (O(n log n)) avviene alla prima
+    interrogazione successiva: adatto a dati che cambiano raramente e vengono letti spesso.
+    """
+
+    def __init__(self, intervals=()):
+        self._intervals = {}
+        self._root = None
+        self._dirty = False
+        for start, end, key, value in intervals:
+            self.add(start, end, key, value)
+
+    def __len__(self):
+        return len(self._intervals)
+
+    def add(self, start, end, key, value):
+        if end < start:
+            raise ValueError(f"Interval end {end} precedes start {start}")
+        self._intervals[key] = (start, end, value)
+        self._dirty = True
+
+    def remove(self, key):
+        if self._intervals.pop(key, None) is not None:
+            self._dirty = True
+
+    def _build(self, intervals):
+        if not intervals:
+            return None
+        points = sorted(point for interval in intervals for point in interval[:2])
+        center = points[len(points) // 2]
+        left, right, here = [], [], []
+        for interval in intervals:
+            if interval[1] < center:
+                left.append(interval)
+            elif interval[0] > center:
+                right.append(interval)
+            else:
+                here.append(interval)
+        return _Node(center, here, self._build(left), self._build(right))
+
+    def _tree(self):
+        if self._dirty:
+            self._root = self._build(list(self._intervals.values()))
+            self._dirty = False
+        return self._root
+
+    def at(self, point):
+        """Valori degli intervalli che contengono point."""
+        result = []
+        node = self._tree()
+        while node is not None:
+            if point < node.center:
+                for start, end, value in node.by_start:
+                    if start > point:
+                        break
+                    result.append(value)
+                node = node.left
+            elif point > node.center:
+                for start, end, value in node.by_end:
+                    if end < point:
+                        break
+                    result.append(value)
+                node = node.right
+            else:
+                result.extend(value for start, end, value in node.by_start)
+                break
+        return result
+
+    def overlapping(self, low, high):
+        """Valori degli intervalli che si sovrappongono a [low, high]."""
+        result = []
+        stack = [self._tree()]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            if high < node.center:
+                for start, end, value in node.by_start:
+                    if start > high:
+                        break
+                    result.append(value)
+                stack.append(node.left)
+            elif low > node.center:
+                for start, end, value in node.by_end:
+                    if end < low:
+                        break
+                    result.append(value)
+                stack.append(node.right)
+            else:
+                result.extend(value for start, end, value in node.by_start)
+                stack.append(node.left)
+                stack.append(node.right)
+        return result
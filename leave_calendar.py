@@ -0,0 +1,50 @@
+from collections import defaultdict, namedtuple
+
+LeaveEntry = namedtuple('LeaveEntry', ['leave_id', 'leave_type', 'start_date', 'end_date'])
+
+
+class LeaveCalendar:
+    """Permessi attivi in una giornata, indicizzati per utente.
+
+    Viene caricato con una sola query per data e invalidato da DatabaseManager su
+    add_leave_record, update_leave_record e delete_leave_record. Il contatore
+    generation scarta i caricamenti partiti prima di un'invalidazione, così un
+    risultato letto durante una scrittura non sovrascrive il calendario aggiornato.
+    """
+
+    def __init__(self):
+        self.date = None
+        self.by_user = {}
+        self.generation = 0
+
+    def __len__(self):
+        return len(self.by_user)
+
+    def is_current(self, date):
+        return self.date == date
+
+    def invalidate(self):
+        self.date = None
+        self.by_user = {}
+        self.generation += 1
+
+    def load(self, date, rows, generation):
+        if generation != self.generation:
+            return False
+        by_user = defaultdict(list)
+        for row in rows:
+            by_user[row['user_id']].append(
+                LeaveEntry(row['id'], row['leave_type'], row['start_date'], row['end_date'])
+            )
+        self.by_user = dict(by_user)
+        self.date = date
+        return True
+
+    def leaves_for(self, user_id):
+        return self.by_user.get(user_id, ())
+
+    def is_on_leave(self, user_id):
+        return user_id in self.by_user
+
+    def users_on_leave(self):
+        return set(self.by_user)
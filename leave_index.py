@@ -0,0 +1,103 @@
+from collections import namedtuple
+from datetime import date, datetime, time
+from interval_tree import IntervalTree
+
+LEAVE_INDEX_QUERY = """
+SELECT lr.id, lr.user_id, lt.name, lr.start_date, lr.end_date, lr.start_time, lr.end_time, lr.total_hours
+FROM leave_records lr
+JOIN leave_types lt ON lr.leave_type_id = lt.id
+WHERE lr.authorize = 1
+"""
+
+
+class IndexedLeave(namedtuple('IndexedLeave', [
+    'leave_id', 'user_id', 'leave_type', 'start_date', 'end_date',
+    'start_time', 'end_time', 'total_hours', 'first_day', 'last_day', 'window',
+])):
+    """Permesso autorizzato con date e fascia oraria già convertite."""
+    __slots__ = ()
+
+    @classmethod
+    def from_row(cls, row):
+        leave_id, user_id, leave_type, start_date, end_date, start_time, end_time, total_hours = row
+        window = None
+        if start_time and end_time:
+            window = (time.fromisoformat(start_time), time.fromisoformat(end_time))
+        return cls(
+            leave_id, user_id, leave_type, start_date, end_date, start_time, end_time, total_hours,
+            date.fromisoformat(start_date), date.fromisoformat(end_date), window,
+        )
+
+    def covers(self, instant: datetime) -> bool:
+        if not self.first_day <= instant.date() <= self.last_day:
+            return False
+        return self.window is None or self.window[0] <= instant.time() <= self.window[1]
+
+
+class LeaveIndex:
+    """Indice in memoria dei permessi autorizzati, per utente e globale.
+
+    Gli intervalli sono i giorni del permesso (estremi inclusi); la fascia oraria dei
+    permessi orari resta sull'elemento e viene confrontata solo sui permessi del giorno.
+    database.Database lo carica alla prima interrogazione e lo aggiorna a ogni modifica
+    di leave_records.
+    """
+
+    def __init__(self):
+        self.by_user = {}
+        self.all = IntervalTree()
+        self.leaves = {}
+        self.loaded = False
+
+    def __len__(self):
+        return len(self.leaves)
+
+    def load(self, rows):
+        self.by_user.clear()
+        self.all = IntervalTree()
+        self.leaves.clear()
+        for row in rows:
+            self.add(IndexedLeave.from_row(row))
+        self.loaded = True
+
+    def add(self, leave: IndexedLeave):
+        self.remove(leave.leave_id)
+        self.leaves[leave.leave_id] = leave
+        self.all.add(leave.first_day, leave.last_day, leave.leave_id, leave)
+        tree = self.by_user.get(leave.user_id)
+        if tree is None:
+            tree = self.by_user[leave.user_id] = IntervalTree()
+        tree.add(leave.first_day, leave.last_day, leave.leave_id, leave)
+
+    def remove(self, leave_id):
+        leave = self.leaves.pop(leave_id, None)
+        if leave is None:
+            return None
+        self.all.remove(leave_id)
+        tree = self.by_user.get(leave.user_id)
+        if tree is not None:
+            tree.remove(leave_id)
+            if not tree:
+                del self.by_user[leave.user_id]
+        return leave
+
+    def on_day(self, user_id, day: date):
+        tree = self.by_user.get(user_id)
+        if tree is None:
+            return []
+        return sorted(tree.at(day), key=lambda leave: leave.leave_id)
+
+    def covering(self, user_id, instant: datetime):
+        return [leave for leave in self.on_day(user_id, instant.date()) if leave.covers(instant)]
+
+    def is_covered(self, user_id, instant: datetime) -> bool:
+        return any(leave.covers(instant) for leave in self.on_day(user_id, instant.date()))
+
+    def for_user_between(self, user_id, start: date, end: date):
+        tree = self.by_user.get(user_id)
+        if tree is None:
+            return []
+        return tree.overlapping(start, end)
+
+    def users_on_leave(self, start: date, end: date):
+        return {leave.user_id for leave in self.all.overlapping(start, end)}
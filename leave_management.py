@@ -21,12 +21,12 @@ class LeaveManagement(commands.Cog):
                 await ctx.send("La data di inizio deve essere precedente alla data di fine.")
                 return
             
-            target_user = self.db_manager.get_user_by_discord_id(user.id)
+            target_user = await self.db_manager.get_user_by_discord_id(user.id)
             if not target_user:
                 await ctx.send("Utente non trovato nel database.")
                 return
             
-            leave_id = self.db_manager.add_leave_record(target_user.id, leave_type, start_date, end_date, notes)
+            leave_id = await self.db_manager.add_leave_record(target_user.id, leave_type, start_date, end_date, notes)
             await ctx.send(f"Assenza aggiunta con successo. ID: {leave_id}")
             logger.info(f"Leave added for user {target_user.name} by {ctx.author.name}")
         except ValueError:
@@ -38,7 +38,7 @@ class LeaveManagement(commands.Cog):
             await ctx.send("Non hai i permessi per eseguire questo comando.")
             return
 
-        leave = self.db_manager.get_leave_record(leave_id)
+        leave = await self.db_manager.get_leave_record(leave_id)
         if leave:
             embed = discord.Embed(title=f"Dettagli Assenza - ID: {leave['id']}")
             embed.add_field(name="Utente", value=leave['user_name'], inline=False)
@@ -51,7 +51,7 @@ class LeaveManagement(commands.Cog):
             await ctx.send("Assenza non trovata.")
 
     async def is_admin(self, ctx):
-        user = self.db_manager.get_user_by_discord_id(ctx.author.id)
+        user = await self.db_manager.get_user_by_discord_id(ctx.author.id)
         return user and user.admin
 
     # Aggiungi altri comandi per la gestione delle assenze se necessario
\ No newline at end of file
@@ -1,4 +1,8 @@
+import atexit
 import logging
+import logging.handlers
+import os
+import queue
 from config import Config
 
 # Configurazione del logger
@@ -10,14 +14,73 @@ formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(module)s: %(message
 console_handler = logging.StreamHandler()
 console_handler.setFormatter(formatter)
 
-file_handler = logging.FileHandler('logs/work_tracker.log')
+class _CreateDirectory:
+    """Apre il file (e ne crea la cartella) al primo record, non all'import del modulo."""
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+class _FileHandler(_CreateDirectory, logging.FileHandler):
+    pass
+
+class _RotatingFileHandler(_CreateDirectory, logging.handlers.RotatingFileHandler):
+    pass
+
+class _TimedRotatingFileHandler(_CreateDirectory, logging.handlers.TimedRotatingFileHandler):
+    pass
+
+def _file_handler():
+    if Config.LOG_ROTATION == 'size':
+        return _RotatingFileHandler(
+            Config.LOG_FILE, maxBytes=Config.LOG_MAX_BYTES, backupCount=Config.LOG_BACKUP_COUNT,
+            encoding='utf-8', delay=True
+        )
+    if Config.LOG_ROTATION == 'time':
+        return _TimedRotatingFileHandler(
+            Config.LOG_FILE, when=Config.LOG_ROTATE_WHEN, backupCount=Config.LOG_BACKUP_COUNT,
+            encoding='utf-8', delay=True
+        )
+    return _FileHandler(Config.LOG_FILE, encoding='utf-8', delay=True)
+
+file_handler = _file_handler()
 file_handler.setFormatter(formatter)
 
-logger.addHandler(console_handler)
-logger.addHandler(file_handler)
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler che nel thread chiamante risolve solo gli argomenti del messaggio.
+
+    Il QueueHandler standard applica anche il Formatter (data, livello, modulo) prima di
+    accodare; qui la formattazione completa resta agli handler del listener.
+    """
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+# Con LOG_ASYNC il logger accoda i record e un thread del QueueListener li scrive su
+# console e file: l'event loop non si blocca mai su I/O di log (né sulla rotazione)
+listener = None
+if Config.LOG_ASYNC:
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(LazyQueueHandler(log_queue))
+    listener = logging.handlers.QueueListener(log_queue, console_handler, file_handler, respect_handler_level=True)
+    listener.start()
+else:
+    logger.addHandler(console_handler)
+    logger.addHandler(file_handler)
+
+def stop_logging():
+    """Svuota la coda dei log e ferma il thread di scrittura (registrata anche con atexit)."""
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
+
+atexit.register(stop_logging)
 
-def log_user_action(user, message):
-    logger.info(f"{user}: {message}")
+def log_user_action(user, message, level=logging.INFO):
+    logger.log(level, "%s: %s", user, message, stacklevel=2)
 
 def log_exception(exception, message="Exception occurred"):
-    logger.error(f"{message}: {exception}")
+    logger.error("%s: %s", message, exception, stacklevel=2)
@@ -0,0 +1,111 @@
+"""Misura del ritardo dell'event loop e rilevamento delle chiamate bloccanti.
+
+Un task heartbeat si risveglia ogni interval secondi e registra di quanto è arrivato
+in ritardo (event_loop_lag_seconds). Un thread watchdog controlla l'ultimo battito:
+se il loop non batte da più di threshold secondi cattura lo stack del thread del loop,
+cioè della coroutine che lo sta bloccando, e lo attribuisce a database_manager.py,
+callbacks.py o altrove. Quando il loop riparte il blocco viene contato in
+event_loop_blocks_total{source} e la durata in event_loop_block_seconds{source}.
+"""
+import asyncio
+import os
+import sys
+import threading
+import traceback
+from collections import Counter, deque, namedtuple
+from datetime import datetime
+from time import perf_counter
+from typing import Optional
+from config import Config
+from logger import logger
+from metrics import metrics
+from profiler import capture_stack
+
+# File a cui attribuire un blocco, cercati dalla foglia dello stack verso la radice
+SOURCES = ('database_manager.py', 'callbacks.py')
+
+BlockRecord = namedtuple('BlockRecord', ['at', 'seconds', 'source', 'stack'])
+
+_lag_seconds = metrics.histogram('event_loop_lag_seconds', 'Ritardo del risveglio del heartbeat dell\'event loop')
+
+
+def attribute(stack) -> str:
+    for path, _ in reversed(stack):
+        name = os.path.basename(path)
+        if name in SOURCES:
+            return name
+    return 'elsewhere'
+
+
+class LoopWatchdog:
+    def __init__(self, interval: float = None, threshold: float = None, history: int = 100):
+        self.interval = interval or Config.LOOP_LAG_INTERVAL_MS / 1000
+        self.threshold = threshold or Config.LOOP_BLOCK_THRESHOLD_MS / 1000
+        # Blocchi recenti (per il replay benchmark e la diagnostica)
+        self.blocks = deque(maxlen=history)
+        self.block_counts = Counter()
+        self.max_lag = 0.0
+        self._last_beat = perf_counter()
+        self._captured_beat = None
+        self._pending = None
+        self._stop = threading.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._thread_id = None
+
+    async def start(self) -> None:
+        """Da chiamare sull'event loop da sorvegliare."""
+        self._thread_id = threading.get_ident()
+        self._last_beat = perf_counter()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        logger.info("Event loop watchdog started: heartbeat every %.0fms, block threshold %.0fms",
+                    self.interval * 1000, self.threshold * 1000)
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+        if self._thread is not None:
+            self._thread.join()
+
+    async def _heartbeat(self) -> None:
+        while True:
+            expected = perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            now = perf_counter()
+            lag = max(now - expected, 0.0)
+            self._last_beat = now
+            _lag_seconds.observe(lag)
+            if lag > self.max_lag:
+                self.max_lag = lag
+            if lag >= self.threshold:
+                self._block_ended(lag)
+
+    def _watch(self) -> None:
+        # Controlli più fitti della soglia, così anche i blocchi poco più lunghi vengono catturati
+        while not self._stop.wait(self.threshold / 4):
+            beat = self._last_beat
+            if perf_counter() - beat < self.interval + self.threshold or beat == self._captured_beat:
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            self._captured_beat = beat
+            stack = capture_stack(frame)
+            text = ''.join(traceback.format_stack(frame, limit=12))
+            del frame
+            source = attribute(stack)
+            self._pending = (source, text)
+            logger.warning("Event loop blocked for more than %.0fms in %s:\n%s", self.threshold * 1000, source, text)
+
+    def _block_ended(self, lag: float) -> None:
+        # Blocco più breve del periodo del watchdog: nessuno stack catturato
+        source, text = self._pending or ('unknown', '')
+        self._pending = None
+        self.block_counts[source] += 1
+        self.blocks.append(BlockRecord(datetime.now(), lag, source, text))
+        metrics.counter('event_loop_blocks_total', 'Blocchi dell\'event loop oltre la soglia', source=source).inc()
+        metrics.histogram('event_loop_block_seconds', 'Durata dei blocchi dell\'event loop', source=source).observe(lag)
+        logger.warning("Event loop was blocked for %.0fms (%s)", lag * 1000, source)
@@ -1,13 +1,18 @@
 import asyncio
 import logging
-from datetime import datetime, timezone
+import time
 import discord
 from discord.ext import commands, tasks
 from work_tracker import WorkTracker
 from database_manager import DatabaseManager
 from leave_management import LeaveManagement
+from admin_commands import AdminCommands
 from config import Config
 from logger import log_user_action, log_exception
+from metrics import metrics, serve as serve_metrics
+from loop_monitor import LoopWatchdog
+from presence_debouncer import PresenceDebouncer
+from transition_journal import TransitionJournal
 
 # Configurazione delle intenzioni di Discord
 intents = discord.Intents.all()
@@ -15,79 +20,163 @@ intents.presences = True
 intents.guilds = True
 intents.members = True
 
-# Inizializzazione del bot
-bot = commands.Bot(command_prefix="!", intents=intents)
-
-# Configurazione delle componenti
 config = Config()
-db_manager = DatabaseManager()
-work_tracker = WorkTracker(bot, db_manager)
-leave_management = LeaveManagement(bot, db_manager)
-
-# Dizionario per tenere traccia dei task in esecuzione per ogni utente e del tempo dell'ultimo aggiornamento
-active_tasks = {}
-last_update_times = {}
 
-# Intervallo di debounce in secondi
-DEBOUNCE_INTERVAL = 2
+# Bot e componenti, creati da setup_components. In modalità partizionata (vedi sharding.py)
+# il gateway crea il bot e inoltra le presenze ai worker, che creano solo il tracker con
+# setup_tracker; tutti usano l'executor collegato al processo writer
+bot = None
+db_manager = None
+work_tracker = None
+leave_management = None
+admin_commands = None
+# Nel gateway della modalità partizionata: inoltra le presenze al worker che possiede l'utente
+presence_router = None
+# Porta dell'endpoint delle metriche (in modalità partizionata, una per processo) e server avviato da on_ready
+metrics_port = Config.METRICS_PORT
+metrics_server = None
+# Watchdog dei blocchi dell'event loop, avviato da on_ready
+loop_watchdog = None
+
+presence_events = metrics.counter('presence_events_total', 'Eventi di presenza con cambio di stato ricevuti')
+presence_sync_seconds = metrics.histogram('presence_sync_seconds', 'Durata di sync_user_state')
+metrics.gauge('presence_active_tasks', 'Sincronizzazioni in corso').set_function(lambda: len(presence_debouncer.running))
+metrics.gauge('presence_pending_users', 'Utenti in attesa del debounce').set_function(lambda: len(presence_debouncer))
+
+def collect_component_metrics():
+    """Contatori già mantenuti dalle componenti, letti solo quando si leggono le metriche."""
+    yield ('presence_events_debounced_total', 'counter', 'Eventi di presenza assorbiti da uno successivo',
+           {}, presence_debouncer.stats['coalesced'])
+    if work_tracker is not None:
+        for key, value in work_tracker.sync_stats.items():
+            yield ('work_tracker_sync_total', 'counter', 'Contatori di sincronizzazione di WorkTracker', {'stat': key}, value)
+        for key, value in work_tracker.user_locks.stats().items():
+            yield (f'user_locks_{key}', 'gauge', 'Statistiche dei lock per utente', {}, value)
+    if db_manager is not None:
+        yield ('db_statements_total', 'counter', 'Statement SQL eseguiti da questo processo', {}, db_manager.db.query_count)
+        # In modalità partizionata è il totale del processo writer condiviso: stesso valore su ogni processo
+        writer = 'shared' if db_manager.db.shared_writer else 'local'
+        yield ('db_commits_total', 'counter', 'Commit del writer del database', {'writer': writer}, db_manager.db.commits)
+
+metrics.register_collector(collect_component_metrics)
+
+async def start_monitoring():
+    global metrics_server, loop_watchdog
+    if Config.LOOP_BLOCK_THRESHOLD_MS > 0 and loop_watchdog is None:
+        loop_watchdog = LoopWatchdog()
+        await loop_watchdog.start()
+    if metrics_port and metrics_server is None:
+        try:
+            metrics_server = await serve_metrics(Config.METRICS_HOST, metrics_port)
+        except OSError as e:
+            log_exception(e, f"Could not start metrics endpoint on port {metrics_port}")
+
+async def start_tracking():
+    """Avvia il tracciamento sul loop in esecuzione: on_ready o, in un worker, il primo elenco dei membri."""
+    work_tracker.resume_idle_buffers()
+    # Con lo stato ripristinato da snapshot e journal basta sincronizzare chi ha cambiato
+    # stato su Discord mentre il bot era fermo
+    await work_tracker.reconcile_states(full=not work_tracker.restored)
+    start_periodic_tasks()
 
-@bot.event
 async def on_ready():
+    await start_monitoring()
     guild = bot.get_guild(int(config.GUILD_ID))
     if guild:
         log_user_action('System', f'Connected to GUILD: {guild.name}')
     log_user_action('System', f'Logged in as {bot.user.name}')
-    await work_tracker.reconcile_states()
+    if presence_router is not None:
+        # Gateway: i worker ricevono lo stato Discord dei propri utenti e riconciliano da sé
+        if guild:
+            presence_router.start(guild)
+        return
+    await start_tracking()
 
-@bot.event
 async def on_presence_update(before, after):
     if before.status != after.status:
-        user_id = str(after.id)
-
-        now = datetime.now(timezone.utc)
-        last_update_time = last_update_times.get(user_id)
-
-        # Debounce logic to prevent rapid duplicate state updates
-        if last_update_time and (now - last_update_time).total_seconds() < DEBOUNCE_INTERVAL:
+        if presence_router is not None:
+            presence_router.forward(str(after.id), str(after.status))
             return
+        presence_changed(str(after.id), str(after.status))
 
-        last_update_times[user_id] = now
+def presence_changed(user_id, status):
+    presence_events.inc()
+    # La sincronizzazione parte dopo la quiete, con l'ultimo stato della raffica
+    presence_debouncer.submit(user_id, status)
 
-        if user_id not in active_tasks:
-            active_tasks[user_id] = bot.loop.create_task(sync_user_state(user_id))
-
-async def sync_user_state(user_id):
+async def sync_user_state(user_id, status=None):
+    started = time.perf_counter()
     try:
         user = work_tracker.users.get(user_id)
         if user:
-            await work_tracker.sync_user_state(user)
-            await work_tracker.reconcile_states()  # Chiama reconcile_states dopo ogni aggiornamento di stato
+            log_user_action('System', f"Debounced presence for {user.name}: {status}", level=logging.DEBUG)
+            # Solo l'utente interessato: il drift viene recuperato dalla riconciliazione periodica
+            await work_tracker.handle_presence_update(user)
     except Exception as e:
         log_exception('System', f"Error syncing state for user {user_id}: {str(e)}")
     finally:
-        active_tasks.pop(user_id, None)
+        presence_sync_seconds.observe(time.perf_counter() - started)
+
+presence_debouncer = PresenceDebouncer(sync_user_state)
+
+# Riconciliazione periodica a bassa frequenza: recupera il drift degli eventi di presenza persi
+@tasks.loop(minutes=Config.RECONCILE_INTERVAL)
+async def periodic_task():
+    try:
+        log_user_action('System', 'Running periodic task')
+        await work_tracker.reconcile_states()
+    except Exception as e:
+        log_exception('System', f"Error in periodic task: {str(e)}")
+
+# Snapshot dello stato runtime: compatta il journal delle transizioni
+@tasks.loop(minutes=Config.SNAPSHOT_INTERVAL)
+async def snapshot_task():
+    try:
+        await work_tracker.snapshot_runtime_state()
+    except Exception as e:
+        log_exception('System', f"Error writing runtime snapshot: {str(e)}")
 
 # Funzione per avviare task periodici
 def start_periodic_tasks():
-    @tasks.loop(minutes=1)
-    async def periodic_task():
-        try:
-            log_user_action('System', 'Running periodic task')
-            await work_tracker.reconcile_states()
-        except Exception as e:
-            log_exception('System', f"Error in periodic task: {str(e)}")
-
-    periodic_task.start()
+    if not periodic_task.is_running():
+        periodic_task.start()
+    if not snapshot_task.is_running():
+        snapshot_task.start()
+
+def setup_tracker(tracker_bot, executor=None, journal_name='transitions'):
+    """DatabaseManager e WorkTracker; in un worker tracker_bot è il suo PresenceMirror."""
+    global db_manager, work_tracker
+    db_manager = DatabaseManager(executor=executor)
+    work_tracker = WorkTracker(tracker_bot, db_manager)
+    work_tracker.journal = TransitionJournal(name=journal_name)
+
+def setup_components(executor=None, router=None):
+    global bot, db_manager, work_tracker, leave_management, admin_commands, presence_router
+    bot = commands.Bot(command_prefix="!", intents=intents)
+    bot.add_listener(on_ready)
+    bot.add_listener(on_presence_update)
+    if router is None:
+        setup_tracker(bot, executor)
+    else:
+        # Gateway: le modifiche ad anagrafica e permessi invalidano le cache dei worker
+        presence_router = router
+        db_manager = DatabaseManager(executor=executor)
+        db_manager.change_listeners.append(router.invalidate)
+        work_tracker = WorkTracker(bot, db_manager)
+        work_tracker.tracking = False
+    leave_management = LeaveManagement(bot, db_manager)
+    admin_commands = AdminCommands(bot, db_manager)
 
 # Aggiungi i cog e avvia il bot
 async def setup_bot():
     try:
         await bot.add_cog(work_tracker)
         await bot.add_cog(leave_management)
+        await bot.add_cog(admin_commands)
     except Exception as e:
         log_exception('System', f"Error in setup: {str(e)}")
 
-if __name__ == "__main__":
+def run():
     try:
         loop = asyncio.get_event_loop()
         loop.run_until_complete(setup_bot())
@@ -95,3 +184,7 @@ if __name__ == "__main__":
         bot.run(config.DISCORD_TOKEN)
     except Exception as e:
         log_exception('System', f"Error in main loop: {str(e)}")
+
+if __name__ == "__main__":
+    setup_components()
+    run()
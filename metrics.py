@@ -0,0 +1,264 @@
+"""Metriche di processo: contatori, gauge e istogrammi in formato Prometheus.
+
+Le metriche vivono nel registro globale `metrics`. Chi strumenta un percorso caldo
+risolve la metrica una volta (a import o alla prima chiamata) e per ogni campione fa
+solo inc/set/observe: niente lock (l'event loop è single thread; dai thread del
+database un campione perso per una race è accettabile) e per gli istogrammi una
+bisect sui limiti dei bucket. I valori già contati altrove (sync_stats, lock per
+utente, executor) entrano tramite collector chiamati solo in lettura.
+
+Il registro si legge con render() (testo Prometheus, servito da serve() su HTTP) o con
+snapshot() (usato da !metrics).
+"""
+import asyncio
+import functools
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, Optional, Tuple
+from logger import logger
+
+# Limiti dei bucket (in secondi) per le latenze: da 50µs a 10s
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Gauge:
+    __slots__ = ('value', 'function')
+
+    def __init__(self):
+        self.value = 0
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set_function(self, function: Callable[[], float]):
+        """Il valore viene letto da function() a ogni lettura del registro."""
+        self.function = function
+
+    def get(self):
+        return self.function() if self.function is not None else self.value
+
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        # Un contatore per bucket più quello oltre l'ultimo limite (+Inf)
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, fraction):
+        """Stima del quantile: il limite superiore del bucket che lo contiene."""
+        if not self.count:
+            return None
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float('inf')
+
+
+_TYPES = {'counter': Counter, 'gauge': Gauge, 'histogram': Histogram}
+
+
+class _Family:
+    __slots__ = ('name', 'kind', 'help', 'children')
+
+    def __init__(self, name, kind, help_text):
+        self.name = name
+        self.kind = kind
+        self.help = help_text
+        self.children: Dict[Tuple, object] = {}
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels_text(labels: Tuple) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _number(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._families: Dict[str, _Family] = {}
+        self._collectors = []
+
+    def _get(self, kind, name, help_text, labels, **options):
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = _Family(name, kind, help_text)
+        elif family.kind != kind:
+            raise ValueError(f"Metric {name} already registered as {family.kind}")
+        key = tuple(sorted(labels.items()))
+        metric = family.children.get(key)
+        if metric is None:
+            metric = family.children[key] = _TYPES[kind](**options)
+        return metric
+
+    def counter(self, name: str, help_text: str = '', **labels) -> Counter:
+        return self._get('counter', name, help_text, labels)
+
+    def gauge(self, name: str, help_text: str = '', **labels) -> Gauge:
+        return self._get('gauge', name, help_text, labels)
+
+    def histogram(self, name: str, help_text: str = '', bounds=LATENCY_BUCKETS, **labels) -> Histogram:
+        return self._get('histogram', name, help_text, labels, bounds=bounds)
+
+    def register_collector(self, collector: Callable[[], Iterable[Tuple[str, str, str, dict, float]]]):
+        """collector() restituisce tuple (nome, tipo, help, etichette, valore) lette al momento."""
+        self._collectors.append(collector)
+
+    def unregister_collector(self, collector):
+        if collector in self._collectors:
+            self._collectors.remove(collector)
+
+    def _collected(self):
+        families: Dict[str, _Family] = {}
+        for collector in list(self._collectors):
+            try:
+                samples = list(collector())
+            except Exception as e:
+                logger.error("Metrics collector %s failed: %s", getattr(collector, '__name__', collector), e)
+                continue
+            for name, kind, help_text, labels, value in samples:
+                family = families.get(name)
+                if family is None:
+                    family = families[name] = _Family(name, kind, help_text)
+                family.children[tuple(sorted(labels.items()))] = value
+        return families
+
+    def render(self) -> str:
+        """Testo nel formato di esposizione di Prometheus (version 0.0.4)."""
+        lines = []
+        for family in list(self._families.values()):
+            lines.append(f'# HELP {family.name} {family.help}')
+            lines.append(f'# TYPE {family.name} {family.kind}')
+            for labels, metric in list(family.children.items()):
+                if family.kind == 'histogram':
+                    cumulative = 0
+                    for bound, count in zip(metric.bounds + (float('inf'),), metric.counts):
+                        cumulative += count
+                        bucket_labels = labels + (('le', _number(float(bound))),)
+                        lines.append(f'{family.name}_bucket{_labels_text(bucket_labels)} {cumulative}')
+                    lines.append(f'{family.name}_sum{_labels_text(labels)} {_number(metric.sum)}')
+                    lines.append(f'{family.name}_count{_labels_text(labels)} {metric.count}')
+                else:
+                    value = metric.get() if family.kind == 'gauge' else metric.value
+                    lines.append(f'{family.name}{_labels_text(labels)} {_number(value)}')
+        for family in self._collected().values():
+            lines.append(f'# HELP {family.name} {family.help}')
+            lines.append(f'# TYPE {family.name} {family.kind}')
+            for labels, value in family.children.items():
+                lines.append(f'{family.name}{_labels_text(labels)} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        """{nome: {etichette: valore}}; per gli istogrammi count, media, p50 e p99 stimati."""
+        result = {}
+        for family in list(self._families.values()):
+            values = result.setdefault(family.name, {})
+            for labels, metric in list(family.children.items()):
+                key = _labels_text(labels)
+                if family.kind == 'histogram':
+                    values[key] = {
+                        'count': metric.count,
+                        'avg': metric.sum / metric.count if metric.count else None,
+                        'p50': metric.quantile(0.50),
+                        'p99': metric.quantile(0.99),
+                    }
+                else:
+                    values[key] = metric.get() if family.kind == 'gauge' else metric.value
+        for family in self._collected().values():
+            values = result.setdefault(family.name, {})
+            for labels, value in family.children.items():
+                values[_labels_text(labels)] = value
+        return result
+
+
+metrics = MetricsRegistry()
+
+
+def timed(histogram_name: str, help_text: str = '', label: str = None):
+    """Decoratore per coroutine: osserva la durata in histogram_name.
+
+    Con label la metrica ha un'etichetta label=<nome della funzione>, così più funzioni
+    condividono la stessa famiglia (per esempio le query di DatabaseManager).
+    """
+    def decorator(function):
+        labels = {label: function.__name__} if label else {}
+        histogram = metrics.histogram(histogram_name, help_text, **labels)
+
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+async def _handle_http(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, registry: MetricsRegistry):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        # Intestazioni ignorate: basta consumarle fino alla riga vuota
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b'\r\n', b'\n', b''):
+            pass
+        parts = request_line.decode('latin-1').split()
+        if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] in ('/', '/metrics'):
+            status, body = '200 OK', registry.render().encode('utf-8')
+        else:
+            status, body = '404 Not Found', b'not found\n'
+        writer.write(
+            f'HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+            f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode('latin-1') + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host: str, port: int, registry: Optional[MetricsRegistry] = None) -> asyncio.AbstractServer:
+    """Avvia l'endpoint HTTP /metrics sull'event loop corrente."""
+    registry = registry or metrics
+    server = await asyncio.start_server(functools.partial(_handle_http, registry=registry), host, port)
+    logger.info("Metrics endpoint listening on http://%s:%s/metrics", host, port)
+    return server
@@ -0,0 +1,214 @@
+from datetime import datetime
+from logger import logger
+import daily_summary
+
+# Migrazioni dello schema, applicate in ordine e registrate nella tabella schema_version.
+# Unificano gli schemi storici di create_db.py, DatabaseManager e database.Database.
+
+
+def _add_column(conn, table, column, definition):
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _initial_schema(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY,
+        jira_id TEXT,
+        discord_id TEXT UNIQUE,
+        full_name TEXT,
+        name TEXT NOT NULL,
+        surname TEXT,
+        email TEXT,
+        remote BOOLEAN,
+        role TEXT,
+        dept TEXT,
+        admin BOOLEAN,
+        state TEXT DEFAULT 'OFFLINE',
+        current_state TEXT DEFAULT 'OFFLINE'
+    )
+    ''')
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS work_logs (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER,
+        start_time TEXT NOT NULL,
+        end_time TEXT,
+        total_hours REAL,
+        effective_hours REAL,
+        is_overtime BOOLEAN DEFAULT 0,
+        work_balance REAL,
+        cumulative_balance REAL,
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    )
+    ''')
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS break_logs (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER,
+        start_time TEXT NOT NULL,
+        end_time TEXT,
+        type TEXT,
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    )
+    ''')
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS device_usage_logs (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER,
+        work_log_id INTEGER,
+        mobile_time REAL DEFAULT 0,  -- Tempo totale in secondi su mobile
+        pc_time REAL DEFAULT 0,      -- Tempo totale in secondi su PC
+        FOREIGN KEY (user_id) REFERENCES users(id),
+        FOREIGN KEY (work_log_id) REFERENCES work_logs(id)
+    )
+    ''')
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS leave_types (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    )
+    ''')
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS leave_records (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        leave_type_id INTEGER NOT NULL,
+        start_date TEXT NOT NULL,
+        end_date TEXT NOT NULL,
+        notes TEXT,
+        start_time TEXT,   -- Orario di inizio per i permessi orari (HH:MM)
+        end_time TEXT,     -- Orario di fine per i permessi orari (HH:MM)
+        total_hours REAL,
+        hours INTEGER,     -- Ore di permesso (se applicabile)
+        authorize INTEGER DEFAULT 0,
+        FOREIGN KEY (user_id) REFERENCES users(id),
+        FOREIGN KEY (leave_type_id) REFERENCES leave_types(id)
+    )
+    ''')
+
+
+def _add_missing_columns(conn):
+    # Database creati con gli schemi precedenti: aggiunge solo le colonne mancanti
+    _add_column(conn, 'users', 'jira_id', 'TEXT')
+    _add_column(conn, 'users', 'state', "TEXT DEFAULT 'OFFLINE'")
+    _add_column(conn, 'users', 'current_state', "TEXT DEFAULT 'OFFLINE'")
+    _add_column(conn, 'work_logs', 'is_overtime', 'BOOLEAN DEFAULT 0')
+    _add_column(conn, 'work_logs', 'work_balance', 'REAL')
+    _add_column(conn, 'work_logs', 'cumulative_balance', 'REAL')
+    _add_column(conn, 'leave_records', 'start_time', 'TEXT')
+    _add_column(conn, 'leave_records', 'end_time', 'TEXT')
+    _add_column(conn, 'leave_records', 'total_hours', 'REAL')
+    _add_column(conn, 'leave_records', 'hours', 'INTEGER')
+    _add_column(conn, 'leave_records', 'authorize', 'INTEGER DEFAULT 0')
+
+
+def _add_log_indexes(conn):
+    # Indici per utente e timestamp; quelli parziali coprono solo le righe ancora aperte
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_work_logs_user_start ON work_logs (user_id, start_time)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_work_logs_user_end ON work_logs (user_id, end_time)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_work_logs_open ON work_logs (user_id, start_time) WHERE end_time IS NULL')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_break_logs_user_start ON break_logs (user_id, start_time)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_break_logs_user_end ON break_logs (user_id, end_time)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_break_logs_open ON break_logs (user_id, start_time) WHERE end_time IS NULL')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_device_usage_work_log ON device_usage_logs (work_log_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_leave_records_user_dates ON leave_records (user_id, start_date, end_date)')
+
+
+def _seed_leave_types(conn):
+    # Tipologie di permessi
+    conn.execute('''
+    INSERT OR IGNORE INTO leave_types (id, name) VALUES
+    (1, 'malattia'),
+    (2, 'permesso'),
+    (3, 'ferie')
+    ''')
+
+
+def _add_leave_calendar_index(conn):
+    # Permessi attivi in una data per tutti gli utenti (calendario giornaliero dei permessi)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_leave_records_dates ON leave_records (end_date, start_date)')
+
+
+def _add_report_indexes(conn):
+    # Report aziendali su un intervallo di date, senza filtro per utente
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_work_logs_start ON work_logs (start_time)')
+
+
+def _add_daily_summary(conn):
+    # Riepilogo giornaliero per utente, popolato subito dai log esistenti
+    conn.execute(daily_summary.CREATE_TABLE)
+    daily_summary.rebuild(conn)
+
+
+def _add_daily_summary_times(conn):
+    # Primo ingresso e ultima uscita del giorno: il report settimanale legge solo daily_summary
+    _add_column(conn, 'daily_summary', 'first_start', 'TEXT')
+    _add_column(conn, 'daily_summary', 'last_end', 'TEXT')
+    daily_summary.rebuild(conn)
+
+
+MIGRATIONS = [
+    (1, 'initial schema', _initial_schema),
+    (2, 'add missing columns', _add_missing_columns),
+    (3, 'log indexes', _add_log_indexes),
+    (4, 'seed leave types', _seed_leave_types),
+    (5, 'leave calendar index', _add_leave_calendar_index),
+    (6, 'report indexes', _add_report_indexes),
+    (7, 'daily summary', _add_daily_summary),
+    (8, 'daily summary times', _add_daily_summary_times),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'"
+    ).fetchone()
+    if not exists:
+        return 0
+    return conn.execute('SELECT MAX(version) FROM schema_version').fetchone()[0] or 0
+
+
+def migrate(conn):
+    """Applica le migrazioni mancanti in un'unica transazione e restituisce quante ne ha applicate.
+
+    Se lo schema è già aggiornato non esegue alcun DDL. Usa un savepoint, quindi
+    funziona sia su una connessione in autocommit sia dentro una transazione già aperta
+    (come quella del writer di DatabaseExecutor).
+    """
+    version = current_version(conn)
+    pending = [migration for migration in MIGRATIONS if migration[0] > version]
+    if not pending:
+        return 0
+
+    conn.execute('SAVEPOINT schema_migration')
+    try:
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+        ''')
+        for number, name, apply in pending:
+            apply(conn)
+            conn.execute(
+                'INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)',
+                (number, name, datetime.now().isoformat())
+            )
+            logger.info(f"Applied schema migration {number}: {name}")
+        conn.execute('RELEASE schema_migration')
+    except Exception:
+        conn.execute('ROLLBACK TO schema_migration')
+        conn.execute('RELEASE schema_migration')
+        raise
+    return len(pending)
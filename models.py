@@ -72,6 +72,7 @@ class User:
         self.state = UserState(state)
         self.check_in_time = None
         self.check_out_time = None
+        self.work_start: Optional[datetime] = None
         self.daily_work_time = timedelta()
         self.weekly_work_time = timedelta()
         self.is_overtime = False
@@ -80,6 +81,7 @@ class User:
         # Break tracking
         self.break_logs: List[BreakLog] = []
         self.current_break: Optional[BreakLog] = None
+        self.current_break_start: Optional[datetime] = None
 
         # Absence tracking
         self.total_absence_time = timedelta()
@@ -161,8 +163,10 @@ class User:
         self.state = UserState.OFFLINE
         self.check_in_time = None
         self.check_out_time = None
+        self.work_start = None
         self.break_logs = []
         self.current_break = None
+        self.current_break_start = None
         self.last_state_change_time = datetime.now()
         self.daily_work_time = timedelta()
         self.is_overtime = False
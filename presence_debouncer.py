@@ -0,0 +1,120 @@
+import asyncio
+import time
+from collections import Counter, OrderedDict
+from config import Config
+from logger import logger
+from timer_wheel import TimerWheel
+
+
+class _Pending:
+    __slots__ = ("status", "first_seen", "events", "ready")
+
+    def __init__(self, status, first_seen):
+        self.status = status
+        self.first_seen = first_seen
+        self.events = 1
+        # Quiete raggiunta mentre una sincronizzazione dello stesso utente era in corso
+        self.ready = False
+
+
+class PresenceDebouncer:
+    """Debounce con coalescenza (trailing edge) degli eventi di presenza.
+
+    Ogni evento sostituisce lo stato in attesa dell'utente e riprogramma il suo timer
+    sulla timer wheel: la sincronizzazione parte solo dopo quiet secondi senza eventi e
+    applica sempre l'ultimo stato della raffica. Un utente che continua a oscillare viene
+    comunque sincronizzato entro max_wait secondi dal primo evento (TTL della voce).
+
+    La tabella contiene solo gli utenti in attesa ed è limitata a max_pending voci: oltre
+    il limite la voce più vecchia senza una sincronizzazione in corso viene sincronizzata
+    subito. Una sincronizzazione già partita non viene interrotta (detiene il lock
+    dell'utente e scrive sul database): se nel frattempo la quiete successiva è già
+    raggiunta, riparte al suo termine. Se tutte le voci in attesa hanno una
+    sincronizzazione in corso nessuna può essere anticipata: la tabella supera il limite
+    di al più il numero di sincronizzazioni in corso e stats["overflow_deferred"] lo conta.
+    """
+
+    def __init__(self, callback, quiet=None, max_wait=None, max_pending=None, tick=None):
+        # callback(key, status): coroutine che sincronizza l'utente
+        self.callback = callback
+        self.quiet = Config.PRESENCE_DEBOUNCE_SECONDS if quiet is None else quiet
+        self.max_wait = Config.PRESENCE_DEBOUNCE_MAX_WAIT if max_wait is None else max_wait
+        self.max_pending = Config.PRESENCE_DEBOUNCE_MAX_PENDING if max_pending is None else max_pending
+        self.pending = OrderedDict()
+        self.running = {}
+        self.timers = TimerWheel(tick=tick or Config.PRESENCE_DEBOUNCE_TICK, slots=Config.IDLE_TIMER_SLOTS)
+        self.stats = Counter()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def submit(self, key, status):
+        now = time.monotonic()
+        self.stats["events"] += 1
+        entry = self.pending.get(key)
+        if entry is None:
+            entry = self.pending[key] = _Pending(status, now)
+            if len(self.pending) > self.max_pending:
+                self._evict()
+                if key not in self.pending:
+                    # Sincronizzata subito dall'evizione
+                    return
+        else:
+            # L'evento precedente viene assorbito da questo: resta solo l'ultimo stato
+            entry.status = status
+            entry.events += 1
+            entry.ready = False
+            self.stats["coalesced"] += 1
+
+        delay = min(self.quiet, entry.first_seen + self.max_wait - now)
+        if delay > 0:
+            self.timers.schedule(key, delay, self._flush, key)
+        else:
+            self._flush(key)
+
+    def _evict(self):
+        # La voce più vecchia che può partire subito; quelle con una sincronizzazione in
+        # corso resterebbero comunque in tabella
+        oldest = next((key for key in self.pending if key not in self.running), None)
+        if oldest is None:
+            self.stats["overflow_deferred"] += 1
+            logger.warning("Presence debouncer over capacity: %s pending, all with a sync running", len(self.pending))
+            return
+        self.stats["overflow"] += 1
+        self._flush(oldest)
+
+    def _flush(self, key):
+        entry = self.pending.get(key)
+        if entry is None:
+            return
+        self.timers.cancel(key)
+        if key in self.running:
+            entry.ready = True
+            return
+        del self.pending[key]
+        self.stats["flushed"] += 1
+        self.running[key] = asyncio.get_running_loop().create_task(self._run(key, entry))
+
+    async def _run(self, key, entry):
+        try:
+            await self.callback(key, entry.status)
+        except Exception as e:
+            logger.error("Debounced sync for %s failed: %s", key, e)
+        finally:
+            del self.running[key]
+            waiting = self.pending.get(key)
+            if waiting is not None and waiting.ready:
+                self.stats["deferred"] += 1
+                self._flush(key)
+
+    async def drain(self):
+        """Attende che tutte le voci in attesa siano state sincronizzate."""
+        while self.pending or self.running:
+            if self.running:
+                await asyncio.gather(*list(self.running.values()), return_exceptions=True)
+            else:
+                await asyncio.sleep(self.timers.tick)
+
+    def stop(self):
+        self.timers.stop()
+        self.pending.clear()
@@ -0,0 +1,156 @@
+"""Profiler a campionamento dell'event loop, attivabile a caldo (vedi !profile in admin_commands).
+
+Un thread campiona ogni interval secondi lo stack del thread dell'event loop con
+sys._current_frames(): il loop non viene rallentato da hook di tracing e il costo resta
+quello di una lettura di stack per campione. Alla fine della finestra (o con stop)
+scrive un file in formato collapsed stack ("a;b;c conteggio", lo stesso letto da
+flamegraph.pl e speedscope) e prepara un riepilogo con le funzioni più presenti e la
+ripartizione per area (SQLite, YAML, logging, discord.py, loop inattivo).
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from config import Config
+from logger import logger
+
+MAX_DEPTH = 128
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Aree per la ripartizione del tempo: la prima che compare nello stack, dalla foglia
+# verso la radice, vince; il resto del codice del progetto è 'app'. Il loop fermo in
+# select() è tempo inattivo, non lavoro.
+AREAS = (
+    ('idle', ('selectors.py:select',)),
+    ('sqlite', ('sqlite3', 'database_manager.py', 'db_executor.py', 'database.py')),
+    ('yaml', ('yaml' + os.sep, 'transition_table.py')),
+    ('logging', ('logging' + os.sep, 'logger.py')),
+    ('discord', ('discord' + os.sep, 'aiohttp' + os.sep)),
+    ('state_machine', ('state_machine' + os.sep,)),
+)
+
+
+def frame_label(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def capture_stack(frame) -> Tuple[Tuple[str, str], ...]:
+    """Stack dalla radice alla foglia come coppie (percorso del file, etichetta)."""
+    stack = []
+    while frame is not None and len(stack) < MAX_DEPTH:
+        code = frame.f_code
+        stack.append((code.co_filename, frame_label(code)))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+def classify(stack) -> str:
+    for path, label in reversed(stack):
+        for area, markers in AREAS:
+            if any(marker in path or marker == label for marker in markers):
+                return area
+        if path.startswith(PROJECT_DIR):
+            return 'app'
+    return 'other'
+
+
+class SamplingProfiler:
+    def __init__(self, thread_id: int, interval: float = None, max_seconds: float = None,
+                 output_dir: str = None):
+        self.thread_id = thread_id
+        self.interval = interval or Config.PROFILE_INTERVAL_MS / 1000
+        # La finestra resta limitata anche quando la durata arriva dal comando
+        self.max_seconds = min(max_seconds or Config.PROFILE_MAX_SECONDS, Config.PROFILE_MAX_SECONDS)
+        self.output_dir = output_dir or Config.PROFILE_DIR
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started_at: Optional[datetime] = None
+        self.seconds = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        self.started_at = datetime.now()
+        self._thread = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+        self._thread.start()
+        logger.info("Profiler started on thread %s: every %.1fms for at most %ss",
+                    self.thread_id, self.interval * 1000, self.max_seconds)
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _sample_loop(self) -> None:
+        started = time.perf_counter()
+        deadline = started + self.max_seconds
+        while not self._stop.wait(self.interval) and time.perf_counter() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                break
+            self.stacks[capture_stack(frame)] += 1
+            self.samples += 1
+            # Il frame tiene vivi i locali del loop: lo rilasciamo subito
+            del frame
+        self.seconds = time.perf_counter() - started
+
+    def finish(self) -> Dict:
+        """Attende la fine del campionamento, scrive il file collapsed e restituisce il riepilogo.
+
+        Bloccante: dal loop va chiamata in un executor.
+        """
+        if self._thread is not None:
+            self._thread.join()
+        path = self.write_collapsed()
+        summary = self.summary()
+        summary['path'] = path
+        logger.info("Profiler stopped: %s samples in %.1fs written to %s", self.samples, self.seconds, path)
+        return summary
+
+    def write_collapsed(self) -> str:
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"profile-{self.started_at:%Y%m%d-%H%M%S}.collapsed")
+        with open(path, 'w', encoding='utf-8') as file:
+            for stack, count in self.stacks.most_common():
+                file.write(';'.join(label for _, label in stack) + f" {count}\n")
+        return path
+
+    def summary(self, top: int = None) -> Dict:
+        top = top or Config.PROFILE_TOP_N
+        own, total, areas = Counter(), Counter(), Counter()
+        for stack, count in self.stacks.items():
+            if not stack:
+                continue
+            own[stack[-1][1]] += count
+            for label in {label for _, label in stack}:
+                total[label] += count
+            areas[classify(stack)] += count
+        samples = self.samples or 1
+
+        def rows(counter: Counter) -> List[Tuple[str, int, float]]:
+            return [(label, count, count / samples * 100) for label, count in counter.most_common(top)]
+
+        return {
+            'samples': self.samples,
+            'seconds': self.seconds,
+            'self': rows(own),
+            'total': rows(total),
+            'areas': rows(areas),
+        }
+
+
+def format_summary(summary: Dict) -> str:
+    lines = [f"{summary['samples']} samples in {summary['seconds']:.1f}s -> {summary.get('path', '')}", "", "By area:"]
+    lines += [f"  {label:<14} {percent:5.1f}%" for label, _, percent in summary['areas']]
+    lines += ["", "Top self:"]
+    lines += [f"  {percent:5.1f}%  {label}" for label, _, percent in summary['self']]
+    lines += ["", "Top total:"]
+    lines += [f"  {percent:5.1f}%  {label}" for label, _, percent in summary['total']]
+    return "\n".join(lines)
@@ -0,0 +1,111 @@
+from datetime import datetime
+
+# Report di ore lavorate, pause ed eccedenza della pausa pranzo calcolati interamente
+# in SQL. Ogni raggruppamento corrisponde alle colonne della CTE per_log.
+REPORT_GROUPINGS = {
+    'user': ('user_id', 'user_name'),
+    'department': ('dept',),
+    'week': ('week',),
+    'day': ('day',),
+}
+
+# Raggruppamenti temporali: con uno di questi il report include il progressivo delle ore effettive
+TIME_GROUPINGS = ('week', 'day')
+
+_PER_LOG = '''
+WITH logs AS (
+    SELECT w.id, w.user_id, u.name AS user_name, COALESCE(u.dept, '') AS dept,
+           date(w.start_time, 'weekday 0', '-6 days') AS week,
+           date(w.start_time) AS day,
+           w.start_time, w.end_time,
+           COALESCE(w.end_time, :now) AS until,
+           (julianday(COALESCE(w.end_time, :now)) - julianday(w.start_time)) * 24 AS total_hours
+    FROM work_logs w
+    JOIN users u ON u.id = w.user_id
+    WHERE w.start_time >= :start AND w.start_time < :end {filters}
+),
+breaks AS (
+    SELECT l.id AS work_log_id,
+           SUM(CASE WHEN b.type = 'ON_BREAK_LUNCH' THEN 0
+                    ELSE (julianday(COALESCE(b.end_time, :now)) - julianday(b.start_time)) * 24 END) AS break_hours,
+           SUM(CASE WHEN b.type = 'ON_BREAK_LUNCH'
+                    THEN MAX((julianday(COALESCE(b.end_time, :now)) - julianday(b.start_time)) * 24 - :lunch_hours, 0)
+                    ELSE 0 END) AS lunch_excess_hours
+    FROM logs l
+    JOIN break_logs b ON b.user_id = l.user_id AND b.start_time >= l.start_time AND b.start_time < l.until
+    GROUP BY l.id
+),
+per_log AS (
+    SELECT l.*, l.id AS work_log_id,
+           COALESCE(b.break_hours, 0) AS break_hours,
+           COALESCE(b.lunch_excess_hours, 0) AS lunch_excess_hours,
+           l.total_hours - COALESCE(b.break_hours, 0) - COALESCE(b.lunch_excess_hours, 0) AS effective_hours
+    FROM logs l
+    LEFT JOIN breaks b ON b.work_log_id = l.id
+)
+'''
+
+
+def build_report_query(group_by=('user',), user_ids=None, dept=None, live_since=None):
+    """Restituisce (sql, parametri aggiuntivi) per un report raggruppato per group_by.
+
+    Ogni riga contiene le chiavi di raggruppamento, work_logs, first_start, last_end,
+    open_logs, total_hours, effective_hours, break_hours, lunch_excess_hours e
+    cumulative_effective_hours (progressivo per settimana/giorno, NULL senza
+    raggruppamento temporale). Le righe sono ordinate per chiave di raggruppamento.
+
+    Con live_since (istante ISO) i log iniziati prima vengono inclusi solo se ancora
+    aperti: è la parte del report che daily_summary, fatto solo di log chiusi, non copre.
+    """
+    unknown = [name for name in group_by if name not in REPORT_GROUPINGS]
+    if unknown:
+        raise ValueError(f"Unknown report grouping: {', '.join(unknown)}")
+
+    filters, params = [], {}
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        placeholders = ', '.join(f':user_{i}' for i in range(len(user_ids)))
+        filters.append(f"AND w.user_id IN ({placeholders})")
+        params.update({f'user_{i}': user_id for i, user_id in enumerate(user_ids)})
+    if dept is not None:
+        filters.append("AND u.dept = :dept")
+        params['dept'] = dept
+    if live_since is not None:
+        filters.append("AND (w.end_time IS NULL OR w.start_time >= :live_since)")
+        params['live_since'] = live_since
+
+    keys = [column for name in group_by for column in REPORT_GROUPINGS[name]]
+    time_keys = [column for name in group_by if name in TIME_GROUPINGS for column in REPORT_GROUPINGS[name]]
+    if time_keys:
+        partition = [column for column in keys if column not in time_keys]
+        partition_clause = f"PARTITION BY {', '.join(partition)} " if partition else ""
+        cumulative = f"SUM(SUM(effective_hours)) OVER ({partition_clause}ORDER BY {', '.join(time_keys)})"
+    else:
+        cumulative = "NULL"
+
+    select_keys = f"{', '.join(keys)}, " if keys else ""
+    grouping = f"GROUP BY {', '.join(keys)} ORDER BY {', '.join(keys)}" if keys else ""
+    sql = _PER_LOG.format(filters=' '.join(filters)) + f'''
+SELECT {select_keys}COUNT(*) AS work_logs,
+       MIN(start_time) AS first_start,
+       MAX(until) AS last_end,
+       SUM(end_time IS NULL) AS open_logs,
+       SUM(total_hours) AS total_hours,
+       SUM(effective_hours) AS effective_hours,
+       SUM(break_hours) AS break_hours,
+       SUM(lunch_excess_hours) AS lunch_excess_hours,
+       {cumulative} AS cumulative_effective_hours
+FROM per_log
+{grouping}
+'''
+    return sql, params
+
+
+def report_params(start, end, lunch_hours, now=None):
+    """Parametri comuni: intervallo semiaperto [start, end) già in ISO e ora corrente per i log aperti."""
+    return {
+        'start': start,
+        'end': end,
+        'now': (now or datetime.now()).isoformat(),
+        'lunch_hours': lunch_hours,
+    }
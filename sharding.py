@@ -0,0 +1,367 @@
+"""Deployment multi-processo: un gateway Discord, N worker di presenza e un writer.
+
+Il bot serve una sola guild (Config.GUILD_ID), che Discord assegna a un solo shard:
+dividere per shard lascerebbe tutto il lavoro a un processo. Gli utenti vengono invece
+partizionati per discord_id (partition_of) tra N worker.
+
+- Il processo writer possiede l'unica connessione in scrittura (con il group commit di
+  DatabaseExecutor); gli altri processi gli inviano le scritture su una coda IPC e
+  leggono in locale su connessioni in sola lettura (WAL).
+- Il gateway è l'unico processo connesso a Discord: esegue i comandi e inoltra ogni
+  cambio di presenza al worker che possiede l'utente. A ogni on_ready invia a ciascun
+  worker lo stato Discord dei suoi utenti.
+- Ogni worker esegue WorkTracker per la propria partizione, con debounce, timer wheel,
+  journal e riconciliazione, su un PresenceMirror al posto della guild.
+
+Anagrafica (UserDirectory) e calendario dei permessi (LeaveCalendar) sono cache di
+processo: le modifiche fatte dai comandi del gateway vengono notificate ai worker
+(DatabaseManager.change_listeners), che ricaricano la cache interessata.
+
+Ogni avvio di un processo ha un numero di incarnazione: le richieste al writer viaggiano
+con la coppia (incarnazione, id) e le risposte destinate a un processo morto, rimaste
+nella sua coda, vengono scartate da quello che lo sostituisce. Un worker riavviato
+chiede al gateway lo stato Discord dei suoi utenti.
+
+Uso:
+
+    python sharding.py --workers 4 [--db work_tracker.db]
+"""
+import argparse
+import asyncio
+import functools
+import itertools
+import multiprocessing
+import os
+import pickle
+import threading
+import time
+import zlib
+from concurrent.futures import Future, InvalidStateError
+from config import Config
+from db_executor import DatabaseExecutor
+from logger import logger
+from migrations import migrate
+
+# Attesa prima di riavviare un worker terminato con errore
+RESTART_DELAY = 5
+
+
+class IPCExecutor(DatabaseExecutor):
+    """DatabaseExecutor che inoltra le scritture al processo writer.
+
+    Le funzioni passate a transaction/run_sync devono essere serializzabili con pickle,
+    cioè definite a livello di modulo (come quelle di database_manager). Le letture
+    usano il pool locale della classe base.
+    """
+
+    # I commit sono quelli del processo writer condiviso, riportati nelle risposte
+    shared_writer = True
+
+    def __init__(self, db_name, worker_id, requests, responses, read_pool_size=4, incarnation=0):
+        self.worker_id = worker_id
+        self.incarnation = incarnation
+        self._requests = requests
+        self._responses = responses
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._request_ids = itertools.count()
+        super().__init__(db_name, read_pool_size=read_pool_size)
+
+    def _start_writer(self):
+        # Al posto del thread writer, un thread che consegna le risposte del processo writer
+        self._writer = threading.Thread(target=self._response_loop, name="db-ipc-responses", daemon=True)
+        self._writer.start()
+
+    def _stop_writer(self):
+        self._responses.put(((self.incarnation, None), None, None, self.commits))
+        self._writer.join()
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(RuntimeError("Database executor closed"))
+
+    def _response_loop(self):
+        while True:
+            (incarnation, request_id), result, error, commits = self._responses.get()
+            if incarnation != self.incarnation:
+                # Risposta per un'incarnazione precedente di questo worker
+                logger.debug("Dropping stale reply %s of incarnation %s", request_id, incarnation)
+                continue
+            if request_id is None:
+                break
+            self.commits = commits
+            with self._pending_lock:
+                future = self._pending.pop(request_id, None)
+            # Il chiamante può aver già rinunciato (timeout, task cancellato)
+            if future is None or future.done():
+                continue
+            try:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+            except InvalidStateError:
+                # Cancellato tra il controllo e la consegna
+                continue
+
+    def submit(self, fn, *args):
+        future = Future()
+        request_id = next(self._request_ids)
+        with self._pending_lock:
+            self._pending[request_id] = future
+        self._requests.put((self.worker_id, (self.incarnation, request_id), fn, args))
+        return future
+
+
+def _picklable(error):
+    try:
+        pickle.dumps(error)
+        return error
+    except Exception:
+        return RuntimeError(repr(error))
+
+
+def _reply(responses, tag, executor, future):
+    error = future.exception()
+    if error is not None:
+        responses.put((tag, None, _picklable(error), executor.commits))
+    else:
+        responses.put((tag, future.result(), None, executor.commits))
+
+
+def run_db_writer(db_name, requests, responses, ready):
+    """Processo writer: applica le scritture di tutti i worker con il group commit."""
+    executor = DatabaseExecutor(
+        db_name,
+        batch_size=Config.DB_COMMIT_BATCH_SIZE,
+        batch_interval=Config.DB_COMMIT_INTERVAL_MS / 1000,
+        read_pool_size=1,
+    )
+    executor.run_sync(migrate)
+    ready.set()
+    logger.info(f"Database writer ready on {db_name}")
+    try:
+        while True:
+            item = requests.get()
+            if item is None:
+                break
+            worker_id, tag, fn, args = item
+            future = executor.submit(fn, *args)
+            future.add_done_callback(functools.partial(_reply, responses[worker_id], tag, executor))
+    finally:
+        executor.close()
+        logger.info(f"Database writer stopped after {executor.commits} commits")
+
+
+def partition_of(discord_id, partitions):
+    # crc32 e non hash(): deve dare lo stesso risultato in tutti i processi
+    return zlib.crc32(str(discord_id).encode()) % partitions
+
+
+class _Member:
+    __slots__ = ("id", "status")
+
+    def __init__(self, member_id, status):
+        self.id = member_id
+        self.status = status
+
+
+class PresenceMirror:
+    """Stato Discord degli utenti di una partizione, ricevuto dal gateway.
+
+    Nel worker prende il posto di bot e guild per WorkTracker: get_guild restituisce il
+    mirror stesso e get_member un oggetto con id e status.
+    """
+
+    def __init__(self):
+        self.members = {}
+
+    def __len__(self):
+        return len(self.members)
+
+    def get_guild(self, guild_id):
+        return self
+
+    def get_member(self, member_id):
+        return self.members.get(int(member_id))
+
+    def update(self, discord_id, status):
+        member_id = int(discord_id)
+        self.members[member_id] = _Member(member_id, status)
+
+    def replace(self, statuses):
+        self.members = {int(discord_id): _Member(int(discord_id), status) for discord_id, status in statuses.items()}
+
+
+class PresenceRouter:
+    """Nel gateway: inoltra presenze e invalidazioni ai worker delle partizioni."""
+
+    def __init__(self, events, control):
+        self.events = events
+        self.control = control
+        self.guild = None
+
+    def owner(self, discord_id):
+        return partition_of(discord_id, len(self.events))
+
+    def forward(self, discord_id, status):
+        self.events[self.owner(discord_id)].put(("presence", discord_id, status))
+
+    def invalidate(self, kind):
+        for events in self.events:
+            events.put(("invalidate", kind))
+
+    def send_members(self, partition=None):
+        statuses = [{} for _ in self.events]
+        for member in self.guild.members:
+            statuses[self.owner(member.id)][str(member.id)] = str(member.status)
+        for index, events in enumerate(self.events):
+            if partition is None or index == partition:
+                events.put(("members", statuses[index]))
+
+    def start(self, guild):
+        """Da on_ready: invia a ogni worker lo stato dei suoi utenti e serve le richieste dei worker riavviati."""
+        first = self.guild is None
+        self.guild = guild
+        self.send_members()
+        if first:
+            loop = asyncio.get_running_loop()
+            threading.Thread(target=self._control_loop, args=(loop,), name="presence-control", daemon=True).start()
+
+    def _control_loop(self, loop):
+        while True:
+            partition = self.control.get()
+            loop.call_soon_threadsafe(self.send_members, partition)
+
+
+async def _serve_partition(main, mirror, partition, events, control):
+    loop = asyncio.get_running_loop()
+    await main.start_monitoring()
+    await main.work_tracker.load_users()
+    # Lo stato Discord degli utenti arriva dal gateway: subito se è già connesso, altrimenti al suo on_ready
+    control.put(partition)
+
+    inbox = asyncio.Queue()
+
+    def receive():
+        while True:
+            loop.call_soon_threadsafe(inbox.put_nowait, events.get())
+
+    threading.Thread(target=receive, name="presence-events", daemon=True).start()
+    tracking = False
+    while True:
+        message = await inbox.get()
+        kind = message[0]
+        if kind == "presence":
+            _, discord_id, status = message
+            mirror.update(discord_id, status)
+            main.presence_changed(discord_id, status)
+        elif kind == "members":
+            mirror.replace(message[1])
+            logger.info(f"Partition {partition}: received status of {len(mirror)} members")
+            if tracking:
+                await main.work_tracker.reconcile_states()
+            else:
+                tracking = True
+                await main.start_tracking()
+        elif kind == "invalidate":
+            await main.db_manager.invalidate(message[1])
+
+
+def run_worker(partition, incarnation, partitions, db_name, requests, responses, events, control):
+    """Processo worker: WorkTracker per gli utenti della partizione, senza connessione a Discord."""
+    import main
+
+    executor = IPCExecutor(
+        db_name, partition, requests, responses[partition],
+        read_pool_size=Config.DB_READ_POOL_SIZE, incarnation=incarnation,
+    )
+    mirror = PresenceMirror()
+    main.setup_tracker(mirror, executor, journal_name=f"transitions-part{partition}")
+    main.work_tracker.guild = mirror
+    if Config.METRICS_PORT:
+        main.metrics_port = Config.METRICS_PORT + 1 + partition
+    logger.info(f"Starting presence worker {partition}/{partitions}")
+    try:
+        asyncio.run(_serve_partition(main, mirror, partition, events[partition], control))
+    finally:
+        main.work_tracker.journal.close()
+        executor.close()
+
+
+def run_gateway(incarnation, partitions, db_name, requests, responses, events, control):
+    """Processo gateway: connessione a Discord e comandi; le presenze vanno ai worker."""
+    import main
+
+    executor = IPCExecutor(
+        db_name, partitions, requests, responses[partitions],
+        read_pool_size=Config.DB_READ_POOL_SIZE, incarnation=incarnation,
+    )
+    main.setup_components(executor=executor, router=PresenceRouter(events, control))
+    logger.info(f"Starting gateway for {partitions} presence workers")
+    main.run()
+
+
+def supervise(partitions, db_name):
+    context = multiprocessing.get_context("spawn")
+    requests = context.Queue()
+    # Una coda di risposte per worker più quella del gateway (indice partitions)
+    responses = [context.Queue() for _ in range(partitions + 1)]
+    events = [context.Queue() for _ in range(partitions)]
+    control = context.Queue()
+    ready = context.Event()
+
+    writer = context.Process(target=run_db_writer, args=(db_name, requests, responses, ready), name="db-writer")
+    writer.start()
+    ready.wait()
+
+    gateway_id = partitions
+    incarnations = {}
+
+    def start_process(process_id):
+        incarnations[process_id] = incarnation = incarnations.get(process_id, -1) + 1
+        if process_id == gateway_id:
+            target, args, name = run_gateway, (incarnation,), "gateway"
+        else:
+            target, args, name = run_worker, (process_id, incarnation), f"presence-{process_id}"
+        process = context.Process(
+            target=target, args=args + (partitions, db_name, requests, responses, events, control), name=name
+        )
+        process.start()
+        return process
+
+    processes = {process_id: start_process(process_id) for process_id in range(partitions + 1)}
+    try:
+        while processes:
+            time.sleep(1)
+            for process_id, process in list(processes.items()):
+                if process.is_alive():
+                    continue
+                if process.exitcode == 0:
+                    logger.info(f"Process {process.name} exited")
+                    del processes[process_id]
+                    continue
+                logger.error(f"Process {process.name} exited with code {process.exitcode}, restarting in {RESTART_DELAY}s")
+                time.sleep(RESTART_DELAY)
+                processes[process_id] = start_process(process_id)
+    except KeyboardInterrupt:
+        logger.info("Stopping processes")
+    finally:
+        for process in processes.values():
+            process.terminate()
+            process.join()
+        requests.put(None)
+        writer.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Avvio del bot in modalità multi-processo")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--db', default='work_tracker.db')
+    args = parser.parse_args()
+    supervise(args.workers, args.db)
+
+
+if __name__ == "__main__":
+    main()
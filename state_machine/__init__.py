@@ -1 +1,2 @@
-from .engine import StateMachine
\ No newline at end of file
+from .states import UserState
+from .engine import StateMachine
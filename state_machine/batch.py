@@ -0,0 +1,130 @@
+"""Valutazione vettoriale delle condizioni temporali su tutta la popolazione di utenti.
+
+Per le sweep periodiche: invece di far girare la StateMachine su ogni utente, ConditionBatch
+tiene work_start, current_break_start e last_state_change_time come array int64 di
+microsecondi dall'epoch, calcola le condizioni temporali di tutti gli utenti in un'unica
+passata NumPy e richiama la callback solo per gli utenti il cui risultato è
+cambiato dalla sweep precedente. Le regole sono quelle di callbacks.py, senza effetti
+collaterali: log e conteggio dell'assenza restano alla StateMachine, che gira solo
+sugli utenti selezionati.
+
+Ambito: serve le sweep della StateMachine (oggi DaySimulator e benchmarks/state_machine_sim).
+WorkTracker.reconcile_states non valuta condizioni temporali: confronta lo stato Discord
+con user.state, un confronto per utente che non ha nulla da vettorizzare, e lavora con
+user.User, privo dei break_logs letti qui. ConditionBatch entrerà nella sweep di
+produzione insieme alla StateMachine, non prima.
+"""
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Iterable, List
+import numpy as np
+from config import Config
+from models import BreakType, User
+from .callbacks import day_boundaries
+
+# Valore per gli istanti assenti (None): "mai", per cui nessuna durata supera una soglia
+MISSING = np.iinfo(np.int64).max
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+# Ordine delle righe della matrice dei risultati
+CONDITIONS = (
+    'is_work_time', 'is_lunch_time', 'is_buffer_time', 'is_holiday_or_weekend',
+    'break_exceeded', 'idle_time_exceeded', 'is_overtime', 'is_regular_work',
+)
+
+
+def to_epoch(instant) -> int:
+    """datetime naive -> microsecondi dall'epoch (MISSING per None)."""
+    return MISSING if instant is None else (instant - _EPOCH) // _MICROSECOND
+
+
+def _threshold(**kwargs) -> int:
+    return timedelta(**kwargs) // _MICROSECOND
+
+
+class ConditionBatch:
+    """Array per utente e risultati dell'ultima sweep.
+
+    Dopo una transizione o un cambio di stato client va chiamato refresh(user): la riga
+    viene ricaricata e l'utente torna tra i candidati della sweep successiva, perché
+    l'esito della StateMachine può cambiare anche a condizioni invariate. Un run senza
+    transizione con lo stesso stato client non richiede refresh: a parità di condizioni
+    il risultato sarebbe di nuovo lo stesso.
+    """
+
+    def __init__(self, users: Iterable[User] = ()):
+        self.load(users)
+
+    def load(self, users: Iterable[User]) -> None:
+        self.users: List[User] = list(users)
+        self.positions: Dict[int, int] = {user.id: position for position, user in enumerate(self.users)}
+        count = len(self.users)
+        self.work_start = np.full(count, MISSING, dtype=np.int64)
+        self.current_break_start = np.full(count, MISSING, dtype=np.int64)
+        self.last_state_change_time = np.full(count, MISSING, dtype=np.int64)
+        self.had_lunch = np.zeros(count, dtype=bool)
+        self.dirty = np.ones(count, dtype=bool)
+        self.previous = np.zeros((len(CONDITIONS), count), dtype=bool)
+        for position, user in enumerate(self.users):
+            self._load_row(position, user)
+
+    def _load_row(self, position: int, user: User) -> None:
+        self.work_start[position] = to_epoch(user.work_start)
+        self.current_break_start[position] = to_epoch(user.current_break_start)
+        self.last_state_change_time[position] = to_epoch(user.last_state_change_time)
+        self.had_lunch[position] = any(log.break_type == BreakType.ON_BREAK_LUNCH for log in user.break_logs)
+
+    def refresh(self, user: User) -> None:
+        position = self.positions[user.id]
+        self._load_row(position, user)
+        self.dirty[position] = True
+
+    def evaluate(self, current_time: datetime) -> np.ndarray:
+        """Matrice booleana (condizione, utente) nell'ordine di CONDITIONS."""
+        now = to_epoch(current_time)
+        day = day_boundaries(current_time.date())
+        count = len(self.users)
+
+        # Le condizioni che dipendono solo dall'orario sono uguali per tutti
+        work_time = day.work_start <= current_time <= day.work_end
+        lunch_window = day.lunch_buffer_start <= current_time < day.lunch_buffer_end
+        buffer_time = (day.work_buffer_start <= current_time < day.work_start
+                       or day.work_end < current_time <= day.work_buffer_end
+                       or day.lunch_buffer_start <= current_time < day.lunch_start
+                       or day.lunch_end < current_time < day.lunch_buffer_end)
+
+        # Con MISSING la differenza è molto negativa e nessuna soglia viene superata
+        on_break = now - self.current_break_start
+        since_change = now - self.last_state_change_time
+        worked = now - self.work_start
+        regular = _threshold(hours=Config.REGULAR_WORK_HOURS)
+
+        results = np.empty((len(CONDITIONS), count), dtype=bool)
+        results[0] = work_time
+        results[1] = lunch_window
+        results[1] &= ~self.had_lunch
+        results[2] = buffer_time
+        results[3] = current_time.weekday() >= 5
+        # break_exceeded è vera oltre la più breve delle due soglie (pausa breve o estesa)
+        results[4] = on_break > _threshold(minutes=min(Config.BREAK_DURATION, Config.MAX_EXTENDED_BREAK_DURATION))
+        results[5] = since_change > _threshold(minutes=Config.IDLE_BUFFER_TIME)
+        results[6] = worked > regular
+        results[7] = (worked > 0) & (worked <= regular)
+        return results
+
+    def changed(self, current_time: datetime) -> np.ndarray:
+        """Posizioni degli utenti con almeno una condizione cambiata (o ricaricati) dall'ultima sweep."""
+        results = self.evaluate(current_time)
+        changed = (results != self.previous).any(axis=0)
+        changed |= self.dirty
+        self.previous = results
+        self.dirty[:] = False
+        return np.flatnonzero(changed)
+
+    async def sweep(self, current_time: datetime, callback: Callable[[User], Awaitable[None]]) -> int:
+        """Richiama callback(user) per gli utenti selezionati da changed; restituisce quanti sono."""
+        positions = self.changed(current_time)
+        for position in positions.tolist():
+            await callback(self.users[position])
+        return len(positions)
@@ -1,16 +1,94 @@
 from logger import logger
+from collections import namedtuple
+from contextvars import ContextVar
 from datetime import datetime, time, timedelta
+from functools import lru_cache
+from time import perf_counter
 from models import User, UserState, BreakLog, BreakType
 from database import Database
 from config import Config
+from metrics import metrics
+
+# Contesto di valutazione
+
+DayBoundaries = namedtuple('DayBoundaries', [
+    'work_start', 'work_end', 'work_buffer_start', 'work_buffer_end',
+    'lunch_start', 'lunch_end', 'lunch_buffer_start', 'lunch_buffer_end',
+    'offline_limit',
+])
+
+@lru_cache(maxsize=8)
+def day_boundaries(current_date) -> DayBoundaries:
+    """Orari di lavoro, pranzo e buffer di una giornata, calcolati una sola volta per data."""
+    work_start = time_to_datetime(Config.WORK_START_TIME, current_date)
+    work_end = time_to_datetime(Config.WORK_END_TIME, current_date)
+    lunch_start = time_to_datetime(Config.LUNCH_START_TIME, current_date)
+    lunch_end = time_to_datetime(Config.LUNCH_END_TIME, current_date)
+    return DayBoundaries(
+        work_start=work_start,
+        work_end=work_end,
+        work_buffer_start=work_start - timedelta(minutes=Config.WORK_BUFFER_BEFORE),
+        work_buffer_end=work_end + timedelta(minutes=Config.WORK_BUFFER_AFTER),
+        lunch_start=lunch_start,
+        lunch_end=lunch_end,
+        lunch_buffer_start=lunch_start - timedelta(minutes=Config.LUNCH_BUFFER_BEFORE),
+        lunch_buffer_end=lunch_end + timedelta(minutes=Config.LUNCH_BUFFER_AFTER),
+        offline_limit=time_to_datetime(Config.CHECK_OFFLINE_LIMIT_TIME, current_date),
+    )
+
+class EvaluationContext:
+    """Risultati delle condizioni per una singola valutazione (user, current_time, mapped_status)."""
+    __slots__ = ('user', 'current_time', 'mapped_status', 'results', 'evaluations', 'hits')
+
+    def __init__(self, user: User, current_time: datetime, mapped_status: str):
+        self.user = user
+        self.current_time = current_time
+        self.mapped_status = mapped_status
+        self.results = {}
+        self.evaluations = 0
+        self.hits = 0
+
+    def matches(self, user: User, current_time: datetime, mapped_status: str) -> bool:
+        return self.user is user and self.current_time == current_time and self.mapped_status == mapped_status
+
+evaluation_context: ContextVar = ContextVar('evaluation_context', default=None)
+
+# Istogramma della durata di ogni condizione, risolto alla prima valutazione
+_condition_seconds = {}
+
+def _condition_histogram(condition):
+    histogram = _condition_seconds.get(condition)
+    if histogram is None:
+        histogram = _condition_seconds[condition] = metrics.histogram(
+            'condition_seconds', 'Durata delle condizioni della macchina a stati', condition=condition.__name__
+        )
+    return histogram
+
+async def _timed_condition(condition, user: User, current_time: datetime, mapped_status: str, db: Database) -> bool:
+    started = perf_counter()
+    try:
+        return await condition(user, current_time, mapped_status, db)
+    finally:
+        _condition_histogram(condition).observe(perf_counter() - started)
+
+async def evaluate(condition, user: User, current_time: datetime, mapped_status: str, db: Database) -> bool:
+    """Valuta una condizione riusando il risultato già calcolato nel contesto corrente, se presente."""
+    context = evaluation_context.get()
+    if context is None or not context.matches(user, current_time, mapped_status):
+        return await _timed_condition(condition, user, current_time, mapped_status, db)
+    if condition in context.results:
+        context.hits += 1
+        return context.results[condition]
+    context.evaluations += 1
+    result = context.results[condition] = await _timed_condition(condition, user, current_time, mapped_status, db)
+    return result
 
 # Funzioni di condizione
 
 async def is_work_time(user: User, current_time: datetime, mapped_status: str, db: Database) -> bool:
-    work_start = time_to_datetime(Config.WORK_START_TIME, current_time.date())
-    work_end = time_to_datetime(Config.WORK_END_TIME, current_time.date())
-    result = work_start <= current_time <= work_end
-    logger.debug(f"is_work_time for {user.full_name} at {current_time} with status {mapped_status}: {result}")
+    day = day_boundaries(current_time.date())
+    result = day.work_start <= current_time <= day.work_end
+    logger.debug("is_work_time for %s at %s with status %s: %s", user.full_name, current_time, mapped_status, result)
     return result
 
 async def is_lunch_time(user: User, current_time: datetime, mapped_status: str, db: Database) -> bool:
@@ -18,40 +96,29 @@ async def is_lunch_time(user: User, current_time: datetime, mapped_status: str,
     if any(break_log.break_type == BreakType.ON_BREAK_LUNCH for break_log in user.break_logs):
         return False
 
-    lunch_start = time_to_datetime(Config.LUNCH_START_TIME, current_time.date())
-    lunch_end = time_to_datetime(Config.LUNCH_END_TIME, current_time.date())
-    buffer_before = timedelta(minutes=Config.LUNCH_BUFFER_BEFORE)
-    buffer_after = timedelta(minutes=Config.LUNCH_BUFFER_AFTER)
+    day = day_boundaries(current_time.date())
 
     # Verificare se l'orario corrente rientra nel periodo della pausa pranzo, incluso il buffer
-    result = (lunch_start - buffer_before) <= current_time < (lunch_end + buffer_after)
-    logger.debug(f"is_lunch_time for {user.full_name} at {current_time} with status {mapped_status}: {result}")
+    result = day.lunch_buffer_start <= current_time < day.lunch_buffer_end
+    logger.debug("is_lunch_time for %s at %s with status %s: %s", user.full_name, current_time, mapped_status, result)
     return result
 
 
 async def is_break_time(user: User, current_time: datetime, mapped_status: str, db: Database) -> bool:
-    is_work = await is_work_time(user, current_time, mapped_status, db)
-    is_not_lunch = await is_not_lunch_time(user, current_time, mapped_status, db)
+    is_work = await evaluate(is_work_time, user, current_time, mapped_status, db)
+    is_not_lunch = await evaluate(is_not_lunch_time, user, current_time, mapped_status, db)
     result = is_work and is_not_lunch and mapped_status in ['SHORT_BREAK', 'IDLE']
-    logger.debug(f"is_break_time for {user.full_name} at {current_time} with status {mapped_status}: {result}")
+    logger.debug("is_break_time for %s at %s with status %s: %s", user.full_name, current_time, mapped_status, result)
     return result
 
 async def is_buffer_time(user: User, current_time: datetime, mapped_status: str, db: Database) -> bool:
-    work_start = time_to_datetime(Config.WORK_START_TIME, current_time.date())
-    work_end = time_to_datetime(Config.WORK_END_TIME, current_time.date())
-    lunch_start = time_to_datetime(Config.LUNCH_START_TIME, current_time.date())
-    lunch_end = time_to_datetime(Config.LUNCH_END_TIME, current_time.date())
-    
-    work_buffer_before = timedelta(hours=1)
-    work_buffer_after = timedelta(hours=1)
-    lunch_buffer_before = timedelta(minutes=Config.LUNCH_BUFFER_BEFORE)
-    lunch_buffer_after = timedelta(minutes=Config.LUNCH_BUFFER_AFTER)
+    day = day_boundaries(current_time.date())
     
-    is_work_buffer = (work_start - work_buffer_before) <= current_time < work_start or work_end < current_time <= (work_end + work_buffer_after)
-    is_lunch_buffer = (lunch_start - lunch_buffer_before) <= current_time < lunch_start or lunch_end < current_time < (lunch_end + lunch_buffer_after)
+    is_work_buffer = day.work_buffer_start <= current_time < day.work_start or day.work_end < current_time <= day.work_buffer_end
+    is_lunch_buffer = day.lunch_buffer_start <= current_time < day.lunch_start or day.lunch_end < current_time < day.lunch_buffer_end
     
     result = is_work_buffer or is_lunch_buffer
-    logger.debug(f"is_buffer_time for {user.full_name} at {current_time}: {result}")
+    logger.debug("is_buffer_time for %s at %s: %s", user.full_name, current_time, result)
     return result
 
 async def break_exceeded(user: User, current_time: datetime, mapped_status: str, db: Database) -> bool:
@@ -61,12 +128,12 @@ async def break_exceeded(user: User, current_time: datetime, mapped_status: str,
         if break_duration > timedelta(minutes=Config.MAX_EXTENDED_BREAK_DURATION):
             excess_time = break_duration - timedelta(minutes=Config.MAX_EXTENDED_BREAK_DURATION)
             user.total_absence_time += excess_time
-            logger.warning(f"{user.full_name} exceeded extended break by {excess_time}. Total absence time: {user.total_absence_time}")
+            logger.warning("%s exceeded extended break by %s. Total absence time: %s", user.full_name, excess_time, user.total_absence_time)
             return True
         
         elif break_duration > timedelta(minutes=Config.BREAK_DURATION):
             excess_time = break_duration - timedelta(minutes=Config.BREAK_DURATION)
-            logger.warning(f"{user.full_name} exceeded short break by {excess_time}")
+            logger.warning("%s exceeded short break by %s", user.full_name, excess_time)
             return True
     
     return False
@@ -74,7 +141,7 @@ async def break_exceeded(user: User, current_time: datetime, mapped_status: str,
 async def idle_time_exceeded(user: User, current_time: datetime, mapped_status: str = None, db: Database = None) -> bool:
     if user.last_state_change_time:
         if (current_time - user.last_state_change_time) > timedelta(minutes=Config.IDLE_BUFFER_TIME):
-            logger.debug(f"idle_time_exceeded for {user.full_name} at {current_time}: {True}")
+            logger.debug("idle_time_exceeded for %s at %s: %s", user.full_name, current_time, True)
             return True
     return False
 
@@ -82,7 +149,7 @@ async def is_overtime(user: User, current_time: datetime, db: Database, mapped_s
     if user.work_start:
         work_duration = current_time - user.work_start
         result = work_duration > timedelta(hours=Config.REGULAR_WORK_HOURS)
-        logger.debug(f"is_overtime for {user.full_name} at {current_time}: {result}")
+        logger.debug("is_overtime for %s at %s: %s", user.full_name, current_time, result)
         return result
     return False
 
@@ -90,18 +157,18 @@ async def is_regular_work(user: User, current_time: datetime, mapped_status: str
     if user.work_start:
         work_duration = current_time - user.work_start
         result = timedelta(hours=Config.REGULAR_WORK_HOURS) >= work_duration > timedelta()
-        logger.debug(f"is_regular_work for {user.full_name} at {current_time}: {result}")
+        logger.debug("is_regular_work for %s at %s: %s", user.full_name, current_time, result)
         return result
     return False
 
 async def is_holiday_or_weekend(user: User, current_time: datetime, mapped_status: str, db: Database) -> bool:
     result = current_time.weekday() >= 5
-    logger.debug(f"is_holiday_or_weekend for {user.full_name} at {current_time}: {result}")
+    logger.debug("is_holiday_or_weekend for %s at %s: %s", user.full_name, current_time, result)
     return result
 
 async def is_authorized_absence(user: User, current_time: datetime, mapped_status: str, db: Database) -> bool:
     if user.state != UserState.OFFLINE or mapped_status != 'OFFLINE':
-        logger.debug(f"User {user.full_name} is not in OFFLINE state or client status is not OFFLINE")
+        logger.debug("User %s is not in OFFLINE state or client status is not OFFLINE", user.full_name)
         return False
 
     leave_status = await db.check_user_leave(user, current_time)
@@ -109,7 +176,7 @@ async def is_authorized_absence(user: User, current_time: datetime, mapped_statu
     if leave_status:
         leave_type = leave_status['type']
         if leave_type in ['sick', 'holidays']:
-            logger.warning(f"User {user.full_name} has an authorized {leave_type} leave")
+            logger.warning("User %s has an authorized %s leave", user.full_name, leave_type)
             return True
         elif leave_type == 'work permit':
             if 'start_time' in leave_status and 'end_time' in leave_status:
@@ -117,63 +184,57 @@ async def is_authorized_absence(user: User, current_time: datetime, mapped_statu
                 end_time = datetime.strptime(leave_status['end_time'], "%H:%M").time()
                 current_time_only = current_time.time()
                 if start_time <= current_time_only <= end_time:
-                    logger.debug(f"User {user.full_name} has a valid work permit from {start_time} to {end_time}")
+                    logger.debug("User %s has a valid work permit from %s to %s", user.full_name, start_time, end_time)
                     return True
                 else:
-                    logger.debug(f"User {user.full_name} has a work permit, but current time {current_time_only} is outside permitted hours {start_time} - {end_time}")
+                    logger.debug("User %s has a work permit, but current time %s is outside permitted hours %s - %s", user.full_name, current_time_only, start_time, end_time)
             else:
-                logger.debug(f"User {user.full_name} has a work permit for the entire day")
+                logger.debug("User %s has a work permit for the entire day", user.full_name)
                 return True
 
-    work_start = datetime.combine(current_time.date(), time.fromisoformat(Config.WORK_START_TIME))
-    work_end = datetime.combine(current_time.date(), time.fromisoformat(Config.WORK_END_TIME))
+    day = day_boundaries(current_time.date())
     
-    if current_time < work_start or current_time > work_end:
-        logger.debug(f"User {user.full_name} is absent outside of work hours")
+    if current_time < day.work_start or current_time > day.work_end:
+        logger.debug("User %s is absent outside of work hours", user.full_name)
         return True
 
-    lunch_start = datetime.combine(current_time.date(), time.fromisoformat(Config.LUNCH_START_TIME))
-    lunch_end = datetime.combine(current_time.date(), time.fromisoformat(Config.LUNCH_END_TIME))
-    
-    if lunch_start <= current_time <= lunch_end:
-        logger.debug(f"User {user.full_name} is absent during lunch break")
+    if day.lunch_start <= current_time <= day.lunch_end:
+        logger.debug("User %s is absent during lunch break", user.full_name)
         return True
 
-    offline_limit_time = datetime.combine(current_time.date(), time.fromisoformat(Config.CHECK_OFFLINE_LIMIT_TIME))
-    if current_time <= offline_limit_time:
-        logger.debug(f"User {user.full_name} is absent but within the allowed offline limit time")
+    if current_time <= day.offline_limit:
+        logger.debug("User %s is absent but within the allowed offline limit time", user.full_name)
         return True
 
-    logger.warning(f"Unauthorized absence detected for user {user.full_name} at {current_time}")
+    logger.warning("Unauthorized absence detected for user %s at %s", user.full_name, current_time)
     return False
 
 async def is_unauthorized_absence(user: User, current_time: datetime, mapped_status: str, db: Database) -> bool:
-    result = not await is_authorized_absence(user, current_time, mapped_status, db)
-    logger.debug(f"is_unauthorized_absence for {user.full_name} at {current_time}: {result}")
+    result = not await evaluate(is_authorized_absence, user, current_time, mapped_status, db)
+    logger.debug("is_unauthorized_absence for %s at %s: %s", user.full_name, current_time, result)
     return result
 
 async def is_not_work_time(user: User, current_time: datetime, mapped_status: str, db: Database) -> bool:
-    result = not await is_work_time(user, current_time, mapped_status, db)
-    logger.debug(f"is_not_work_time for {user.full_name} at {current_time}: {result}")
+    result = not await evaluate(is_work_time, user, current_time, mapped_status, db)
+    logger.debug("is_not_work_time for %s at %s: %s", user.full_name, current_time, result)
     return result
 
 async def is_not_lunch_time(user: User, current_time: datetime, mapped_status: str, db: Database) -> bool:
-    result = not await is_lunch_time(user, current_time, mapped_status, db)
-    logger.debug(f"is_not_lunch_time for {user.full_name} at {current_time} with status {mapped_status}: {result}")
+    result = not await evaluate(is_lunch_time, user, current_time, mapped_status, db)
+    logger.debug("is_not_lunch_time for %s at %s with status %s: %s", user.full_name, current_time, mapped_status, result)
     return result
     # logger.info(f"is_not_lunch_time for {user.full_name} at {current_time} with status {mapped_status}: {result}")
     # return result
 
 async def is_not_holiday_or_weekend(user: User, current_time: datetime, mapped_status: str, db: Database) -> bool:
-    result = not await is_holiday_or_weekend(user, current_time, mapped_status, db)
-    logger.debug(f"is_not_holiday_or_weekend for {user.full_name} at {current_time}: {result}")
+    result = not await evaluate(is_holiday_or_weekend, user, current_time, mapped_status, db)
+    logger.debug("is_not_holiday_or_weekend for %s at %s: %s", user.full_name, current_time, result)
     return result
 
 async def is_within_work_hours(user: User, current_time: datetime, mapped_status: str, db: Database) -> bool:
-    work_start = time_to_datetime(Config.WORK_START_TIME, current_time.date())
-    work_end = time_to_datetime(Config.WORK_END_TIME, current_time.date())
-    result = work_start <= current_time <= work_end or await is_buffer_time(user, current_time, mapped_status, db)
-    logger.debug(f"is_within_work_hours for {user.full_name} at {current_time}: {result}")
+    day = day_boundaries(current_time.date())
+    result = day.work_start <= current_time <= day.work_end or await evaluate(is_buffer_time, user, current_time, mapped_status, db)
+    logger.debug("is_within_work_hours for %s at %s: %s", user.full_name, current_time, result)
     return result
 
 
@@ -181,15 +242,15 @@ async def is_within_work_hours(user: User, current_time: datetime, mapped_status
 
 async def log_start_work(user: User, current_time: datetime, new_state: UserState, mapped_status: str, db: Database) -> None:
     if not check_transition_safety(user.state, new_state):
-        logger.warning(f"Unsafe transition attempted: {user.state} -> {new_state}")
+        logger.warning("Unsafe transition attempted: %s -> %s", user.state, new_state)
         return
     user.state = new_state
     user.check_in(current_time)
-    logger.info(f"Started work for {user.full_name} at {current_time} with status {mapped_status}")
+    logger.info("Started work for %s at %s with status %s", user.full_name, current_time, mapped_status)
 
 async def log_end_work(user: User, current_time: datetime, new_state: UserState, mapped_status: str, db: Database) -> None:
     if not check_transition_safety(user.state, new_state):
-        logger.warning(f"Unsafe transition attempted: {user.state} -> {new_state}")
+        logger.warning("Unsafe transition attempted: %s -> %s", user.state, new_state)
         return
     previous_state = user.state
     user.check_out(current_time)
@@ -199,26 +260,26 @@ async def log_end_work(user: User, current_time: datetime, new_state: UserState,
     if user.check_in_time:
         total_work_time = current_time - user.check_in_time
         effective_work_time = total_work_time - user.get_total_break_time()
-        logger.info(f"Ended work for {user.full_name}.")
-        logger.info(f"Check-in time: {user.check_in_time}")
-        logger.info(f"Check-out time: {current_time}")
-        logger.info(f"Total work time: {total_work_time}")
-        logger.info(f"Effective work time: {effective_work_time}")
-        logger.info(f"Total break time: {user.get_total_break_time()}")
-        logger.info(f"Total excess break time: {user.get_total_excess_break_time()}")
-        logger.info(f"Total absence time: {user.total_absence_time}")
+        logger.info("Ended work for %s.", user.full_name)
+        logger.info("Check-in time: %s", user.check_in_time)
+        logger.info("Check-out time: %s", current_time)
+        logger.info("Total work time: %s", total_work_time)
+        logger.info("Effective work time: %s", effective_work_time)
+        logger.info("Total break time: %s", user.get_total_break_time())
+        logger.info("Total excess break time: %s", user.get_total_excess_break_time())
+        logger.info("Total absence time: %s", user.total_absence_time)
 
         for break_log in user.break_logs:
-            logger.info(f"Break: {break_log}")
+            logger.info("Break: %s", break_log)
     else:
-        logger.warning(f"No check-in time recorded for {user.full_name}")
+        logger.warning("No check-in time recorded for %s", user.full_name)
 
     user.end_work(current_time)
-    logger.debug(f"{user.full_name}: {previous_state.value} -> {new_state.value} at {current_time}")
+    logger.debug("%s: %s -> %s at %s", user.full_name, previous_state.value, new_state.value, current_time)
 
 async def log_start_break(user: User, current_time: datetime, new_state: UserState, mapped_status: str, db: Database) -> None:
     if not check_transition_safety(user.state, new_state):
-        logger.warning(f"Unsafe transition attempted: {user.state} -> {new_state}")
+        logger.warning("Unsafe transition attempted: %s -> %s", user.state, new_state)
         return
     previous_state = user.state
     user.state = new_state
@@ -230,11 +291,11 @@ async def log_start_break(user: User, current_time: datetime, new_state: UserSta
     break_type = BreakType.ON_BREAK_LUNCH if new_state == UserState.ON_BREAK_LUNCH else BreakType.SHORT_BREAK
     user.break_logs.append(BreakLog(user_id=user.id, break_type=break_type, start_time=current_time))
     
-    logger.debug(f"{user.full_name}: {previous_state.value} -> {new_state.value} ({break_type.value}) at {current_time}")
+    logger.debug("%s: %s -> %s (%s) at %s", user.full_name, previous_state.value, new_state.value, break_type.value, current_time)
 
 async def log_end_break(user: User, current_time: datetime, new_state: UserState, mapped_status: str, db: Database) -> None:
     if not check_transition_safety(user.state, new_state):
-        logger.warning(f"Unsafe transition attempted: {user.state} -> {new_state}")
+        logger.warning("Unsafe transition attempted: %s -> %s", user.state, new_state)
         return
     
     previous_state = user.state
@@ -248,16 +309,16 @@ async def log_end_break(user: User, current_time: datetime, new_state: UserState
         break_type = user.break_logs[-1].break_type.value
         break_duration = user.break_logs[-1].get_duration()
         
-        logger.info(f"{user.full_name}: {previous_state.value} ({break_type}) -> {new_state.value} at {current_time}. Break duration: {break_duration}")
+        logger.info("%s: %s (%s) -> %s at %s. Break duration: %s", user.full_name, previous_state.value, break_type, new_state.value, current_time, break_duration)
         
         if break_type == "ON_BREAK_LUNCH":
-            logger.info(f"Ended lunch break for {user.full_name}. Duration: {break_duration}")
+            logger.info("Ended lunch break for %s. Duration: %s", user.full_name, break_duration)
             if user.break_logs[-1].excess_time > timedelta():
-                logger.warning(f"{user.full_name} exceeded lunch break by {user.break_logs[-1].excess_time}")
+                logger.warning("%s exceeded lunch break by %s", user.full_name, user.break_logs[-1].excess_time)
             elif user.break_logs[-1].excess_time < timedelta():
-                logger.info(f"{user.full_name} took a shorter lunch break by {abs(user.break_logs[-1].excess_time)}")
+                logger.info("%s took a shorter lunch break by %s", user.full_name, abs(user.break_logs[-1].excess_time))
         
-        logger.debug(f"Total break time for {user.full_name}: {user.get_total_break_time()}")
+        logger.debug("Total break time for %s: %s", user.full_name, user.get_total_break_time())
 
     # Resetta la pausa corrente per il prossimo utilizzo
     user.current_break = None
@@ -268,46 +329,46 @@ async def log_end_break(user: User, current_time: datetime, new_state: UserState
 
 async def log_start_overtime(user: User, current_time: datetime, new_state: UserState, mapped_status: str, db: Database) -> None:
     if not check_transition_safety(user.state, new_state):
-        logger.warning(f"Unsafe transition attempted: {user.state} -> {new_state}")
+        logger.warning("Unsafe transition attempted: %s -> %s", user.state, new_state)
         return
     previous_state = user.state
     user.state = new_state
     user.last_state_change_time = current_time
     user.start_overtime()
-    logger.debug(f"{user.full_name}: {previous_state.value} -> {new_state.value} (Started overtime) at {current_time}")
+    logger.debug("%s: %s -> %s (Started overtime) at %s", user.full_name, previous_state.value, new_state.value, current_time)
 
 async def log_end_overtime(user: User, current_time: datetime, new_state: UserState, mapped_status: str, db: Database) -> None:
     if not check_transition_safety(user.state, new_state):
-        logger.warning(f"Unsafe transition attempted: {user.state} -> {new_state}")
+        logger.warning("Unsafe transition attempted: %s -> %s", user.state, new_state)
         return
     previous_state = user.state
     user.state = new_state
     user.last_state_change_time = current_time
     user.end_overtime()
-    logger.debug(f"{user.full_name}: {previous_state.value} -> {new_state.value} (Ended overtime) at {current_time}")
+    logger.debug("%s: %s -> %s (Ended overtime) at %s", user.full_name, previous_state.value, new_state.value, current_time)
 
 async def log_start_holiday_work(user: User, current_time: datetime, new_state: UserState, mapped_status: str, db: Database) -> None:
     if not check_transition_safety(user.state, new_state):
-        logger.warning(f"Unsafe transition attempted: {user.state} -> {new_state}")
+        logger.warning("Unsafe transition attempted: %s -> %s", user.state, new_state)
         return
     previous_state = user.state
     user.state = new_state
     user.last_state_change_time = current_time
     user.start_work(current_time, is_holiday=True)
-    logger.debug(f"{user.full_name}: {previous_state.value} -> {new_state.value} (Started holiday work) at {current_time}")
+    logger.debug("%s: %s -> %s (Started holiday work) at %s", user.full_name, previous_state.value, new_state.value, current_time)
 
 async def log_unauthorized_absence(user: User, current_time: datetime, new_state: UserState, mapped_status: str, db: Database) -> None:
     if not check_transition_safety(user.state, new_state):
-        logger.warning(f"Unsafe transition attempted: {user.state} -> {new_state}")
+        logger.warning("Unsafe transition attempted: %s -> %s", user.state, new_state)
         return
     user.state = new_state
     absence_duration = user.calculate_absence_time(current_time)
-    logger.warning(f"Unauthorized absence detected for {user.full_name} at {current_time}. Total absence duration: {absence_duration}")
+    logger.warning("Unauthorized absence detected for %s at %s. Total absence duration: %s", user.full_name, current_time, absence_duration)
 
 async def log_end_unauthorized_absence(user: User, current_time: datetime, new_state: UserState, mapped_status: str, db: Database) -> None:
     if user.current_break_start:
         absence_duration = current_time - user.current_break_start
-        logger.warning(f"Unauthorized absence ended for {user.full_name}. Duration: {absence_duration}")
+        logger.warning("Unauthorized absence ended for %s. Duration: %s", user.full_name, absence_duration)
         user.total_absence_time += absence_duration
         user.current_break_start = None
     user.state = new_state
@@ -360,7 +421,7 @@ def sort_transitions_by_priority(transitions: list) -> list:
 def map_status(status: str) -> str:
     status_mapping = Config.load_status_mapping()
     mapped_status = status_mapping.get(status, status).upper()
-    logger.debug(f"Mapped client status '{status}' to '{mapped_status}'")
+    logger.debug("Mapped client status '%s' to '%s'", status, mapped_status)
     return mapped_status
 
 def time_to_datetime(t: str, current_date: datetime.date) -> datetime:
@@ -1,25 +1,55 @@
-import yaml
 from datetime import datetime, time
-from typing import Optional, Any, Dict
+from time import perf_counter
+from typing import Optional, Any
 from models import User, UserState
 from logger import logger
 from database import Database
-from .callbacks import sort_transitions_by_priority, map_status
+from .transition_table import CompiledTransition, TransitionTable
+from .callbacks import EvaluationContext, evaluate, evaluation_context
 from config import Config
+from metrics import metrics
 import importlib
 
+_run_seconds = metrics.histogram('state_machine_run_seconds', 'Durata di StateMachine.run')
+# Latenza delle transizioni per (stato di partenza, stato di arrivo), risolta alla prima occorrenza
+_transition_seconds = {}
+
+def _transition_histogram(from_state: str, to_state: str):
+    histogram = _transition_seconds.get((from_state, to_state))
+    if histogram is None:
+        histogram = _transition_seconds[(from_state, to_state)] = metrics.histogram(
+            'state_transition_seconds', 'Durata di StateMachine.run che ha prodotto la transizione',
+            from_state=from_state, to_state=to_state
+        )
+    return histogram
+
 class StateMachine:
-    def __init__(self, config_file: str = 'state_machine/transitions.yaml', db: Database = None):
-        with open(config_file, 'r') as file:
-            self.transitions = yaml.safe_load(file)
+    def __init__(self, config_file: str = Config.TRANSITIONS_FILE, db: Database = None,
+                 mapping_file: str = Config.STATUS_MAPPING_FILE):
         self.callbacks_module = importlib.import_module('.callbacks', package=__package__)
+        self.table = TransitionTable(config_file, mapping_file, self.callbacks_module)
         self.db = db or Database()
         self.interactive_mode = Config.INTERACTIVE_MODE
+        # Contesto dell'ultima valutazione: condizioni effettivamente calcolate e risultati riusati
+        self.last_evaluation: Optional[EvaluationContext] = None
 
     async def run(self, user: User, client_status: str, simulate_time: Optional[datetime] = None) -> Any:
+        started = perf_counter()
+        previous_state = user.state.value
+        try:
+            new_state = await self._run(user, client_status, simulate_time)
+        finally:
+            elapsed = perf_counter() - started
+            _run_seconds.observe(elapsed)
+        if new_state != previous_state:
+            _transition_histogram(previous_state, new_state).observe(elapsed)
+        return new_state
+
+    async def _run(self, user: User, client_status: str, simulate_time: Optional[datetime] = None) -> Any:
         current_time = self.get_current_time(simulate_time)
+        self.table.refresh_if_changed()
         mapped_status = self.map_client_status(client_status)
-        logger.debug(f"Running state machine for user {user.name}, current state: {user.state.value}, client status: {client_status}, mapped status: {mapped_status}")
+        logger.debug("Running state machine for user %s, current state: %s, client status: %s, mapped status: %s", user.name, user.state.value, client_status, mapped_status)
         
         if user.check_in_time is None and mapped_status == 'WORKING':
             if Config.INTERACTIVE_MODE:
@@ -30,47 +60,41 @@ class StateMachine:
                     user.check_in(datetime.combine(current_time.date(), time(9, 0)))
             else:
                 user.check_in(datetime.combine(current_time.date(), time(9, 0)))
-            logger.info(f"Check-in time set for {user.name} at {user.check_in_time}")
+            logger.info("Check-in time set for %s at %s", user.name, user.check_in_time)
 
-        sorted_transitions = sort_transitions_by_priority(self.transitions)
-        
-        for transition in sorted_transitions:
-            logger.debug(f"Checking transition: {transition}")
+        context = EvaluationContext(user, current_time, mapped_status)
+        self.last_evaluation = context
+        token = evaluation_context.set(context)
+        try:
+            return await self._dispatch(user, mapped_status, current_time)
+        finally:
+            evaluation_context.reset(token)
+            logger.debug("%s: %s condition evaluations, %s cached", user.name, context.evaluations, context.hits)
+
+    async def _dispatch(self, user: User, mapped_status: str, current_time: datetime) -> Any:
+        # Solo le transizioni per (stato corrente, stato client), già ordinate per priorità
+        for transition in self.table.lookup(user.state.value, mapped_status):
+            logger.debug("Checking transition: %s", transition)
             if await self.check(user, transition, mapped_status, current_time):
-                logger.debug(f"Transition matched: {transition}")
-                new_state = UserState[transition['to']]
+                logger.debug("Transition matched: %s", transition)
+                new_state = UserState[transition.to_state]
                 
-                if self.interactive_mode and transition.get('requires_confirmation', False):
+                if self.interactive_mode and transition.requires_confirmation:
                     if not await self.get_user_confirmation(user, transition, new_state):
-                        logger.debug(f"User declined transition to {new_state.value}")
+                        logger.debug("User declined transition to %s", new_state.value)
                         continue
                 
-                await self.apply(transition.get('callbacks', []), user, current_time, new_state, mapped_status)
+                await self.apply(transition.callbacks, user, current_time, new_state, mapped_status)
                 return new_state.value
 
-        logger.info(f"No transition matched, staying in current state: {user.state.value}")
+        logger.debug("No transition matched, staying in current state: %s", user.state.value)
         return user.state.value
 
-    async def check(self, user: User, transition: dict, mapped_status: str, current_time: datetime) -> bool:
-        logger.debug(f"Checking transition from {transition['from']} to {transition['to']}")
-        logger.debug(f"User state: {user.state.value}, Mapped status: {mapped_status}")
-        
-        if user.state.value != transition['from']:
-            logger.debug(f"State mismatch: {user.state.value} != {transition['from']}")
-            return False
-        
-        if isinstance(transition['client_status'], list):
-            if mapped_status not in transition['client_status']:
-                logger.debug(f"Status mismatch: {mapped_status} not in {transition['client_status']}")
-                return False
-        elif mapped_status != transition['client_status']:
-            logger.debug(f"Status mismatch: {mapped_status} != {transition['client_status']}")
-            return False
-
-        for condition in transition['conditions']:
-            func = getattr(self.callbacks_module, condition)
-            result = await func(user, current_time, mapped_status, self.db)
-            logger.debug(f"Condition {condition} result: {result}")
+    async def check(self, user: User, transition: CompiledTransition, mapped_status: str, current_time: datetime) -> bool:
+        # Stato e stato client sono già garantiti dall'indice della tabella
+        for condition in transition.conditions:
+            result = await evaluate(condition, user, current_time, mapped_status, self.db)
+            logger.debug("Condition %s result: %s", condition.__name__, result)
             if not result:
                 return False
         return True
@@ -79,11 +103,10 @@ class StateMachine:
         for callback in callbacks:
             await self._execute_callback(callback, user, current_time, new_state, mapped_status)
 
-    async def _execute_callback(self, callback: str, user: User, current_time: datetime, new_state: UserState, mapped_status: str) -> None:
-        func = getattr(self.callbacks_module, callback)
-        await func(user=user, current_time=current_time, new_state=new_state, mapped_status=mapped_status, db=self.db)
+    async def _execute_callback(self, callback, user: User, current_time: datetime, new_state: UserState, mapped_status: str) -> None:
+        await callback(user=user, current_time=current_time, new_state=new_state, mapped_status=mapped_status, db=self.db)
 
-    async def get_user_confirmation(self, user: User, transition: Dict, new_state: UserState) -> bool:
+    async def get_user_confirmation(self, user: User, transition: CompiledTransition, new_state: UserState) -> bool:
         print(f"Transition from {user.state.value} to {new_state.value} requires confirmation.")
         response = input("Do you want to proceed? (y/n): ").lower()
         if response == 'y':
@@ -95,7 +118,7 @@ class StateMachine:
         return simulate_time if simulate_time else datetime.now()
 
     def map_client_status(self, client_status: str) -> str:
-        return map_status(client_status)
+        return self.table.map_status(client_status)
 
     async def close(self):
         await self.db.close()
@@ -0,0 +1,262 @@
+"""Simulazione deterministica di giornate lavorative attraverso la StateMachine.
+
+Un orologio virtuale avanza a passi fissi dalla mezzanotte alla mezzanotte successiva;
+a ogni passo gli utenti con un cambio di stato Discord in programma (arrivo, pause,
+pranzo, uscita) lo inviano a StateMachine.run con simulate_time. Ogni resync minuti gli
+utenti non offline rinviano lo stato corrente, come farebbe la riconciliazione
+periodica: è così che scattano break_exceeded, idle_time_exceeded e gli straordinari
+(con batch=True solo quelli le cui condizioni temporali sono cambiate, vedi batch.py).
+Con lo stesso seed, numero di utenti e data di partenza le transizioni sono identiche
+tra un'esecuzione e l'altra.
+"""
+import heapq
+import random
+import time
+import tracemalloc
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from config import Config
+from models import User, UserState
+from .batch import ConditionBatch
+from .engine import StateMachine
+
+# Stati Discord in uscita da una pausa: dnd viene mappato come online
+RETURN_STATUSES = ('online', 'online', 'online', 'dnd')
+
+# Frazione di utenti che lavora qualche ora nel fine settimana
+WEEKEND_WORKERS = 0.05
+
+
+def make_users(count: int) -> List[User]:
+    """count utenti offline con id da 1 a count."""
+    return [
+        User(
+            id=index, name=f"user{index}", full_name=f"User {index}", surname="Sim",
+            email=f"user{index}@example.com", remote=False, role="dev", dept=f"dept{index % 10}",
+            admin=False, state=UserState.OFFLINE.value, discord_id=str(100_000 + index)
+        )
+        for index in range(1, count + 1)
+    ]
+
+
+def _at(day: date, hour: int, minute: float = 0) -> datetime:
+    return datetime.combine(day, datetime.min.time()) + timedelta(hours=hour, minutes=minute)
+
+
+def day_script(rng: random.Random, day: date) -> List[Tuple[datetime, str]]:
+    """Cambi di stato Discord di un utente nel giorno day, come (istante, stato) in ordine."""
+    if day.weekday() >= 5:
+        if rng.random() >= WEEKEND_WORKERS:
+            return []
+        arrival = _at(day, 10, rng.uniform(0, 120))
+        return [(arrival, 'online'), (arrival + timedelta(hours=rng.uniform(1, 4)), 'offline')]
+
+    arrival = _at(day, 9, rng.gauss(0, 10))
+    departure = _at(day, 18, rng.gauss(0, 20))
+    lunch = _at(day, 13, rng.uniform(-15, 20))
+    lunch_end = lunch + timedelta(minutes=rng.uniform(35, 80))
+
+    events = [(arrival, 'online'), (lunch, 'idle'), (lunch_end, 'online'), (departure, 'offline')]
+    for window_start, window_end in ((arrival, lunch), (lunch_end, departure)):
+        window = (window_end - window_start).total_seconds() / 60
+        for _ in range(rng.randint(0, 2)):
+            start = window_start + timedelta(minutes=rng.uniform(0, window))
+            end = start + timedelta(minutes=min(rng.expovariate(1 / 12), 60))
+            if end < window_end:
+                events.append((start, 'idle'))
+                events.append((end, rng.choice(RETURN_STATUSES)))
+    events.sort()
+
+    # Pause sovrapposte producono stati ripetuti: Discord non li notificherebbe
+    script = []
+    for instant, status in events:
+        if not script or script[-1][1] != status:
+            script.append((instant, status))
+    return script
+
+
+class SimulationStats:
+    """Contatori di una simulazione; to_dict produce il JSON per il confronto tra release."""
+
+    def __init__(self):
+        self.days = 0
+        self.events = 0
+        self.resyncs = 0
+        self.transitions = 0
+        self.evaluations = 0
+        self.cache_hits = 0
+        self.run_seconds = 0.0
+        self.sweeps = 0
+        self.sweep_seconds = 0.0
+        self.resyncs_skipped = 0
+        self.carried_over = 0
+        self.edges: Counter = Counter()
+        self.peak_bytes = 0
+        self.retained_bytes = 0
+        self.retained_blocks = 0
+        self.traced = False
+
+    def to_dict(self) -> Dict:
+        def per(value, count, digits=3):
+            return round(value / count, digits) if count else None
+
+        result = {
+            "days": self.days,
+            "events": self.events,
+            "resync_events": self.resyncs,
+            "resync_events_skipped": self.resyncs_skipped,
+            "transitions": self.transitions,
+            "run_seconds": round(self.run_seconds, 3),
+            "events_per_sec": per(self.events, self.run_seconds, 1),
+            "transitions_per_sec": per(self.transitions, self.run_seconds, 1),
+            "us_per_event": per(self.run_seconds * 1e6, self.events, 2),
+            "condition_evaluations": self.evaluations,
+            "condition_cache_hits": self.cache_hits,
+            "evaluations_per_event": per(self.evaluations, self.events),
+            "evaluations_per_transition": per(self.evaluations, self.transitions),
+            "users_not_offline_at_midnight": self.carried_over,
+            "transitions_by_edge": dict(sorted(self.edges.items())),
+        }
+        if self.sweeps:
+            result.update({
+                "batch_sweeps": self.sweeps,
+                "batch_sweep_ms": per(self.sweep_seconds * 1000, self.sweeps),
+            })
+        if self.traced:
+            result.update({
+                "alloc_peak_bytes_per_event": per(self.peak_bytes, self.events, 1),
+                "retained_bytes_per_event": per(self.retained_bytes, self.events, 1),
+                "retained_blocks_per_event": per(self.retained_blocks, self.events, 3),
+            })
+        return result
+
+
+class DaySimulator:
+    """Fa girare state_machine su users per un numero di giorni a partire da start_date.
+
+    step è il passo dell'orologio virtuale, resync l'intervallo (in minuti, 0 per
+    disattivarlo) con cui gli utenti non offline rinviano lo stato corrente; con batch
+    solo quelli selezionati da ConditionBatch. Con trace_allocations ogni evento viene
+    misurato con tracemalloc: le allocazioni rallentano molto il run, quindi i tempi di
+    quel run non sono confrontabili.
+    """
+
+    def __init__(self, state_machine: StateMachine, users: List[User], seed: int = 1,
+                 start_date: Optional[date] = None, step: timedelta = timedelta(minutes=1),
+                 resync: int = Config.RECONCILE_INTERVAL, trace_allocations: bool = False,
+                 batch: bool = False):
+        self.state_machine = state_machine
+        self.users = users
+        self.rng = random.Random(seed)
+        self.start_date = start_date or date(2024, 1, 8)
+        self.step = step
+        self.resync = timedelta(minutes=resync) if resync else None
+        self.trace_allocations = trace_allocations
+        self.batch = ConditionBatch() if batch else None
+        self.statuses = {user.id: 'offline' for user in users}
+        self.stats = SimulationStats()
+
+    async def run(self, days: int) -> SimulationStats:
+        if self.trace_allocations:
+            tracemalloc.start()
+            before = tracemalloc.take_snapshot()
+        try:
+            for offset in range(days):
+                await self.run_day(self.start_date + timedelta(days=offset))
+            if self.trace_allocations:
+                self._record_retained(before, tracemalloc.take_snapshot())
+        finally:
+            if self.trace_allocations:
+                tracemalloc.stop()
+        return self.stats
+
+    async def run_day(self, day: date) -> None:
+        midnight = _at(day, 0)
+        for user in self.users:
+            # end_work azzera last_state_change_time con l'ora reale: lo riportiamo sull'orologio virtuale
+            user.last_state_change_time = midnight
+        if self.batch:
+            self.batch.load(self.users)
+
+        pending = []
+        for user in self.users:
+            for instant, status in day_script(self.rng, day):
+                pending.append((instant, user.id, status))
+        heapq.heapify(pending)
+        by_id = {user.id: user for user in self.users}
+
+        clock, end = midnight, midnight + timedelta(days=1)
+        next_resync = midnight + self.resync if self.resync else end
+        while clock < end:
+            while pending and pending[0][0] <= clock:
+                _, user_id, status = heapq.heappop(pending)
+                self.statuses[user_id] = status
+                await self._feed(by_id[user_id], status, clock, status_changed=True)
+            if clock >= next_resync:
+                if self.batch:
+                    await self._batch_resync(clock)
+                else:
+                    for user in self.users:
+                        if user.state != UserState.OFFLINE:
+                            self.stats.resyncs += 1
+                            await self._feed(user, self.statuses[user.id], clock)
+                next_resync += self.resync
+            clock += self.step
+
+        # Chiusura della giornata: chi è rimasto in uno stato diverso da OFFLINE riparte da zero
+        for user in self.users:
+            if user.state != UserState.OFFLINE:
+                self.stats.carried_over += 1
+                user.reset_daily_attributes()
+            self.statuses[user.id] = 'offline'
+        self.stats.days += 1
+
+    async def _batch_resync(self, clock: datetime) -> None:
+        started = time.perf_counter()
+        positions = self.batch.changed(clock)
+        self.stats.sweep_seconds += time.perf_counter() - started
+        self.stats.sweeps += 1
+
+        selected = [self.users[position] for position in positions.tolist()]
+        online = sum(user.state != UserState.OFFLINE for user in self.users)
+        selected = [user for user in selected if user.state != UserState.OFFLINE]
+        self.stats.resyncs_skipped += online - len(selected)
+        for user in selected:
+            self.stats.resyncs += 1
+            await self._feed(user, self.statuses[user.id], clock)
+
+    async def _feed(self, user: User, status: str, clock: datetime, status_changed: bool = False) -> None:
+        previous = user.state
+        if self.trace_allocations:
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+
+        started = time.perf_counter()
+        new_state = await self.state_machine.run(user, status, simulate_time=clock)
+        self.stats.run_seconds += time.perf_counter() - started
+
+        if self.trace_allocations:
+            _, peak = tracemalloc.get_traced_memory()
+            self.stats.peak_bytes += peak - current
+
+        context = self.state_machine.last_evaluation
+        self.stats.events += 1
+        self.stats.evaluations += context.evaluations
+        self.stats.cache_hits += context.hits
+        if new_state != previous.value:
+            self.stats.transitions += 1
+            self.stats.edges[f"{previous.value}->{new_state}"] += 1
+            if previous == UserState.OFFLINE and user.work_start is None:
+                # Come WorkTracker.handle_start_work, che la StateMachine non richiama
+                user.work_start = clock
+            if self.batch:
+                self.batch.refresh(user)
+        elif self.batch and status_changed:
+            self.batch.refresh(user)
+
+    def _record_retained(self, before, after) -> None:
+        self.stats.traced = True
+        for stat in after.compare_to(before, 'filename'):
+            self.stats.retained_bytes += stat.size_diff
+            self.stats.retained_blocks += stat.count_diff
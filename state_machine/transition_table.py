@@ -0,0 +1,94 @@
+import os
+import time
+import yaml
+from collections import defaultdict
+from config import Config
+from logger import logger
+from .callbacks import sort_transitions_by_priority
+
+
+class CompiledTransition:
+    __slots__ = ("source", "from_state", "to_state", "conditions", "callbacks", "requires_confirmation")
+
+    def __init__(self, source, conditions, callbacks):
+        self.source = source
+        self.from_state = source['from']
+        self.to_state = source['to']
+        self.conditions = conditions
+        self.callbacks = callbacks
+        self.requires_confirmation = source.get('requires_confirmation', False)
+
+    def __repr__(self):
+        return f"{self.from_state} -> {self.to_state}"
+
+
+class TransitionTable:
+    """Transizioni e mappatura degli stati client compilate una sola volta.
+
+    Le transizioni sono indicizzate per (from_state, mapped_status), già ordinate per
+    priorità e con condizioni e callback risolte in riferimenti a funzione. I file YAML
+    vengono riletti solo quando cambia la loro data di modifica, controllata al massimo
+    ogni Config.STATE_MACHINE_RELOAD_INTERVAL secondi.
+    """
+
+    def __init__(self, transitions_file, mapping_file, callbacks_module, client=None):
+        self.transitions_file = transitions_file
+        self.mapping_file = mapping_file
+        self.callbacks_module = callbacks_module
+        self.client = client or Config.CLIENT
+        self.index = {}
+        self.status_mapping = {}
+        self._mtimes = None
+        self._next_check = 0.0
+        self.compile()
+
+    def _read_mtimes(self):
+        return (os.stat(self.transitions_file).st_mtime_ns, os.stat(self.mapping_file).st_mtime_ns)
+
+    def compile(self):
+        mtimes = self._read_mtimes()
+        with open(self.transitions_file, 'r') as file:
+            transitions = yaml.safe_load(file)
+        with open(self.mapping_file, 'r') as file:
+            mappings = yaml.safe_load(file).get(self.client, {})
+
+        index = defaultdict(list)
+        for transition in sort_transitions_by_priority(transitions):
+            try:
+                compiled = CompiledTransition(
+                    transition,
+                    [getattr(self.callbacks_module, name) for name in transition.get('conditions', [])],
+                    [getattr(self.callbacks_module, name) for name in transition.get('callbacks', [])],
+                )
+            except AttributeError as e:
+                # Una funzione mancante disabilita solo la sua transizione, non l'intera tabella
+                logger.error(f"Skipping transition {transition['from']} -> {transition['to']}: {e}")
+                continue
+            statuses = transition['client_status']
+            if not isinstance(statuses, list):
+                statuses = [statuses]
+            for status in statuses:
+                index[(transition['from'], status)].append(compiled)
+
+        self.index = dict(index)
+        self.status_mapping = {status: mapped.upper() for status, mapped in mappings.items()}
+        self._mtimes = mtimes
+        self._next_check = time.monotonic() + Config.STATE_MACHINE_RELOAD_INTERVAL
+        logger.info(f"Compiled {len(transitions)} transitions into {len(self.index)} dispatch entries")
+
+    def refresh_if_changed(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return False
+        self._next_check = now + Config.STATE_MACHINE_RELOAD_INTERVAL
+        if self._read_mtimes() == self._mtimes:
+            return False
+        self.compile()
+        return True
+
+    def map_status(self, status):
+        mapped = self.status_mapping.get(status)
+        return mapped if mapped is not None else status.upper()
+
+    def lookup(self, from_state, mapped_status):
+        return self.index.get((from_state, mapped_status), ())
@@ -0,0 +1,108 @@
+import asyncio
+import math
+import time
+from logger import logger
+
+
+class _Timer:
+    __slots__ = ("key", "slot", "rounds", "callback", "args")
+
+    def __init__(self, key, slot, rounds, callback, args):
+        self.key = key
+        self.slot = slot
+        self.rounds = rounds
+        self.callback = callback
+        self.args = args
+
+
+class TimerWheel:
+    """Hashed timer wheel per le transizioni in attesa (es. buffer IDLE).
+
+    Ogni scadenza occupa un solo oggetto _Timer in uno slot della ruota, indicizzato
+    per chiave: migliaia di attese contemporanee costano memoria costante per voce e
+    un'unica task di tick, senza una coroutine in sleep per utente.
+    """
+
+    def __init__(self, tick=1.0, slots=512):
+        self.tick = tick
+        self.slots = [{} for _ in range(slots)]
+        self._timers = {}
+        self._cursor = 0
+        self._task = None
+
+    def __len__(self):
+        return len(self._timers)
+
+    def pending(self, key):
+        return key in self._timers
+
+    def schedule(self, key, delay, callback, *args):
+        """Programma callback(*args) dopo delay secondi, sostituendo l'eventuale timer per key."""
+        self.cancel(key)
+        ticks = max(1, math.ceil(delay / self.tick))
+        slot = (self._cursor + ticks) % len(self.slots)
+        timer = _Timer(key, slot, (ticks - 1) // len(self.slots), callback, args)
+        self.slots[slot][key] = timer
+        self._timers[key] = timer
+        self._ensure_running()
+
+    def cancel(self, key):
+        timer = self._timers.pop(key, None)
+        if timer is None:
+            return False
+        del self.slots[timer.slot][key]
+        return True
+
+    def advance(self):
+        """Avanza la ruota di un tick e restituisce i timer scaduti."""
+        self._cursor = (self._cursor + 1) % len(self.slots)
+        bucket = self.slots[self._cursor]
+        expired = []
+        for key, timer in list(bucket.items()):
+            if timer.rounds > 0:
+                timer.rounds -= 1
+                continue
+            del bucket[key]
+            del self._timers[key]
+            expired.append(timer)
+        return expired
+
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        # Un task creato su un loop precedente (es. run_until_complete prima di bot.run)
+        # resta pending per sempre: la ruota riparte sul loop corrente
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        next_tick = time.monotonic() + self.tick
+        while self._timers:
+            await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+            # Recupera eventuali tick persi se il loop è rimasto bloccato
+            while next_tick <= time.monotonic():
+                next_tick += self.tick
+                for timer in self.advance():
+                    self._fire(timer)
+        self._task = None
+
+    def _fire(self, timer):
+        try:
+            result = timer.callback(*timer.args)
+            if asyncio.iscoroutine(result):
+                asyncio.ensure_future(self._await_callback(timer.key, result))
+        except Exception as e:
+            logger.error(f"Error firing timer {timer.key}: {e}")
+
+    async def _await_callback(self, key, coro):
+        try:
+            await coro
+        except Exception as e:
+            logger.error(f"Error firing timer {key}: {e}")
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for bucket in self.slots:
+            bucket.clear()
+        self._timers.clear()
@@ -0,0 +1,163 @@
+"""Journal append-only delle transizioni e snapshot periodici dello stato runtime.
+
+Ogni transizione (e ogni buffer IDLE avviato o chiuso) aggiunge al journal una riga JSON
+con lo stato runtime completo dell'utente dopo l'evento: stato, inizio lavoro, inizio
+pausa, tempi per dispositivo e scadenza del buffer IDLE in attesa. Ogni riga ha un numero
+di sequenza crescente.
+
+snapshot() salva lo stato di tutti gli utenti con l'ultima sequenza coperta e ruota il
+journal: il file corrente diventa <journal>.1 e viene cancellato solo dopo che lo snapshot
+è stato scritto (file temporaneo, fsync, os.replace). All'avvio load() legge lo snapshot e
+riapplica le righe successive di <journal>.1 e del journal, ignorando quelle già coperte:
+un crash in qualunque punto lascia uno stato ricostruibile.
+"""
+import asyncio
+import json
+import os
+from datetime import datetime
+from time import perf_counter
+from typing import Dict, Optional, Tuple
+from config import Config
+from logger import logger
+
+# Attributi runtime di User salvati nel journal e negli snapshot
+DATETIME_FIELDS = ('work_start', 'current_break_start')
+VALUE_FIELDS = ('is_mobile', 'total_mobile_time', 'total_pc_time')
+
+
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+def user_record(user, idle_deadline: Optional[datetime] = None) -> Dict:
+    record = {'state': user.state.name, 'idle_deadline': _iso(idle_deadline)}
+    for field in DATETIME_FIELDS:
+        record[field] = _iso(getattr(user, field))
+    for field in VALUE_FIELDS:
+        record[field] = getattr(user, field)
+    return record
+
+
+def restore_user(user, record: Dict, state_type) -> Optional[datetime]:
+    """Applica record a user e restituisce la scadenza del buffer IDLE, se in attesa."""
+    user.state = state_type[record['state']]
+    for field in DATETIME_FIELDS:
+        value = record.get(field)
+        setattr(user, field, datetime.fromisoformat(value) if value else None)
+    for field in VALUE_FIELDS:
+        if field in record:
+            setattr(user, field, record[field])
+    deadline = record.get('idle_deadline')
+    return datetime.fromisoformat(deadline) if deadline else None
+
+
+class TransitionJournal:
+    def __init__(self, directory: str = None, name: str = 'transitions'):
+        self.directory = directory or Config.JOURNAL_DIR
+        self.path = os.path.join(self.directory, f'{name}.jsonl')
+        self.snapshot_path = os.path.join(self.directory, f'{name}.snapshot.json')
+        self.seq = 0
+        self.records = 0
+        self._file = None
+
+    @property
+    def rotated_path(self) -> str:
+        return self.path + '.1'
+
+    def _open(self):
+        if self._file is None:
+            os.makedirs(self.directory, exist_ok=True)
+            # Bufferizzato a righe: ogni record arriva al sistema operativo con una sola write
+            self._file = open(self.path, 'a', encoding='utf-8', buffering=1)
+        return self._file
+
+    def append(self, discord_id: str, user, idle_deadline: Optional[datetime] = None) -> None:
+        self.seq += 1
+        self.records += 1
+        line = {'seq': self.seq, 'at': datetime.now().isoformat(), 'user': discord_id}
+        line.update(user_record(user, idle_deadline))
+        try:
+            self._open().write(json.dumps(line, separators=(',', ':')) + '\n')
+        except OSError as e:
+            logger.error("Could not append to transition journal %s: %s", self.path, e)
+
+    def load(self) -> Tuple[Dict[str, Dict], float]:
+        """Stato per discord_id da snapshot più coda del journal e secondi impiegati."""
+        started = perf_counter()
+        states: Dict[str, Dict] = {}
+        covered = 0
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as file:
+                snapshot = json.load(file)
+            covered = snapshot['seq']
+            at = snapshot['at']
+            for discord_id, record in snapshot['users'].items():
+                states[discord_id] = dict(record, at=at)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as e:
+            logger.error("Ignoring unreadable snapshot %s: %s", self.snapshot_path, e)
+
+        self.seq = covered
+        for path in (self.rotated_path, self.path):
+            try:
+                with open(path, 'r', encoding='utf-8') as file:
+                    for line in file:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            # Ultima riga troncata da un crash
+                            continue
+                        if record['seq'] <= covered:
+                            continue
+                        states[record.pop('user')] = record
+                        self.seq = max(self.seq, record.pop('seq'))
+            except FileNotFoundError:
+                continue
+        return states, perf_counter() - started
+
+    def take_snapshot(self, users: Dict, idle_deadlines: Dict[str, datetime]) -> Tuple[Dict, int]:
+        """Prepara lo snapshot e ruota il journal; va chiamata sull'event loop.
+
+        Lo stato viene letto qui, in un solo passaggio senza await, così è coerente con
+        la sequenza registrata. La scrittura (write_snapshot) può girare in un executor.
+        """
+        snapshot = {
+            'seq': self.seq,
+            'at': datetime.now().isoformat(),
+            'users': {
+                discord_id: user_record(user, idle_deadlines.get(discord_id))
+                for discord_id, user in users.items()
+            },
+        }
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if os.path.exists(self.path) and not os.path.exists(self.rotated_path):
+            os.replace(self.path, self.rotated_path)
+        return snapshot, self.records
+
+    def write_snapshot(self, snapshot: Dict) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        temporary = self.snapshot_path + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as file:
+            json.dump(snapshot, file, separators=(',', ':'))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.snapshot_path)
+        # Le righe di <journal>.1 sono tutte coperte dallo snapshot appena scritto
+        if os.path.exists(self.rotated_path):
+            os.remove(self.rotated_path)
+
+    async def snapshot(self, users: Dict, idle_deadlines: Dict[str, datetime]) -> None:
+        started = perf_counter()
+        snapshot, records = self.take_snapshot(users, idle_deadlines)
+        await asyncio.get_running_loop().run_in_executor(None, self.write_snapshot, snapshot)
+        self.records -= records
+        logger.info("Snapshot of %s users at seq %s written in %.1fms (%s journal records compacted)",
+                    len(snapshot['users']), snapshot['seq'], (perf_counter() - started) * 1000, records)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,106 @@
+from collections import defaultdict
+
+# Campi anagrafici di User (lo stato runtime resta fuori)
+PROFILE_FIELDS = ('name', 'full_name', 'surname', 'email', 'remote', 'role', 'dept', 'admin')
+
+
+class UserDirectory:
+    """Anagrafica utenti in memoria con indici per discord_id, id, reparto e flag admin.
+
+    Gli oggetti User sono condivisi con WorkTracker, quindi lo stato runtime sopravvive
+    agli aggiornamenti dell'anagrafica. DatabaseManager la tiene allineata su
+    add_user, update_user e delete_user: le letture non toccano mai il database.
+    """
+
+    def __init__(self):
+        self.by_discord_id = {}
+        self.by_id = {}
+        self.by_dept = defaultdict(dict)
+        self.admins = {}
+        self.loaded = False
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def values(self):
+        return self.by_id.values()
+
+    def load(self, users):
+        self.by_discord_id.clear()
+        self.by_id.clear()
+        self.by_dept.clear()
+        self.admins.clear()
+        for user in users:
+            self.add(user)
+        self.loaded = True
+
+    def merge(self, users):
+        """Allinea l'anagrafica a users senza sostituire gli oggetti User già presenti.
+
+        Usata quando le modifiche arrivano da un altro processo (vedi sharding.py): gli
+        utenti esistenti vengono aggiornati in place e conservano lo stato runtime.
+        """
+        seen = set()
+        for user in users:
+            seen.add(user.id)
+            current = self.by_id.get(user.id)
+            if current is not None and str(current.discord_id) == str(user.discord_id):
+                self.update(user.id, **{name: getattr(user, name) for name in PROFILE_FIELDS})
+                continue
+            if current is not None:
+                self.remove(user.id)
+            self.add(user)
+        for user_id in [user_id for user_id in self.by_id if user_id not in seen]:
+            self.remove(user_id)
+        self.loaded = True
+
+    def add(self, user):
+        self.by_id[user.id] = user
+        if user.discord_id is not None:
+            self.by_discord_id[str(user.discord_id)] = user
+        self.by_dept[user.dept][user.id] = user
+        if user.admin:
+            self.admins[user.id] = user
+
+    def remove(self, user_id):
+        user = self.by_id.pop(user_id, None)
+        if user is None:
+            return None
+        if user.discord_id is not None:
+            self.by_discord_id.pop(str(user.discord_id), None)
+        self._unindex_dept(user)
+        self.admins.pop(user.id, None)
+        return user
+
+    def update(self, user_id, **fields):
+        """Aggiorna i campi anagrafici in place, senza toccare lo stato runtime dell'utente."""
+        user = self.by_id.get(user_id)
+        if user is None:
+            return None
+        self._unindex_dept(user)
+        self.admins.pop(user.id, None)
+        for name, value in fields.items():
+            setattr(user, name, value)
+        self.by_dept[user.dept][user.id] = user
+        if user.admin:
+            self.admins[user.id] = user
+        return user
+
+    def _unindex_dept(self, user):
+        members = self.by_dept.get(user.dept)
+        if members is not None:
+            members.pop(user.id, None)
+            if not members:
+                del self.by_dept[user.dept]
+
+    def get_by_discord_id(self, discord_id):
+        return self.by_discord_id.get(str(discord_id))
+
+    def get_by_id(self, user_id):
+        return self.by_id.get(user_id)
+
+    def in_department(self, dept):
+        return list(self.by_dept.get(dept, {}).values())
+
+    def admin_users(self):
+        return list(self.admins.values())
@@ -0,0 +1,68 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from metrics import metrics
+
+_wait_seconds = metrics.histogram('user_lock_wait_seconds', 'Attesa per acquisire il lock di un utente')
+
+
+class _LockEntry:
+    __slots__ = ("lock", "refs")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.refs = 0
+
+
+class UserLockTable:
+    """Lock asyncio per utente.
+
+    Le transizioni dello stesso utente restano serializzate, quelle di utenti diversi
+    procedono in parallelo. Una voce vive solo finché qualcuno la detiene o la attende,
+    quindi la tabella è limitata al numero di utenti con lavoro in corso.
+    """
+
+    def __init__(self):
+        self._locks = {}
+        self.acquisitions = 0
+        self.contended = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def __len__(self):
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def acquire(self, key):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = _LockEntry()
+        entry.refs += 1
+        try:
+            if entry.lock.locked():
+                self.contended += 1
+            started = time.perf_counter()
+            async with entry.lock:
+                self._record_wait(time.perf_counter() - started)
+                yield
+        finally:
+            entry.refs -= 1
+            if entry.refs == 0:
+                # Nessuno detiene o attende il lock: la voce può essere rimossa
+                del self._locks[key]
+
+    def _record_wait(self, wait):
+        _wait_seconds.observe(wait)
+        self.acquisitions += 1
+        self.total_wait += wait
+        if wait > self.max_wait:
+            self.max_wait = wait
+
+    def stats(self):
+        return {
+            "acquisitions": self.acquisitions,
+            "contended": self.contended,
+            "avg_wait_ms": (self.total_wait / self.acquisitions * 1000) if self.acquisitions else 0.0,
+            "max_wait_ms": self.max_wait * 1000,
+            "active_locks": len(self._locks),
+        }
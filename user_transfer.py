@@ -0,0 +1,30 @@
+import argparse
+import asyncio
+from database import Database
+
+# Import/export della tabella users in CSV o JSONL. Uso:
+#   python user_transfer.py import utenti.csv
+#   python user_transfer.py export utenti.jsonl --db worktracker.db
+
+async def transfer(action, path, db_name, file_format):
+    db = Database(db_name)
+    try:
+        if action == 'import':
+            stats = await db.import_users(path, file_format)
+        else:
+            stats = await db.export_users(path, file_format)
+    finally:
+        await db.close()
+    print(f"{action}: {stats.rows} utenti in {stats.seconds:.2f}s ({stats.rows_per_second:.0f} righe/s)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Import/export degli utenti")
+    parser.add_argument('action', choices=['import', 'export'])
+    parser.add_argument('path')
+    parser.add_argument('--db', default='worktracker.db')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], default=None)
+    args = parser.parse_args()
+    asyncio.run(transfer(args.action, args.path, args.db, args.format))
+
+if __name__ == "__main__":
+    main()
@@ -38,7 +38,7 @@ class WorkCommands(commands.Cog):
 
             if not user:
                 logger.warning(f"User with ID {ctx.author.id} not found in the system.")
-                user = self.db_manager.get_user_by_discord_id(ctx.author.id)
+                user = await self.db_manager.get_user_by_discord_id(ctx.author.id)
                 if not user:
                     await ctx.send("Sorry, I couldn't find your work data.")
                     return
@@ -55,7 +55,7 @@ class WorkCommands(commands.Cog):
 
             logger.info(f"User found: {user.name}")
 
-            start_time, total_hours, effective_hours = self.db_manager.get_total_hours(
+            start_time, total_hours, effective_hours = await self.db_manager.get_total_hours(
                 user.id
             )
 
@@ -65,7 +65,7 @@ class WorkCommands(commands.Cog):
                 work_start_datetime = "N/A"
 
             lunch_break = (
-                "Yes" if self.db_manager.has_lunch_break_today(user.id) else "No"
+                "Yes" if await self.db_manager.has_lunch_break_today(user.id) else "No"
             )
             current_state = user.state.name
 
@@ -111,7 +111,7 @@ class WorkCommands(commands.Cog):
         if user:
             logger.info(f"User found: {user.name}")
             try:
-                break_logs = self.db_manager.get_breaks_summary(user.id)
+                break_logs = await self.db_manager.get_breaks_summary(user.id)
 
                 if not break_logs:
                     await ctx.send("No breaks found for today.")
@@ -202,7 +202,7 @@ class WorkCommands(commands.Cog):
             await ctx.send("You are not currently on a break.")
             return
 
-        self.db_manager.log_break_end(user.id)
+        await self.db_manager.log_break_end(user.id)
         user.state = UserState.WORKING
         await ctx.send("Your break has ended. Back to work!")
 
@@ -213,39 +213,56 @@ class WorkCommands(commands.Cog):
             await ctx.send("You are not registered in the work tracking system.")
             return
 
-        end_date = datetime.now()
+        end_date = datetime.now().date()
         start_date = end_date - timedelta(days=7)
-        work_logs = self.db_manager.get_user_work_logs(user.id, start_date, end_date)
 
-        if not work_logs:
+        header = "Date | Start Time | End Time | Total Hours | Effective Hours\n"
+        header += "-" * 70 + "\n"
+        title = f"Weekly Report for {user.name}:\n"
+        report = ""
+
+        # Giorni passati letti da daily_summary (una range read sulla chiave primaria). Il
+        # riepilogo contiene solo log chiusi: oggi e i turni ancora aperti, anche se iniziati
+        # nei giorni precedenti, arrivano dai log grezzi
+        days = {
+            row["date"]: [row["first_start"], row["last_end"], False, row["total_hours"], row["effective_hours"]]
+            for row in await self.db_manager.get_daily_summaries(user.id, start_date, end_date - timedelta(days=1))
+            if row["first_start"]
+        }
+        async for page in self.db_manager.stream_report(
+            start_date, end_date, group_by=("day",), user_ids=[user.id], live_since=end_date
+        ):
+            for row in page:
+                day = days.get(row["day"])
+                if day is None:
+                    days[row["day"]] = [
+                        row["first_start"], row["last_end"], row["open_logs"], row["total_hours"], row["effective_hours"]
+                    ]
+                    continue
+                day[0] = min(day[0], row["first_start"])
+                day[1] = max(day[1], row["last_end"])
+                day[2] = day[2] or row["open_logs"]
+                day[3] = (day[3] or 0) + (row["total_hours"] or 0)
+                day[4] = (day[4] or 0) + (row["effective_hours"] or 0)
+        rows = [(day, *values) for day, values in sorted(days.items())]
+
+        # Il testo parte a blocchi per restare sotto il limite di Discord
+        for day, first_start, last_end, open_logs, total, effective in rows:
+            start = first_start[11:16]
+            end = "Ongoing" if open_logs else last_end[11:16]
+            total_hours = f"{total:.2f}" if total else "N/A"
+            effective_hours = f"{effective:.2f}" if effective else "N/A"
+            line = f"{day} | {start} | {end} | {total_hours} | {effective_hours}\n"
+            if len(title) + len(header) + len(report) + len(line) > 1900:
+                await ctx.send(f"```{title}{header}{report}```")
+                title, report = "", ""
+            report += line
+
+        if not report:
             await ctx.send("No work logs found for the past week.")
             return
 
-        report = "Date | Start Time | End Time | Total Hours | Effective Hours\n"
-        report += "-" * 70 + "\n"
-
-        for log in work_logs:
-            start_time = datetime.fromisoformat(log["start_time"])
-            end_time = (
-                datetime.fromisoformat(log["end_time"])
-                if log["end_time"]
-                else "Ongoing"
-            )
-            date = start_time.strftime("%Y-%m-%d")
-            start = start_time.strftime("%H:%M")
-            end = (
-                end_time.strftime("%H:%M")
-                if isinstance(end_time, datetime)
-                else end_time
-            )
-            total_hours = f"{log['total_hours']:.2f}" if log["total_hours"] else "N/A"
-            effective_hours = (
-                f"{log['effective_hours']:.2f}" if log["effective_hours"] else "N/A"
-            )
-
-            report += f"{date} | {start} | {end} | {total_hours} | {effective_hours}\n"
-
-        await ctx.send(f"```Weekly Report for {user.name}:\n{report}```")
+        await ctx.send(f"```{title}{header}{report}```")
 
     @commands.command(name="manualentry")
     async def manual_entry(self, ctx, target_user: discord.Member = None):
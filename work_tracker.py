@@ -1,9 +1,14 @@
-import asyncio, logging
+import logging
+from collections import Counter
 from discord.ext import commands, tasks
 from datetime import datetime, timedelta
 from user import UserState
 from config import Config
 from logger import log_user_action, log_exception, logger
+from timer_wheel import TimerWheel
+from user_locks import UserLockTable
+from metrics import timed
+from transition_journal import restore_user
 
 
 class WorkTracker(commands.Cog):
@@ -12,10 +17,24 @@ class WorkTracker(commands.Cog):
         self.db_manager = db_manager
         self.users = {}
         self.guild = None
-        self.status_update_lock = asyncio.Lock()
-        self.last_status_sync = {}
-        self.debounce_time = 1
-        self.load_users()
+        # Un lock per utente: le transizioni di utenti diversi non si serializzano
+        self.user_locks = UserLockTable()
+        # Contatori cumulativi per il percorso incrementale e per le riconciliazioni
+        self.sync_stats = Counter()
+        # Transizioni IDLE -> pausa in attesa del buffer, indicizzate per discord_id
+        self.idle_timers = TimerWheel(tick=Config.IDLE_TIMER_TICK, slots=Config.IDLE_TIMER_SLOTS)
+        # Scadenze dei buffer IDLE in attesa, salvate negli snapshot per ripristinarle al riavvio
+        self.idle_deadlines = {}
+        # Journal delle transizioni (TransitionJournal), impostato da main.setup_components
+        self.journal = None
+        # Utenti il cui stato runtime è stato ripristinato da snapshot e journal
+        self.restored = 0
+        # False nel gateway della modalità partizionata: lo stato runtime è dei worker
+        # (vedi sharding.py) e qui si legge solo dal database
+        self.tracking = True
+
+    async def cog_load(self):
+        await self.load_users()
 
     async def load_guild(self):
         self.guild = self.bot.get_guild(int(Config.GUILD_ID))
@@ -28,19 +47,106 @@ class WorkTracker(commands.Cog):
             raise ValueError("Guild not found")
 
     def cog_unload(self):
+        self.idle_timers.stop()
+        if self.journal is not None:
+            self.journal.close()
         self.periodic_sync.cancel()
 
-    def load_users(self):
-        self.users = {str(user.discord_id): user for user in self.db_manager.get_all_users()}
+    async def load_users(self):
+        # Indice per discord_id dell'anagrafica condivisa: resta allineato a add/update/delete_user
+        directory = await self.db_manager.load_users()
+        self.users = directory.by_discord_id
         log_user_action('System', f"Loaded {len(self.users)} users")
+        if self.journal is not None:
+            self.restore_runtime_state()
 
-    async def reconcile_states(self):
+    def restore_runtime_state(self):
+        """Ripristina stato, pause e buffer IDLE di oggi da snapshot più coda del journal."""
+        try:
+            states, seconds = self.journal.load()
+        except Exception as e:
+            log_exception("System", f"Could not load transition journal: {str(e)}")
+            return
+        today = datetime.now().date()
+        self.restored = 0
+        for discord_id, record in states.items():
+            user = self.users.get(discord_id)
+            # Lo stato di un altro giorno non vale più: ci pensa la riconciliazione
+            if user is None or datetime.fromisoformat(record['at']).date() != today:
+                continue
+            deadline = restore_user(user, record, UserState)
+            if deadline is not None:
+                # Programmato da resume_idle_buffers sul loop del bot
+                self.idle_deadlines[discord_id] = deadline
+            self.restored += 1
+        log_user_action(
+            "System",
+            f"Restored runtime state of {self.restored} users ({len(self.idle_deadlines)} idle buffers) "
+            f"in {seconds * 1000:.1f} ms",
+        )
+
+    def resume_idle_buffers(self):
+        """Programma i buffer IDLE ripristinati; va chiamata sul loop del bot (on_ready).
+
+        cog_load gira in run_until_complete, su un loop diverso da quello di bot.run:
+        i timer programmati lì non scatterebbero mai.
+        """
+        now = datetime.now()
+        for discord_id, deadline in self.idle_deadlines.items():
+            user = self.users.get(discord_id)
+            if user is not None and not self.idle_timers.pending(discord_id):
+                self.idle_timers.schedule(
+                    discord_id, max((deadline - now).total_seconds(), 0), self.confirm_idle_transition, user
+                )
+
+    def record_runtime_state(self, user):
+        if self.journal is not None:
+            discord_id = str(user.discord_id)
+            self.journal.append(discord_id, user, self.idle_deadlines.get(discord_id))
+
+    async def snapshot_runtime_state(self):
+        if self.journal is not None:
+            await self.journal.snapshot(self.users, self.idle_deadlines)
+
+    async def handle_presence_update(self, user):
+        """Percorso incrementale: sincronizza solo l'utente che ha cambiato presenza."""
+        queries_before = self.db_manager.query_count
+        await self.sync_user_state(user)
+        queries = self.db_manager.query_count - queries_before
+
+        self.sync_stats["presence_events"] += 1
+        self.sync_stats["presence_users_synced"] += 1
+        self.sync_stats["presence_queries"] += queries
+        logger.debug(f"Presence event for {user.name}: 1 user synced, {queries} queries")
+
+    @timed('reconcile_seconds', 'Durata di una riconciliazione degli stati')
+    async def reconcile_states(self, full=False):
+        """Riconcilia gli stati di tutti gli utenti.
+
+        Con full=False vengono sincronizzati solo gli utenti il cui stato Discord
+        differisce dallo stato in memoria (drift); full=True sincronizza tutti,
+        come all'avvio.
+
+        Le condizioni temporali della StateMachine (state_machine.batch.ConditionBatch)
+        non entrano qui: la sweep confronta solo lo stato Discord.
+        """
         log_user_action("System", "Starting state reconciliation")
         current_date = datetime.now().date()
+        sweep = Counter()
+        queries_before = self.db_manager.query_count
 
         try:
             self.guild = self.bot.get_guild(int(Config.GUILD_ID))
-            for user in self.users.values():
+            if self.guild is None:
+                log_user_action(
+                    "System",
+                    f"Could not find guild with ID {Config.GUILD_ID}, skipping reconciliation",
+                    level=logging.ERROR,
+                )
+                return
+            # Una sola lettura dei permessi per l'intero sweep
+            leave_calendar = await self.db_manager.get_leave_calendar(current_date)
+            for user in list(self.users.values()):
                 if user.discord_id is None:
                     log_user_action(
                         "System",
@@ -49,19 +155,44 @@ class WorkTracker(commands.Cog):
                     )
                     continue
 
-                leave_status = self.db_manager.is_user_on_leave(user.id, current_date)
-                if leave_status:
+                sweep["users_checked"] += 1
+                if leave_calendar.is_on_leave(user.id):
+                    sweep["users_on_leave"] += 1
                     log_user_action(
                         "System", f"{user.name} skipped due to leave status"
                     )
                     continue
 
                 member = self.guild.get_member(int(user.discord_id))
-                if member:
-                    # Passa l'oggetto user invece di member
-                    await self.sync_user_state(user)
+                if not member:
+                    continue
+
+                if not full:
+                    discord_state = self.discord_status_to_user_state(str(member.status))
+                    if discord_state == user.state:
+                        continue
+                    # IDLE con buffer già in attesa: lo chiuderà la timer wheel
+                    if discord_state == UserState.SHORT_BREAK and str(user.discord_id) in self.idle_deadlines:
+                        continue
+
+                # Passa l'oggetto user invece di member
+                await self.sync_user_state(user)
+                sweep["users_synced"] += 1
 
-            log_user_action("System", "State reconciliation completed")
+            sweep["queries"] = self.db_manager.query_count - queries_before
+            self.sync_stats["sweeps"] += 1
+            self.sync_stats.update({f"sweep_{key}": value for key, value in sweep.items()})
+            log_user_action(
+                "System",
+                f"State reconciliation completed: {sweep['users_checked']} checked, "
+                f"{sweep['users_synced']} synced, {sweep['users_on_leave']} on leave, "
+                f"{sweep['queries']} queries",
+            )
+            lock_stats = self.user_locks.stats()
+            logger.debug(
+                f"User lock contention: {lock_stats['contended']}/{lock_stats['acquisitions']} contended, "
+                f"avg wait {lock_stats['avg_wait_ms']:.3f} ms, max wait {lock_stats['max_wait_ms']:.3f} ms"
+            )
         except Exception as e:
             log_exception("System", f"Error during state reconciliation: {str(e)}")
 
@@ -109,7 +240,7 @@ class WorkTracker(commands.Cog):
             or current_time.time() > Config.WORK_END_TIME
         ):
             if Config.SILENT_MODE:
-                self.db_manager.log_overtime(user.id, current_time)
+                await self.db_manager.log_overtime(user.id, current_time)
             else:
                 # Richiede conferma
                 await self.request_overtime_confirmation(user)
@@ -127,11 +258,17 @@ class WorkTracker(commands.Cog):
         detected_status = str(member.status)
         log_user_action('System', f"Detected Discord status for {user.name}: {detected_status}")
 
-        async with self.status_update_lock:
+        async with self.user_locks.acquire(discord_id):
             new_state = self.discord_status_to_user_state(detected_status)
 
+            # Qualsiasi stato diverso da IDLE annulla un eventuale buffer in attesa
+            if new_state != UserState.SHORT_BREAK and self.idle_timers.cancel(discord_id):
+                log_user_action(user.name, f"{user.name} returned from IDLE within the buffer period.")
+                self.idle_deadlines.pop(discord_id, None)
+                self.record_runtime_state(user)
+
             # Recupera lo stato corrente dal database
-            old_state = self.db_manager.get_user_current_state(user.id)
+            old_state = await self.db_manager.get_user_current_state(user.id)
 
             # Log the old and new state for debugging
             log_user_action('System', f"Old state from DB: {old_state}, New state: {new_state.name}")
@@ -139,41 +276,63 @@ class WorkTracker(commands.Cog):
             if new_state.name != old_state:
                 log_user_action(user.name, f"{old_state} -> {new_state.name}")
 
-                # Gestione della logica di idle con buffer time
+                # Gestione della logica di idle con buffer time: la transizione viene
+                # confermata o annullata dalla timer wheel, senza attendere sotto il lock
                 if new_state == UserState.SHORT_BREAK and old_state == 'WORKING':
-                    log_user_action(user.name, f"{user.name} is now IDLE. Waiting for buffer time.")
-                    await asyncio.sleep(Config.IDLE_BUFFER_TIME * 60)  # Attende il buffer time configurato
-                    updated_state = self.discord_status_to_user_state(str(self.guild.get_member(int(discord_id)).status))
-                    if updated_state == UserState.WORKING:
-                        log_user_action(user.name, f"{user.name} returned ONLINE within the buffer period.")
-                        return  # L'utente è tornato online, quindi non consideriamo il cambio a IDLE
-                    
-                # Handle the state transition
-                if new_state == UserState.OFFLINE:
-                    await self.handle_end_work(user)
-                elif new_state == UserState.WORKING and old_state == 'OFFLINE':
-                    await self.handle_start_work(user)
-                elif new_state in [UserState.SHORT_BREAK, UserState.LUNCH_BREAK] and old_state == 'WORKING':
-                    await self.handle_start_break(user, new_state)
-
-                # Update the state in the database
-                self.db_manager.update_user_state(user.id, new_state.name)
-                user.state = new_state  # Ensure the user state is updated
+                    if not self.idle_timers.pending(discord_id):
+                        log_user_action(user.name, f"{user.name} is now IDLE. Waiting for buffer time.")
+                        self.idle_timers.schedule(
+                            discord_id, Config.IDLE_BUFFER_TIME * 60, self.confirm_idle_transition, user
+                        )
+                        self.idle_deadlines[discord_id] = datetime.now() + timedelta(minutes=Config.IDLE_BUFFER_TIME)
+                        self.record_runtime_state(user)
+                    return
+
+                await self.apply_transition(user, old_state, new_state)
 
         log_user_action('System', f"State synchronization completed for user {user.name}")
 
+    async def confirm_idle_transition(self, user):
+        """Chiamata alla scadenza del buffer IDLE: conferma la pausa se l'utente è ancora idle."""
+        self.idle_deadlines.pop(str(user.discord_id), None)
+        member = self.guild.get_member(int(user.discord_id))
+        if not member or self.discord_status_to_user_state(str(member.status)) != UserState.SHORT_BREAK:
+            log_user_action(user.name, f"{user.name} returned ONLINE within the buffer period.")
+            self.record_runtime_state(user)
+            return
 
-    def check_leave_status(self, user, current_date):
-        leave_records = self.db_manager.get_user_leave_records(user.id)
-        for record in leave_records:
-            start_date = datetime.strptime(record["start_date"], "%Y-%m-%d").date()
-            end_date = datetime.strptime(record["end_date"], "%Y-%m-%d").date()
-            if start_date <= current_date <= end_date:
-                return (
-                    UserState.SICK
-                    if record["leave_type"] == "malattia"
-                    else UserState.ON_LEAVE
-                )
+        async with self.user_locks.acquire(str(user.discord_id)):
+            old_state = await self.db_manager.get_user_current_state(user.id)
+            if old_state != 'WORKING':
+                return
+            log_user_action(user.name, f"{user.name} still IDLE after buffer time.")
+            await self.apply_transition(user, old_state, UserState.SHORT_BREAK)
+
+    async def apply_transition(self, user, old_state, new_state):
+        # Handle the state transition
+        if new_state == UserState.OFFLINE:
+            await self.handle_end_work(user)
+        elif new_state == UserState.WORKING and old_state == 'OFFLINE':
+            await self.handle_start_work(user)
+        elif new_state in [UserState.SHORT_BREAK, UserState.LUNCH_BREAK] and old_state == 'WORKING':
+            await self.handle_start_break(user, new_state)
+
+        # Update the state in the database
+        await self.db_manager.update_user_state(user.id, new_state.name)
+        user.state = new_state  # Ensure the user state is updated
+        if new_state not in [UserState.SHORT_BREAK, UserState.LUNCH_BREAK]:
+            user.current_break_start = None
+        self.record_runtime_state(user)
+
+
+    async def check_leave_status(self, user, current_date):
+        leave_calendar = await self.db_manager.get_leave_calendar(current_date)
+        for record in leave_calendar.leaves_for(user.id):
+            return (
+                UserState.SICK
+                if record.leave_type == "malattia"
+                else UserState.ON_LEAVE
+            )
         return None
 
     def discord_status_to_user_state(self, status):
@@ -187,7 +346,7 @@ class WorkTracker(commands.Cog):
             return UserState.OFFLINE
 
     async def handle_start_work(self, user):
-        existing_work_log = self.db_manager.get_work_start_for_today(user.id)
+        existing_work_log = await self.db_manager.get_work_start_for_today(user.id)
         if existing_work_log:
             user.work_start = datetime.fromisoformat(existing_work_log["start_time"])
             log_user_action(
@@ -195,32 +354,34 @@ class WorkTracker(commands.Cog):
             )
         else:
             current_time = datetime.now()
-            self.db_manager.log_work_start(user.id, start_time=current_time)
+            await self.db_manager.log_work_start(user.id, start_time=current_time)
             user.work_start = current_time
             log_user_action(user.name, f"Started work at {current_time}")
 
     async def handle_start_break(self, user, break_type):
         # Controlla se esiste già una pausa attiva per l'utente
-        active_break = self.db_manager.get_active_break(user.id)
+        active_break = await self.db_manager.get_active_break(user.id)
         if active_break:
             log_user_action(
                 user.name,
                 f"Active break already in progress, no new break log created.",
             )
+            user.current_break_start = datetime.fromisoformat(active_break["start_time"])
             return
 
         # Se non esiste una pausa attiva, logga l'inizio della nuova pausa
         current_time = datetime.now()
-        self.db_manager.log_break_start(
+        await self.db_manager.log_break_start(
             user.id, break_type.name, start_time=current_time
         )
+        user.current_break_start = current_time
         log_user_action(user.name, f"Started {break_type.name} at {current_time}")
 
     async def handle_end_work(self, user):
         current_time = datetime.now()
         
         # Ottieni l'ultimo log di lavoro per oggi
-        work_log = self.db_manager.get_work_start_for_today(user.id)
+        work_log = await self.db_manager.get_work_start_for_today(user.id)
         
         if not work_log:
             log_user_action(user.name, "No active work log found for today. Cannot end work.")
@@ -231,27 +392,9 @@ class WorkTracker(commands.Cog):
         # Calcola le ore totali lavorate
         total_hours = (current_time - start_time).total_seconds() / 3600
         
-        # Ottieni tutte le pause della giornata
-        break_logs = self.db_manager.get_user_break_logs(user.id, start_time.date(), current_time.date())
-        
-        total_break_time = timedelta()
-        lunch_break_time = timedelta(hours=1)  # Pausa pranzo standard di 1 ora
-        extra_lunch_time = timedelta()
-
-        for break_log in break_logs:
-            break_start = datetime.fromisoformat(break_log['start_time'])
-            break_end = datetime.fromisoformat(break_log['end_time']) if break_log['end_time'] else current_time
-            break_duration = break_end - break_start
-            
-            # Classificazione delle pause
-            if break_log['type'] == 'ON_BREAK_LUNCH':
-                if break_duration > lunch_break_time:
-                    extra_lunch_time += break_duration - lunch_break_time
-            else:
-                total_break_time += break_duration
-
-        # Somma eventuale eccedenza della pausa pranzo al tempo totale delle pause
-        total_break_time += extra_lunch_time
+        # Pause della giornata sommate in SQL: pranzo conteggiato solo oltre la durata standard
+        break_totals = await self.db_manager.get_break_totals(user.id, start_time.date(), current_time.date(), now=current_time)
+        total_break_time = timedelta(hours=break_totals['break_hours'] + break_totals['lunch_excess_hours'])
 
         # Calcola le ore effettive
         effective_hours = total_hours - (total_break_time.total_seconds() / 3600)
@@ -261,12 +404,12 @@ class WorkTracker(commands.Cog):
         work_balance = effective_hours - standard_hours
         
         # Calcola il bilancio cumulativo
-        last_cumulative_balance = self.db_manager.get_last_cumulative_balance(user.id)
+        last_cumulative_balance = await self.db_manager.get_last_cumulative_balance(user.id)
         cumulative_balance = (last_cumulative_balance or 0.0) + work_balance
 
         # Aggiorna il log di lavoro con le ore totali, effettive, bilancio e bilancio cumulativo
-        self.db_manager.log_work_end(user.id, total_mobile_time=user.total_mobile_time, total_pc_time=user.total_pc_time)
-        self.db_manager.update_work_balance(user.id, work_log['id'], work_balance, cumulative_balance)
+        await self.db_manager.log_work_end(user.id, total_mobile_time=user.total_mobile_time, total_pc_time=user.total_pc_time)
+        await self.db_manager.update_work_balance(user.id, work_log['id'], work_balance, cumulative_balance)
         
         log_user_action(user.name, f"Ended work. Total hours: {total_hours:.2f}, Effective hours: {effective_hours:.2f}, Balance: {work_balance:.2f}, Cumulative Balance: {cumulative_balance:.2f}")
 
@@ -277,7 +420,8 @@ class WorkTracker(commands.Cog):
     async def status(self, ctx):
         user = self.users.get(str(ctx.author.id))
         if user:
-            await ctx.send(f"Your current status is: {user.state.name}")
+            state = user.state.name if self.tracking else await self.db_manager.get_user_current_state(user.id)
+            await ctx.send(f"Your current status is: {state}")
         else:
             await ctx.send("You are not registered in the work tracking system.")
 